@@ -0,0 +1,519 @@
+"""Asyncio serving mode for the game backend.
+
+Same endpoints as smth.py, but served by Quart on an ASGI server so an
+/interrogate call waiting on OpenRouter only holds a coroutine, not a worker
+thread. Game rules, prompts and sessions all come from smth.py.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import os
+import time
+
+from quart import Quart, request, jsonify, Response, g
+from quart_cors import cors
+
+from dispatcher import AsyncLLMDispatcher
+from model_router import AsyncModelRouter, LLM_MODELS
+from prefetch import PREFETCH_WAIT
+import metrics
+from metrics import span
+from http_cache import is_current, add_validators, compress, session_etag
+from recorder import recorder, records
+
+import smth
+from smth import (
+    ReplyPlan, whole_reply, admission, session_usage,
+    prepare_interrogation, record_interrogation, prepare_batch, dead_payload, BATCH_WORKERS, start_new_game, list_scenarios, advance_session_day,
+    judge_elimination, read_session_journal, sse_event, SSE_HEADERS,
+    session_store, response_cache, opener_prefetcher, journal_event, get_stream_cursor, JOURNAL_LONG_POLL_MAX, JOURNAL_KEEPALIVE,
+    local_responder, LLM_CONNECT_TIMEOUT, LLM_TIMEOUT, join_question, finish_question, shared_answer_events, batch_key
+)
+
+# Connection pool settings for the upstream LLM (timeouts are shared with smth)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+
+app = Quart(__name__)
+app = cors(app)  # Enable CORS for frontend
+
+# Built in the background once serving starts (see open_llm_client)
+async_client = None
+client_task = None
+# The prefetcher and clue extractor still call through smth's threaded dispatcher,
+# so both dispatchers draw on one rate bucket to stay under the provider's limit
+llm_dispatcher = AsyncLLMDispatcher(lambda: async_client, bucket=smth.llm_dispatcher.bucket)
+llm_dispatcher.recorder = recorder
+model_router = AsyncModelRouter(llm_dispatcher, LLM_MODELS or [smth.MODEL_NAME])
+# Report this app's dispatcher and router, not the unused threaded ones in smth
+metrics.registry.set_collector("llm", metrics.llm_stats_collector(response_cache, llm_dispatcher, model_router))
+
+
+def build_llm_client():
+    """Runs in a thread: importing openai and httpx would stall the event loop for a second"""
+    import httpx
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        base_url=smth.OPENROUTER_BASE_URL,
+        api_key=smth.api_key,
+        default_headers=smth.OPENROUTER_HEADERS,
+        max_retries=0,  # The dispatcher does the retrying
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        )
+    )
+
+
+async def start_llm_client():
+    global async_client
+    async_client = await asyncio.to_thread(build_llm_client)
+
+
+@app.before_serving
+async def open_llm_client():
+    # Not awaited, so requests that don't need the LLM are served meanwhile
+    global client_task
+    client_task = asyncio.get_running_loop().create_task(start_llm_client())
+
+
+async def llm_client_ready():
+    """Wait for the client if a question arrives before it is built"""
+    if async_client is None:
+        await asyncio.shield(client_task)
+
+
+async def corpus_ready():
+    """Load the local corpus in a thread if a question arrives before smth's warm-up has"""
+    if not local_responder.loaded:
+        await asyncio.to_thread(local_responder.load)
+
+
+@app.after_serving
+async def close_llm_client():
+    if async_client is not None:
+        await async_client.close()
+
+
+async def wait_for_opener(prepared):
+    """Awaiting twin of opener_prefetcher.wait; the prefetch pool itself stays threaded"""
+    if prepared is None:
+        return None
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(prepared)), PREFETCH_WAIT)
+    except Exception:
+        pass
+    return opener_prefetcher.resolve(prepared)
+
+
+async def upstream_complete(key, messages, charge):
+    """Async twin of smth.upstream_complete"""
+    if charge.model is None:
+        return await model_router.complete(key, messages, timeout=LLM_TIMEOUT)
+    response = await llm_dispatcher.complete(key, model=charge.model, messages=messages, timeout=LLM_TIMEOUT)
+    return response.choices[0].message.content or "", getattr(response, "usage", None), charge.model
+
+
+def upstream_stream(key, messages, charge):
+    if charge.model is None:
+        return model_router.stream(key, messages, timeout=LLM_TIMEOUT)
+    return llm_dispatcher.stream(key, model=charge.model, messages=messages, timeout=LLM_TIMEOUT)
+
+
+async def reply_without_upstream(plan):
+    """The tiers ahead of upstream (see smth.ReplyPlan), awaiting what the threaded app blocks on"""
+    await corpus_ready()
+    reply = plan.early()
+    if reply is None:
+        reply = plan.after_prefetch(await wait_for_opener(plan.prepared))
+    return reply
+
+
+async def generate_response_async(character, message, conversation_history, day, shared_context="", session_id=None, dispatch_key=None, charge=None,
+                                  scenario=None):
+    """Async twin of smth.generate_response"""
+    plan = ReplyPlan(character, message, conversation_history, day, shared_context, session_id, charge, scenario, llm_dispatcher)
+    reply = await reply_without_upstream(plan)
+    if reply is not None:
+        return reply
+
+    try:
+        await llm_client_ready()
+        plan.begin_upstream()
+        with span("upstream_total"):
+            raw_content, usage, model = await upstream_complete(dispatch_key or session_id, plan.messages, plan.charge)
+        return plan.finish(raw_content, usage)
+    except Exception as e:
+        return plan.failed(e)
+
+
+async def stream_response_async(character, message, conversation_history, day, shared_context="", session_id=None, charge=None,
+                                scenario=None):
+    """Async twin of smth.stream_response"""
+    plan = ReplyPlan(character, message, conversation_history, day, shared_context, session_id, charge, scenario, llm_dispatcher)
+    reply = await reply_without_upstream(plan)
+    if reply is not None:
+        for event in whole_reply(reply):
+            yield event
+        return
+
+    try:
+        plan.begin_upstream()
+        await llm_client_ready()
+        async for chunk in upstream_stream(session_id, plan.messages, plan.charge):
+            text = plan.streamed(chunk)
+            if text:
+                yield "token", text
+        plan.stream_done()
+    except Exception as e:
+        reply = plan.stream_failed(e)
+        if reply is not None:
+            for event in whole_reply(reply):
+                yield event
+            return
+
+    rest, reply = plan.stream_finish()
+    if rest:
+        yield "token", rest
+    yield "done", reply
+
+
+# Caps concurrent answers across all batches, like smth.batch_pool
+batch_slots = asyncio.Semaphore(BATCH_WORKERS)
+
+
+async def answer_in_batch_async(session, character, message, current_day):
+    """Async twin of smth.answer_in_batch"""
+    dead = dead_payload(character, current_day, session.scenario)
+    if dead:
+        return dead
+    async with batch_slots:
+        question, owner = join_question(session, character, message, current_day)
+        try:
+            if not owner:
+                return await asyncio.wrap_future(question)
+            history = session.get_character_history(character)
+            charge = admission.admit(session.usage, llm_dispatcher)
+            response_text, clue = await generate_response_async(
+                character, message, history, current_day, session.get_shared_context(),
+                session.session_id, dispatch_key=batch_key(session.session_id), charge=charge, scenario=session.scenario
+            )
+            payload = await asyncio.to_thread(record_interrogation, session, character, message, response_text, clue, current_day, charge)
+            finish_question(question, payload)
+            return payload
+        except Exception as e:
+            print(f"Error: {e}")
+            if owner:
+                finish_question(question, error=e)
+            return {"character": character, "error": str(e)}
+        finally:
+            if owner:
+                finish_question(question, error=RuntimeError("The question was not answered"))
+
+
+async def run_batch_async(ctx):
+    """Async twin of smth.run_batch"""
+    with llm_dispatcher.limits.allow(batch_key(ctx["session"].session_id), len(ctx["characters"])):
+        tasks = [
+            asyncio.ensure_future(answer_in_batch_async(ctx["session"], character, ctx["message"], ctx["day"]))
+            for character in ctx["characters"]
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def wait_for_journal(journal, cursor, timeout):
+    """Async twin of JournalLog.wait_for that parks a coroutine, not a thread"""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def wake(_cursor):
+        loop.call_soon_threadsafe(changed.set)
+
+    journal.subscribe(wake)
+    try:
+        entries, new_cursor = journal.since(cursor)
+        if not entries:
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            entries, new_cursor = journal.since(cursor)
+        return entries, new_cursor
+    finally:
+        journal.unsubscribe(wake)
+
+
+# =====================
+# API ENDPOINTS
+# =====================
+
+@app.before_request
+async def start_request_timer():
+    g.started = time.perf_counter()
+
+
+@app.after_request
+async def observe_request_time(response):
+    started = g.get("started")
+    if started is not None and request.url_rule is not None:
+        seconds = time.perf_counter() - started
+        metrics.request_seconds.observe(seconds, request.url_rule.rule, response.status_code)
+        # Handler time without the network, so bench/replay.py compares like with like
+        response.headers["Server-Timing"] = f"app;dur={seconds * 1000:.1f}"
+        if recorder and records(request):
+            payload = await response.get_json(silent=True) if request.path == "/game/new" else None
+            recorder.request(request, await request.get_json(silent=True), response, seconds, payload)
+    return response
+
+
+@app.route('/game/new', methods=['POST'])
+async def new_game():
+    """Create a new game session"""
+    scenario_id = ((await request.get_json(silent=True)) or {}).get("scenario")
+    payload = await asyncio.to_thread(start_new_game, scenario_id=scenario_id)
+    if isinstance(payload, tuple):
+        return jsonify(payload[0]), payload[1]
+    return jsonify(payload)
+
+
+@app.route('/scenarios', methods=['GET'])
+async def scenarios():
+    return jsonify(list_scenarios())
+
+
+@app.route('/interrogate', methods=['POST'])
+async def interrogate():
+    """Interrogate a character (see smth.interrogate for the streaming protocol)"""
+    data = await request.get_json()
+    stream = (data or {}).get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+
+    ctx = await asyncio.to_thread(prepare_interrogation, data)
+    if isinstance(ctx, tuple):
+        return jsonify(ctx[0]), ctx[1]
+
+    session, character, message, current_day = ctx["session"], ctx["character"], ctx["message"], ctx["day"]
+    if ctx["dead"]:
+        if stream:
+            return Response(sse_event("done", ctx["dead"]), mimetype='text/event-stream')
+        return jsonify(ctx["dead"])
+
+    history = session.get_character_history(character)
+    shared_context = session.get_shared_context()
+    charge = admission.admit(session.usage, llm_dispatcher)
+
+    if stream:
+        async def generate():
+            question, owner = join_question(session, character, message, current_day)
+            try:
+                if not owner:
+                    for event in shared_answer_events(await asyncio.wrap_future(question)):
+                        yield event
+                    return
+                replies = stream_response_async(
+                    character, message, history, current_day, shared_context, session.session_id, charge, session.scenario
+                )
+                async for kind, payload in replies:
+                    if kind == "token":
+                        yield sse_event("token", {"text": payload})
+                    else:
+                        response_text, clue = payload
+                        response_data = await asyncio.to_thread(
+                            record_interrogation, session, character, message, response_text, clue, current_day, charge
+                        )
+                        finish_question(question, response_data)
+                        if clue:
+                            yield sse_event("clue", {"clue": clue})
+                        yield sse_event("done", response_data)
+            except Exception as e:
+                print(f"Error: {e}")
+                if owner:
+                    finish_question(question, error=e)
+                yield sse_event("error", {"error": str(e)})
+            finally:
+                if owner:
+                    finish_question(question, error=RuntimeError("The reply was cut off"))
+
+        return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+    # A double-submitted question waits for the first one's answer (see smth.join_question)
+    question, owner = join_question(session, character, message, current_day)
+    try:
+        if not owner:
+            return jsonify(await asyncio.wrap_future(question))
+        response_text, clue = await generate_response_async(
+            character, message, history, current_day, shared_context, session.session_id, charge=charge, scenario=session.scenario
+        )
+        response_data = await asyncio.to_thread(
+            record_interrogation, session, character, message, response_text, clue, current_day, charge
+        )
+        finish_question(question, response_data)
+        return jsonify(response_data)
+    except Exception as e:
+        print(f"Error: {e}")
+        if owner:
+            finish_question(question, error=e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if owner:
+            finish_question(question, error=RuntimeError("The question was not answered"))
+
+
+@app.route('/game/<session_id>/interrogate-batch', methods=['POST'])
+async def interrogate_batch(session_id):
+    """Ask several characters the same question at once (see smth.interrogate_batch)"""
+    data = await request.get_json()
+    stream = (data or {}).get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+
+    ctx = await asyncio.to_thread(prepare_batch, session_id, data)
+    if isinstance(ctx, tuple):
+        return jsonify(ctx[0]), ctx[1]
+
+    if stream:
+        async def generate():
+            results = []
+            async for result in run_batch_async(ctx):
+                results.append(result)
+                yield sse_event("result", result)
+            yield sse_event("done", {"results": results})
+
+        return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+    by_character = {r["character"]: r async for r in run_batch_async(ctx)}
+    return jsonify({"results": [by_character[c] for c in ctx["characters"]]})
+
+
+async def session_read_response(payload, status, version, saved_at, cursor=0):
+    """Async twin of smth.session_read_response"""
+    response = jsonify(payload)
+    response.status_code = status
+    if status == 200 and version is not None:
+        add_validators(response, version, saved_at, cursor)
+        compress(response, await response.get_data(), request)
+    return response
+
+
+def not_modified(version, cursor=0):
+    response = Response("", status=304)
+    response.set_etag(session_etag(version, cursor), weak=True)
+    return response
+
+
+@app.route('/game/<session_id>/journal', methods=['GET'])
+async def get_session_journal(session_id):
+    """Journal entries for one session (see smth.get_session_journal for long-polling and ETags)"""
+    since = request.args.get('since', 0, type=int)
+    wait = request.args.get('wait', 0, type=float)
+    # The store may be Redis, so its calls go to a thread rather than block the loop
+    version, saved_at = await asyncio.to_thread(session_store.version, session_id)
+    if wait <= 0 and is_current(request, version, since):
+        return not_modified(version, since)
+    session = await asyncio.to_thread(session_store.get, session_id)
+    if wait <= 0 or session is None:
+        payload, status = await asyncio.to_thread(read_session_journal, session_id, since)
+        return await session_read_response(payload, status, version, saved_at, since)
+
+    await wait_for_journal(session.journal, since, min(wait, JOURNAL_LONG_POLL_MAX))
+    # Versioned after the wait, and before the entries so the ETag never names more than the body holds
+    version, saved_at = await asyncio.to_thread(session_store.version, session_id)
+    payload, status = await asyncio.to_thread(read_session_journal, session_id, since)
+    return await session_read_response(payload, status, version, saved_at, since)
+
+
+@app.route('/game/<session_id>/journal/stream', methods=['GET'])
+async def stream_session_journal(session_id):
+    """Push new journal entries as Server-Sent Events while the client is connected"""
+    session = await asyncio.to_thread(session_store.get, session_id)
+    if session is None:
+        return jsonify({"error": "Invalid session"}), 400
+
+    journal = session.journal
+    start = get_stream_cursor(request)
+
+    async def generate():
+        entries, cursor = journal.since(start)
+        yield journal_event(entries, cursor)
+        while True:
+            entries, cursor = await wait_for_journal(journal, cursor, JOURNAL_KEEPALIVE)
+            if entries:
+                yield journal_event(entries, cursor)
+            elif journal.closed:
+                return
+            else:
+                yield ": keepalive\n\n"
+
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.timeout = None  # Quart's default response timeout would cut the stream off
+    return response
+
+
+@app.route('/journal', methods=['GET'])
+async def get_journal():
+    """Old shared-journal endpoint, now needs ?session_id="""
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({"entries": []})
+    version, saved_at = await asyncio.to_thread(session_store.version, session_id)
+    if is_current(request, version):
+        return not_modified(version)
+    payload, status = await asyncio.to_thread(read_session_journal, session_id)
+    return await session_read_response(payload, status, version, saved_at)
+
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Hit/miss counters for the response cache"""
+    return jsonify(response_cache.stats())
+
+
+@app.route('/models/stats', methods=['GET'])
+async def get_model_stats():
+    """Latency and error averages the model router is choosing by"""
+    return jsonify({"models": model_router.snapshot(), "hedge_after": model_router.hedge_after})
+
+
+@app.route('/ready', methods=['GET'])
+async def get_ready():
+    """503 until the warm-up and this app's LLM client are done (see smth.get_ready)"""
+    is_ready = smth.ready.is_set() and async_client is not None
+    return jsonify({"ready": is_ready}), 200 if is_ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Stage timings, counters and LLM stats in Prometheus text format"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/game/<session_id>/usage', methods=['GET'])
+async def get_session_usage(session_id):
+    """Tokens and upstream seconds this game has used (see smth.get_session_usage)"""
+    payload, status = await asyncio.to_thread(session_usage, session_id)
+    return jsonify(payload), status
+
+
+@app.route('/game/<session_id>/advance-day', methods=['POST'])
+async def advance_day(session_id):
+    """Advance to the next day"""
+    payload, status = await asyncio.to_thread(advance_session_day, session_id)
+    return jsonify(payload), status
+
+
+@app.route('/game/<session_id>/eliminate', methods=['POST'])
+async def eliminate_suspect(session_id):
+    """Try to eliminate a suspect. ONE GUESS RULE."""
+    data = await request.get_json() or {}
+    payload, status = await asyncio.to_thread(judge_elimination, session_id, data.get('character'))
+    return jsonify(payload), status
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
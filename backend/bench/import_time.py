@@ -0,0 +1,67 @@
+"""Cold-start cost of the Flask app, checked against a budget.
+
+Each run starts a fresh interpreter, imports smth, serves /game/new and
+/journal through the test client and waits for the warm-up, then reports the
+median of each step. Exits non-zero when import plus the first /game/new
+exceeds --budget, so it can gate a deploy.
+
+    python bench/import_time.py --runs 5 --budget 0.5
+    LAZY_INIT=0 python bench/import_time.py   # the old eager start, for comparison
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+# Runs in the child interpreter; timings in seconds go to stderr, away from the app's prints
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import smth
+imported = time.perf_counter()
+client = smth.app.test_client()
+session_id = client.post("/game/new").get_json()["session_id"]
+new_game = time.perf_counter()
+client.get(f"/game/{session_id}/journal")
+journal = time.perf_counter()
+smth.ready.wait(60)
+ready = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "first /game/new": new_game - imported,
+    "first /journal": journal - new_game,
+    "ready": ready - started,
+}), file=sys.stderr)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds allowed for import + first /game/new")
+    args = parser.parse_args()
+
+    env = dict(os.environ, OPENROUTER_API_KEY=os.getenv("OPENROUTER_API_KEY", "bench"))
+    runs = []
+    for _ in range(args.runs):
+        child = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(child.stderr.strip().splitlines()[-1]))
+
+    medians = {step: statistics.median(run[step] for run in runs) for step in runs[0]}
+    for step, seconds in medians.items():
+        print(f"{step:>16}: {seconds * 1000:8.1f} ms")
+    cold_start = medians["import"] + medians["first /game/new"]
+    verdict = "ok" if cold_start <= args.budget else "OVER BUDGET"
+    print(f"{'cold start':>16}: {cold_start * 1000:8.1f} ms (budget {args.budget * 1000:.0f} ms) {verdict}")
+    sys.exit(0 if cold_start <= args.budget else 1)
+
+
+if __name__ == "__main__":
+    main()
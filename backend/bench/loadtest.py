@@ -0,0 +1,288 @@
+"""Load test and latency benchmark for the game server.
+
+Simulated players each run whole games against the server:
+/game/new -> several /interrogate per day -> /game/<id>/advance-day -> ...
+-> /game/<id>/eliminate, while journal pollers hit /game/<id>/journal the
+way open Sidebars do. At the end it prints throughput and p50/p95/p99
+latency per endpoint.
+
+Against a server you started yourself (pointed at bench/mock_openrouter.py):
+
+    python bench/loadtest.py --target http://127.0.0.1:5000 --players 50 --pollers 50
+
+Or let it start the mock and the server for you:
+
+    python bench/loadtest.py --spawn --players 50 --latency lognormal:0.8,0.5
+    python bench/loadtest.py --spawn --server-cmd "gunicorn -w 4 -k gthread -b 127.0.0.1:{port} smth:app"
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_openrouter import MockConfig, start_mock
+
+VILLAGERS = [
+    "Ishaan the Miller",
+    "Anya the Herbalist",
+    "Vikram the Hunter",
+    "Diya the Weaver",
+    "Amar the Elder"
+]
+
+QUESTIONS = [
+    "Where were you last night?",
+    "What did you see?",
+    "Did you know Kabir well?",
+    "Who do you suspect?",
+    "Why are your hands shaking?",
+    "What happened to Vikram?",
+    "Have you noticed anyone acting strange?"
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, label, seconds, ok=True):
+        with self.lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, elapsed):
+        rows = []
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            rows.append({
+                "endpoint": label,
+                "count": len(values),
+                "errors": self.errors.get(label, 0),
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1)
+            })
+        return rows
+
+
+class Client:
+    def __init__(self, target, results, timeout=60):
+        self.target = target.rstrip("/")
+        self.results = results
+        self.timeout = timeout
+
+    def call(self, label, method, path, body=None, headers=None):
+        """Make one request and record it; returns parsed JSON or None"""
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.target + path, data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                raw = response.read()
+            self.results.record(label, time.perf_counter() - started)
+            return json.loads(raw) if raw else None
+        except (urllib.error.URLError, OSError, ValueError):
+            self.results.record(label, time.perf_counter() - started, ok=False)
+            return None
+
+    def interrogate_stream(self, body):
+        """Streaming /interrogate; records time to first token and to the final event"""
+        request = urllib.request.Request(
+            self.target + "/interrogate",
+            data=json.dumps({**body, "stream": True}).encode(),
+            method="POST"
+        )
+        request.add_header("Content-Type", "application/json")
+        request.add_header("Accept", "text/event-stream")
+        started = time.perf_counter()
+        first = None
+        ok = False
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                for line in response:
+                    if first is None and line.startswith(b"event: "):
+                        first = time.perf_counter() - started
+                    if line.startswith(b"event: done"):
+                        ok = True
+        except (urllib.error.URLError, OSError):
+            pass
+        total = time.perf_counter() - started
+        self.results.record("interrogate (first token)", first if first is not None else total, ok)
+        self.results.record("interrogate (stream total)", total, ok)
+
+
+def play_games(client, args, deadline, active_sessions, stop):
+    """One simulated player: run whole games until the deadline"""
+    rng = random.Random()
+    while time.time() < deadline and not stop.is_set():
+        game = client.call("game/new", "POST", "/game/new")
+        if not game:
+            time.sleep(0.5)
+            continue
+        session_id = game["session_id"]
+        active_sessions.append(session_id)
+
+        for day in range(1, args.days + 1):
+            for _ in range(args.questions):
+                if time.time() >= deadline:
+                    break
+                body = {
+                    "session_id": session_id,
+                    "character": rng.choice(VILLAGERS),
+                    "message": rng.choice(QUESTIONS),
+                    "day": day
+                }
+                if args.stream:
+                    client.interrogate_stream(body)
+                else:
+                    client.call("interrogate", "POST", "/interrogate", body)
+                time.sleep(rng.uniform(0, args.think_time))
+            if day < args.days:
+                client.call("advance-day", "POST", f"/game/{session_id}/advance-day")
+
+        client.call("eliminate", "POST", f"/game/{session_id}/eliminate", {"character": rng.choice(VILLAGERS)})
+        active_sessions.remove(session_id)
+
+
+def poll_journal(client, args, active_sessions, stop):
+    """One open Sidebar: poll a live session's journal"""
+    cursor = 0
+    session_id = None
+    while not stop.is_set():
+        if session_id not in active_sessions:
+            if not active_sessions:
+                time.sleep(0.1)
+                continue
+            session_id = random.choice(list(active_sessions))
+            cursor = 0
+        if args.long_poll:
+            data = client.call("journal (long-poll)", "GET", f"/game/{session_id}/journal?since={cursor}&wait={args.long_poll}")
+        else:
+            data = client.call("journal", "GET", f"/game/{session_id}/journal?since={cursor}")
+            time.sleep(args.poll_interval)
+        if data and "cursor" in data:
+            cursor = data["cursor"]
+
+
+def wait_for_server(target, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(urllib.request.Request(target + "/game/new", data=b"", method="POST"), timeout=2)
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:5000")
+    parser.add_argument("--players", type=int, default=20, help="concurrent simulated players")
+    parser.add_argument("--pollers", type=int, default=20, help="concurrent journal pollers")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=4, help="interrogations per day")
+    parser.add_argument("--think-time", type=float, default=1.0, help="max seconds a player waits between questions")
+    parser.add_argument("--stream", action="store_true", help="use streaming /interrogate")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--long-poll", type=float, default=0, help="long-poll the journal with this wait instead")
+    parser.add_argument("--json", help="also write the summary to this file")
+
+    spawn = parser.add_argument_group("spawn a mock upstream and a server")
+    spawn.add_argument("--spawn", action="store_true")
+    spawn.add_argument("--port", type=int, default=5055)
+    spawn.add_argument("--mock-port", type=int, default=8900)
+    spawn.add_argument("--server-cmd", default=f"{shlex.quote(sys.executable)} -c \"import smth; smth.app.run(port={{port}}, threaded=True)\"",
+                       help="command to start the server, {port} is filled in")
+    spawn.add_argument("--latency", default="lognormal:0.8,0.5")
+    spawn.add_argument("--tokens-per-sec", type=float, default=40.0)
+    spawn.add_argument("--error-rate", type=float, default=0.0)
+    spawn.add_argument("--rate-limit", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = mock = None
+    target = args.target
+    if args.spawn:
+        mock_config = MockConfig(args.latency, args.tokens_per_sec, args.error_rate, args.rate_limit)
+        mock = start_mock(args.mock_port, mock_config)
+        target = f"http://127.0.0.1:{args.port}"
+        env = {**os.environ, "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.mock_port}", "OPENROUTER_API_KEY": "mock"}
+        server = subprocess.Popen(
+            shlex.split(args.server_cmd.format(port=args.port)), cwd=BACKEND_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if not wait_for_server(target):
+            server.terminate()
+            sys.exit("Server did not come up")
+
+    results = Results()
+    client = Client(target, results)
+    active_sessions = []
+    stop = threading.Event()
+    started = time.time()
+    deadline = started + args.duration
+
+    players = [threading.Thread(target=play_games, args=(client, args, deadline, active_sessions, stop), daemon=True)
+               for _ in range(args.players)]
+    pollers = [threading.Thread(target=poll_journal, args=(client, args, active_sessions, stop), daemon=True)
+               for _ in range(args.pollers)]
+    for thread in players + pollers:
+        thread.start()
+    try:
+        for thread in players:
+            thread.join(max(0.0, deadline - time.time()) + client.timeout)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    elapsed = time.time() - started
+
+    rows = results.summary(elapsed)
+    print(f"\n{args.players} players, {args.pollers} pollers, {elapsed:.1f}s against {target}\n")
+    print(f"{'endpoint':<28}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for row in rows:
+        print(f"{row['endpoint']:<28}{row['count']:>8}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    if mock:
+        print(f"\nmock upstream: {mock_config.counts}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed": elapsed, "target": target, "endpoints": rows}, f, indent=2)
+
+    if server:
+        server.terminate()
+        server.wait()
+    if mock:
+        mock.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Local stand-in for the OpenRouter chat-completions API.
+
+Answers POST .../chat/completions like the real thing (plain JSON or SSE
+streaming) with villager-style replies, ending in a |||JOURNAL: tail when
+the prompt asks for one, and with a JSON array of clues for clue-extraction
+calls, so the game server can be load-tested without spending real tokens.
+
+    python bench/mock_openrouter.py --port 8900 --latency lognormal:0.8,0.5 --tokens-per-sec 40 --rate-limit 0.02
+
+then start the game server with OPENROUTER_BASE_URL=http://127.0.0.1:8900
+
+With --trace (a RECORD_DIR trace, see recorder.py) it answers with the
+recorded completions instead, after the recorded time to first token and
+total time: by exact prompt first, then by the final user message when the
+prompt has changed since, else a random reply as usual.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLIES = [
+    ("I saw nothing, bhai. Only the wind in the trees.", "Saw nothing, only wind."),
+    ("Kabir walked past the mill at dusk. He did not blink.", "Kabir passed mill at dusk."),
+    ("The herbs will not help us now, ji. Pray.", "Herbs won't help now."),
+    ("I was home all night. The door was barred.", "Home all night, door barred."),
+    ("Something scratched at my window before dawn.", "Scratching at window before dawn."),
+    ("Why do you look at me like that, guard?", "Defensive when questioned."),
+]
+
+
+class LatencyModel:
+    """Seconds before the first token, parsed from e.g. fixed:0.5, uniform:0.2,2 or lognormal:0.8,0.5"""
+
+    def __init__(self, spec):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+
+    def sample(self):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(self.params[0], self.params[1])
+        if self.kind == "lognormal":
+            # params are the median and sigma of the underlying normal
+            median, sigma = self.params
+            return random.lognormvariate(math.log(median), sigma)
+        raise ValueError(f"Unknown latency distribution: {self.kind}")
+
+
+class TraceBook:
+    """Recorded completions from trace files, looked up by prompt.
+
+    A prompt asked several times gets its answers back in recorded order,
+    then starts over.
+    """
+
+    def __init__(self, paths):
+        self.by_key = {}
+        self.by_prompt = {}
+        self.lock = threading.Lock()
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line of a trace still being written
+                    if record.get("type") == "completion":
+                        self.by_key.setdefault(record["key"], []).append(record)
+                        self.by_prompt.setdefault(record["prompt"], []).append(record)
+        self.served = {}
+
+    def __len__(self):
+        return sum(len(records) for records in self.by_key.values())
+
+    def _next(self, table, key):
+        records = table.get(key)
+        if not records:
+            return None
+        with self.lock:
+            index = self.served.get((id(table), key), 0)
+            self.served[(id(table), key)] = index + 1
+        return records[index % len(records)]
+
+    def lookup(self, messages):
+        """(record, exact) for these messages, or (None, False)"""
+        # Same digest as recorder.completion_key (not imported: that module starts a recorder under RECORD_DIR)
+        key = hashlib.sha1(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+        record = self._next(self.by_key, key)
+        if record is not None:
+            return record, True
+        prompt = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+        return self._next(self.by_prompt, prompt), False
+
+
+class MockConfig:
+    def __init__(self, latency="fixed:0.3", tokens_per_sec=50.0, error_rate=0.0, rate_limit=0.0, trace=None):
+        self.latency = LatencyModel(latency)
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.trace = trace  # TraceBook, or None for made-up replies
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0, "clue_batches": 0,
+                       "trace_hits": 0, "trace_fallbacks": 0, "trace_misses": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output readable
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "Not found"}})
+                return
+
+            config.count("requests")
+            roll = random.random()
+            if roll < config.rate_limit:
+                config.count("rate_limited")
+                self.send_json(429, {"error": {"message": "Rate limit exceeded", "code": 429}}, {"Retry-After": "1"})
+                return
+            if roll < config.rate_limit + config.error_rate:
+                config.count("errors")
+                self.send_json(502, {"error": {"message": "Upstream provider error", "code": 502}})
+                return
+
+            messages = request.get("messages", [])
+            recorded = None
+            if config.trace is not None:
+                recorded, exact = config.trace.lookup(messages)
+                config.count("trace_misses" if recorded is None else "trace_hits" if exact else "trace_fallbacks")
+            if recorded is not None:
+                self.replay(request, recorded)
+                return
+
+            time.sleep(config.latency.sample())
+            prompt = str(messages[-1].get("content", "")) if messages else ""
+            if messages and "JSON array" in str(messages[0].get("content", "")):
+                # Clue extraction: one note per numbered reply
+                config.count("clue_batches")
+                replies = [line for line in prompt.splitlines() if line.split(".", 1)[0].isdigit()]
+                text = json.dumps([random.choice(REPLIES)[1] for _ in replies])
+            else:
+                speech, clue = random.choice(REPLIES)
+                text = f"{speech}\n|||JOURNAL: {clue}" if "|||JOURNAL" in prompt else speech
+            model = request.get("model", "mock")
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": prompt_tokens + len(text) // 4
+            }
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+            if request.get("stream"):
+                config.count("streamed")
+                self.stream_reply(completion_id, model, text, usage, 1 / config.tokens_per_sec)
+                return
+
+            # Non-streaming callers still wait for the whole reply to be "generated"
+            time.sleep(len(text.split()) / config.tokens_per_sec)
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        def replay(self, request, recorded):
+            """Answer with a recorded completion, as slowly as it was answered then"""
+            text = recorded["text"] or ""
+            model = request.get("model", "mock")
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+            usage = recorded.get("usage") or {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4}
+            usage = {**usage, "total_tokens": (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)}
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            time.sleep(recorded["first_token"])
+            generating = max(0.0, recorded["total"] - recorded["first_token"])
+
+            if request.get("stream"):
+                config.count("streamed")
+                self.stream_reply(completion_id, model, text, usage, generating / max(1, len(text.split(" "))))
+                return
+            time.sleep(generating)
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        def stream_reply(self, completion_id, model, text, usage, word_delay):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(payload):
+                data = f"data: {payload}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def chunk(delta, finish_reason=None, **extra):
+                return json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    **extra
+                })
+
+            send(chunk({"role": "assistant", "content": ""}))
+            for word in text.split(" "):
+                time.sleep(word_delay)
+                send(chunk({"content": word + " "}))
+            send(chunk({}, "stop", usage=usage))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_mock(port=8900, config=None):
+    """Start the mock in a background thread, return the server"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config or MockConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5",
+                        help="time to first token: fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 502")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--trace", nargs="+", help="answer with the completions recorded in these trace files")
+    args = parser.parse_args()
+
+    trace = TraceBook(args.trace) if args.trace else None
+    config = MockConfig(args.latency, args.tokens_per_sec, args.error_rate, args.rate_limit, trace)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(config))
+    print(f"Mock OpenRouter on http://127.0.0.1:{args.port}" + (f", {len(trace)} recorded completions" if trace else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{config.counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Replay a recorded trace against a server, for capacity planning.
+
+Record real traffic by starting the server with RECORD_DIR set (see
+recorder.py), then re-drive it: every request is sent at its recorded
+offset divided by --speed, so --speed 3 is the same players arriving three
+times as fast. Sessions get new ids from the replayed /game/new, and the
+recorded ids are swapped for them in paths, queries and bodies.
+
+    python bench/replay.py traces/trace-*.jsonl --target http://127.0.0.1:5000
+
+With --spawn it starts bench/mock_openrouter.py answering with the
+trace's recorded completions (and their recorded timing) and a server
+pointed at it, so the only thing that changed since the recording is the
+server:
+
+    python bench/replay.py traces/trace-*.jsonl --spawn --speed 2
+
+At the end it prints, per endpoint, recorded against replayed p50/p95 and
+their ratio (the drift), errors, and replies whose status differs from the
+recording. Both sides are the server's own handler time (its Server-Timing
+header), so the drift is the server's and not the network's; a streamed
+reply is timed to its headers.
+"""
+import argparse
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import BACKEND_DIR, percentile, wait_for_server
+from mock_openrouter import MockConfig, TraceBook, start_mock
+
+GAME_PATH = re.compile(r"^/game/([^/]+)/")
+SERVER_TIMING = re.compile(r"\bapp;dur=([0-9.]+)")
+
+
+def load_requests(paths):
+    """Recorded requests from all trace files, oldest first"""
+    requests = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "request":
+                    requests.append(record)
+    requests.sort(key=lambda r: r["t"])
+    return requests
+
+
+def session_of(record):
+    """The recorded session id a request belongs to, if any"""
+    if record["path"] == "/game/new":
+        return (record.get("response") or {}).get("session_id")
+    match = GAME_PATH.match(record["path"])
+    if match:
+        return match.group(1)
+    return record["query"].get("session_id") or (record.get("body") or {}).get("session_id")
+
+
+def endpoint_of(record, session_id):
+    path = record["path"].replace(session_id, "<id>") if session_id else record["path"]
+    return f"{record['method']} {path}"
+
+
+def wait_until_ready(target, timeout=60):
+    """Wait out the server's warm-up, or the first replayed requests pay for it (the recording didn't)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(target + "/ready", timeout=2)
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+class Replay:
+    def __init__(self, target, requests, speed, workers, timeout=60):
+        self.target = target.rstrip("/")
+        self.requests = requests
+        self.speed = speed
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        self.new_ids = {}  # recorded session id -> replayed one, once its /game/new is back
+        self.created = {}  # recorded session id -> Event set when that is known
+        # Sessions begun before recording started are replayed as they are (and mostly 404)
+        self.new_in_trace = {session_of(r) for r in requests if r["path"] == "/game/new"}
+        self.rows = {}
+        self.lag = []
+
+    def created_event(self, session_id):
+        with self.lock:
+            return self.created.setdefault(session_id, threading.Event())
+
+    def substitute(self, record, session_id):
+        """The record with its recorded session id swapped for the replayed one"""
+        new_id = self.new_ids.get(session_id)
+        if not session_id or not new_id:
+            return record["path"], record["query"], record.get("body")
+        swap = lambda value: value.replace(session_id, new_id) if isinstance(value, str) else value
+        body = record.get("body")
+        if isinstance(body, dict):
+            body = {key: swap(value) for key, value in body.items()}
+        return swap(record["path"]), {key: swap(value) for key, value in record["query"].items()}, body
+
+    def send(self, record, session_id, due):
+        if session_id in self.new_in_trace and record["path"] != "/game/new":
+            # Nothing can be asked of a session before it exists
+            if not self.created_event(session_id).wait(self.timeout):
+                self.observe(record, session_id, None, None, error=True)
+                return
+        lag = max(0.0, time.perf_counter() - due)
+
+        path, query, body = self.substitute(record, session_id)
+        url = self.target + path + ("?" + urllib.parse.urlencode(query) if query else "")
+        data = json.dumps(body).encode() if body is not None else (b"" if record["method"] == "POST" else None)
+        request = urllib.request.Request(url, data=data, method=record["method"])
+        request.add_header("Content-Type", "application/json")
+        for name, value in record.get("headers", {}).items():
+            request.add_header(name, value)
+
+        started = time.perf_counter()
+        status = None
+        timing = ""
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                timing = response.headers.get("Server-Timing", "")
+                raw = response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            timing = e.headers.get("Server-Timing", "")
+            raw = b""
+        except OSError:
+            raw = b""
+        match = SERVER_TIMING.search(timing)
+        # Without the header (an older server) the round trip is the best there is
+        seconds = float(match.group(1)) / 1000 if match else time.perf_counter() - started
+
+        if record["path"] == "/game/new" and session_id:
+            try:
+                self.new_ids[session_id] = json.loads(raw)["session_id"]
+            except (ValueError, KeyError, TypeError):
+                pass
+            self.created_event(session_id).set()
+        self.observe(record, session_id, status, seconds, lag=lag)
+
+    def observe(self, record, session_id, status, seconds, lag=0.0, error=False):
+        label = endpoint_of(record, session_id)
+        with self.lock:
+            row = self.rows.setdefault(label, {"recorded": [], "replayed": [], "errors": 0, "mismatched": 0})
+            row["recorded"].append(record["seconds"])
+            if seconds is not None:
+                row["replayed"].append(seconds)
+            if error or status is None or status >= 500:
+                row["errors"] += 1
+            elif status != record["status"]:
+                row["mismatched"] += 1
+            self.lag.append(lag)
+
+    def run(self):
+        t0 = self.requests[0]["t"]
+        start = time.perf_counter()
+        futures = []
+        for record in self.requests:
+            due = start + (record["t"] - t0) / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(self.pool.submit(self.send, record, session_of(record), due))
+        for future in futures:
+            future.result()
+        self.pool.shutdown()
+        return time.perf_counter() - start
+
+    def summary(self):
+        rows = []
+        for label, row in sorted(self.rows.items()):
+            recorded, replayed = sorted(row["recorded"]), sorted(row["replayed"])
+            rec50, rec95 = percentile(recorded, 50), percentile(recorded, 95)
+            rep50, rep95 = percentile(replayed, 50), percentile(replayed, 95)
+            rows.append({
+                "endpoint": label,
+                "count": len(recorded),
+                "errors": row["errors"],
+                "error_rate": round(row["errors"] / len(recorded), 4),
+                "status_mismatches": row["mismatched"],
+                "recorded_p50_ms": round(rec50 * 1000, 1),
+                "replayed_p50_ms": round(rep50 * 1000, 1),
+                "recorded_p95_ms": round(rec95 * 1000, 1),
+                "replayed_p95_ms": round(rep95 * 1000, 1),
+                "drift_p50": round(rep50 / rec50, 2) if rec50 else None,
+                "drift_p95": round(rep95 / rec95, 2) if rec95 else None
+            })
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", nargs="+", help="trace files written under RECORD_DIR")
+    parser.add_argument("--target", default="http://127.0.0.1:5000")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay this many times faster than recorded")
+    parser.add_argument("--workers", type=int, default=64, help="most requests in flight at once")
+    parser.add_argument("--json", help="also write the summary to this file")
+
+    spawn = parser.add_argument_group("spawn a trace-backed mock upstream and a server")
+    spawn.add_argument("--spawn", action="store_true")
+    spawn.add_argument("--port", type=int, default=5055)
+    spawn.add_argument("--mock-port", type=int, default=8900)
+    spawn.add_argument("--server-cmd", default=f"{shlex.quote(sys.executable)} -c \"import smth; smth.app.run(port={{port}}, threaded=True)\"",
+                       help="command to start the server, {port} is filled in")
+    spawn.add_argument("--latency", default="lognormal:0.8,0.5", help="mock latency for prompts not in the trace")
+    args = parser.parse_args()
+
+    requests = load_requests(args.trace)
+    if not requests:
+        sys.exit("No requests in the trace")
+
+    server = mock = None
+    target = args.target
+    if args.spawn:
+        mock_config = MockConfig(args.latency, trace=TraceBook(args.trace))
+        mock = start_mock(args.mock_port, mock_config)
+        target = f"http://127.0.0.1:{args.port}"
+        env = {**os.environ, "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.mock_port}", "OPENROUTER_API_KEY": "mock"}
+        env.pop("RECORD_DIR", None)  # Don't record the replay over the recording
+        server = subprocess.Popen(
+            shlex.split(args.server_cmd.format(port=args.port)), cwd=BACKEND_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if not wait_for_server(target) or not wait_until_ready(target):
+            server.terminate()
+            sys.exit("Server did not come up")
+
+    replay = Replay(target, requests, args.speed, args.workers)
+    try:
+        elapsed = replay.run()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if mock:
+            mock.shutdown()
+
+    rows = replay.summary()
+    recorded_span = requests[-1]["t"] - requests[0]["t"]
+    lag = sorted(replay.lag)
+    print(f"\n{len(requests)} requests recorded over {recorded_span:.1f}s, replayed at {args.speed}x in {elapsed:.1f}s "
+          f"against {target} (send lag p95 {percentile(lag, 95) * 1000:.0f} ms)\n")
+    print(f"{'endpoint':<36}{'count':>7}{'errors':>8}{'status≠':>9}{'rec p50':>9}{'p50':>8}{'rec p95':>9}{'p95':>8}"
+          f"{'drift50':>9}{'drift95':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:<36}{row['count']:>7}{row['errors']:>8}{row['status_mismatches']:>9}"
+              f"{row['recorded_p50_ms']:>9}{row['replayed_p50_ms']:>8}{row['recorded_p95_ms']:>9}{row['replayed_p95_ms']:>8}"
+              f"{str(row['drift_p50']):>9}{str(row['drift_p95']):>9}")
+    if mock:
+        print(f"\nmock upstream: {mock_config.counts}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed": elapsed, "speed": args.speed, "target": target, "endpoints": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Memory cost of idle sessions in the in-process store.
+
+Fills the memory store with sessions that look like a player a few
+questions into day 1, then reports the bytes each one holds.
+
+    python bench/session_memory.py --sessions 20000 --characters 3 --questions 3
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--characters", type=int, default=3, help="characters talked to per session")
+    parser.add_argument("--questions", type=int, default=3, help="questions per character")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SESSION_MAX", str(args.sessions * 2))
+    import smth
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(args.sessions):
+        session = smth.GameSession(f"bench-{i:08d}")
+        session.add_shared_event("Kabir the villager has gone missing")
+        session.add_shared_event("The village is frightened, rumors of a Rakshasa demon")
+        session.get_shared_context()
+        for character in smth.CHARACTERS[:args.characters]:
+            for q in range(args.questions):
+                # Fresh strings each time, like text arriving in requests
+                session.add_message(character, f"Where were you last night? ({q})", f"I was home all night, guard. ({i})")
+        session.journal.append(f"[Day 1] {smth.CHARACTERS[0]}: Saw nothing, only wind.")
+        smth.session_store.save(session)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{args.sessions} sessions: {total / 2**20:.1f} MiB, {total / args.sessions:.0f} bytes per session")
+
+
+if __name__ == "__main__":
+    main()
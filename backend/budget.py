@@ -0,0 +1,180 @@
+"""Token accounting per session, budgets, and admission tiers.
+
+Every upstream reply is charged to its session and to the character/day it
+was for (tokens from the provider's usage, estimated when it sends none, and
+seconds spent waiting on it). Before a question goes upstream, the admission
+controller looks at how much pressure there is and picks a tier:
+
+  full    the normal prompt and model
+  lean    history window cut to LEAN_HISTORY_BUDGET tokens
+  cheap   lean, and CHEAP_MODEL instead of the router's models (lean if unset)
+  canned  no LLM call: local corpus answer or the pre-written line
+
+Pressure is the highest of: the session's spend over SESSION_TOKEN_BUDGET,
+all sessions' spend in the last minute over GLOBAL_TOKENS_PER_MIN, and the
+dispatcher queue over ADMISSION_QUEUE. ADMISSION_TIERS are the pressures at
+which lean, cheap and canned start, so one client burning through its budget
+gets shorter prompts, then a cheaper model, then canned replies, while
+everyone else keeps the full tier. Cached replies and prepared openers cost
+nothing and are served whatever the tier.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from history import HISTORY_TOKEN_BUDGET, estimate_tokens
+from metrics import Stats
+
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))  # Per game; 0 means no cap
+GLOBAL_TOKENS_PER_MIN = int(os.getenv("GLOBAL_TOKENS_PER_MIN", "0"))  # All games together; 0 means no cap
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "32"))  # Callers waiting on the dispatcher that count as full
+ADMISSION_TIERS = [float(p) for p in os.getenv("ADMISSION_TIERS", "0.6,0.8,1.0").split(",")]
+LEAN_HISTORY_BUDGET = int(os.getenv("LEAN_HISTORY_BUDGET", "200"))
+CHEAP_MODEL = os.getenv("CHEAP_MODEL")
+
+TIERS = ("full", "lean", "cheap", "canned")
+WINDOW_SECONDS = 60
+
+
+def usage_tokens(usage):
+    """(prompt, completion) tokens from an OpenAI-style usage object or dict, None where missing"""
+    if usage is None:
+        return None, None
+    get = usage.get if isinstance(usage, dict) else lambda kind: getattr(usage, kind, None)
+    return get("prompt_tokens"), get("completion_tokens")
+
+
+def usage_total(usage):
+    """All tokens in a usage, 0 if the provider didn't say"""
+    return sum(tokens or 0 for tokens in usage_tokens(usage))
+
+
+class Charge:
+    """What one question was allowed (tier) and what it cost"""
+    __slots__ = ("tier", "history_budget", "model", "prompt_tokens", "completion_tokens", "calls", "seconds")
+
+    def __init__(self, tier="full", history_budget=HISTORY_TOKEN_BUDGET, model=None):
+        self.tier = tier
+        self.history_budget = history_budget
+        self.model = model  # Set for the cheap tier
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    def add(self, usage, seconds, messages=(), reply=""):
+        """Charge one upstream call; without usage the prompt and reply are estimated"""
+        prompt, completion = usage_tokens(usage)
+        if prompt is None:
+            prompt = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        if completion is None:
+            completion = estimate_tokens(reply or "")
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.calls += 1
+        self.seconds += seconds
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+class UsageLedger:
+    """A session's spend so far, in total and per (character, day)"""
+    __slots__ = ("by_character", "tokens", "calls", "seconds")
+
+    def __init__(self):
+        self.by_character = {}  # (character, day) -> [prompt, completion, calls, seconds]
+        self.tokens = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    def add(self, character, day, prompt, completion, calls, seconds):
+        row = self.by_character.get((character, day))
+        if row is None:
+            row = self.by_character[(character, day)] = [0, 0, 0, 0.0]
+        row[0] += prompt
+        row[1] += completion
+        row[2] += calls
+        row[3] += seconds
+        self.tokens += prompt + completion
+        self.calls += calls
+        self.seconds += seconds
+
+    def to_list(self):
+        return [[c, d, p, co, n, round(s, 3)] for (c, d), (p, co, n, s) in self.by_character.items()]
+
+    @classmethod
+    def from_list(cls, rows):
+        ledger = cls()
+        for character, day, prompt, completion, calls, seconds in rows:
+            ledger.add(character, day, prompt, completion, calls, seconds)
+        return ledger
+
+    def snapshot(self):
+        return {
+            "tokens": self.tokens,
+            "calls": self.calls,
+            "seconds": round(self.seconds, 3),
+            "characters": [
+                {"character": c, "day": d, "prompt_tokens": p, "completion_tokens": co, "calls": n, "seconds": round(s, 3)}
+                for (c, d), (p, co, n, s) in sorted(self.by_character.items(), key=lambda item: (item[0][1], item[0][0]))
+            ]
+        }
+
+
+class Admission:
+    """Picks each question's tier and keeps the global per-minute spend"""
+
+    def __init__(self, session_budget=SESSION_TOKEN_BUDGET, global_per_min=GLOBAL_TOKENS_PER_MIN,
+                 queue_limit=ADMISSION_QUEUE, thresholds=ADMISSION_TIERS):
+        self.session_budget = session_budget
+        self.global_per_min = global_per_min
+        self.queue_limit = queue_limit
+        self.thresholds = thresholds
+        self.window = deque()  # [second, tokens], oldest first
+        self.lock = threading.Lock()
+        self.stats = Stats(*TIERS)
+
+    def spent(self, tokens):
+        """Count tokens against the global per-minute budget"""
+        if not tokens:
+            return
+        now = int(time.monotonic())
+        with self.lock:
+            if self.window and self.window[-1][0] == now:
+                self.window[-1][1] += tokens
+            else:
+                self.window.append([now, tokens])
+
+    def recent_tokens(self):
+        cutoff = int(time.monotonic()) - WINDOW_SECONDS
+        with self.lock:
+            while self.window and self.window[0][0] <= cutoff:
+                self.window.popleft()
+            return sum(tokens for _, tokens in self.window)
+
+    def pressure(self, ledger, dispatcher):
+        """0 when idle, 1 when some limit is reached"""
+        pressure = dispatcher.waiting / self.queue_limit if self.queue_limit else 0.0
+        if self.session_budget:
+            pressure = max(pressure, ledger.tokens / self.session_budget)
+        if self.global_per_min:
+            pressure = max(pressure, self.recent_tokens() / self.global_per_min)
+        return pressure
+
+    def idle(self, ledger, dispatcher):
+        """Would a question get the full tier? Speculative calls (opener prefetch) only go then"""
+        return self.pressure(ledger, dispatcher) < self.thresholds[0]
+
+    def admit(self, ledger, dispatcher):
+        """The Charge a question from this session goes upstream with"""
+        pressure = self.pressure(ledger, dispatcher)
+        tier = TIERS[sum(1 for threshold in self.thresholds if pressure >= threshold)]
+        if tier == "cheap" and not CHEAP_MODEL:
+            tier = "lean"
+        self.stats.inc(tier)
+        if tier == "full":
+            return Charge()
+        return Charge(tier, LEAN_HISTORY_BUDGET, CHEAP_MODEL if tier == "cheap" else None)
@@ -0,0 +1,160 @@
+"""Journal clues, worked out after the reply has gone to the player.
+
+Asking the model to end every reply with "|||JOURNAL: <summary>" makes the
+player wait for tokens they never see, and the split sometimes drops the clue
+or leaks it into the speech. Instead the reply is only speech, and
+record_interrogation hands it to this queue; a background thread works out
+the clue and it reaches the player through the session journal a moment
+after the reply.
+
+CLUE_EXTRACTION picks how:
+  local   extractive summary of the reply itself, no upstream call (default
+          unless CLUE_MODEL is set)
+  llm     ask CLUE_MODEL for the clues of up to CLUE_BATCH_MAX pending replies
+          in one call per CLUE_BATCH_WAIT seconds, with the local summarizer
+          for any the call fails on (default when CLUE_MODEL is set)
+  inline  the old way: the reply model writes the |||JOURNAL: tail
+
+The llm mode spends upstream quota on every answered question, so it is
+only the default once a separate, cheaper CLUE_MODEL has been chosen.
+
+Replies repeat (response cache, local corpus), so recent clues are kept by
+reply text and reused without another call.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from local_responder import tokenize
+from metrics import Stats
+
+CLUE_MODEL = os.getenv("CLUE_MODEL")  # A cheaper model than the reply model is the point
+CLUE_EXTRACTION = os.getenv("CLUE_EXTRACTION", "llm" if CLUE_MODEL else "local")
+CLUE_BATCH_MAX = int(os.getenv("CLUE_BATCH_MAX", "8"))
+CLUE_BATCH_WAIT = float(os.getenv("CLUE_BATCH_WAIT", "0.25"))  # Seconds to gather a batch after the first reply
+CLUE_WORDS = 5
+CLUE_MEMO_MAX = 2048  # Replies whose clue we remember
+CLUE_MIN_SCORE = 2  # Below this a reply is small talk ("I do not know!") with nothing to note
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def summarize(reply, max_words=CLUE_WORDS):
+    """Extractive clue: the most informative max_words-long run of words in one of
+    the reply's statements (questions back at the guard say nothing), or None"""
+    best, best_score = None, CLUE_MIN_SCORE - 1
+    for sentence in SENTENCE_END.split(reply):
+        sentence = sentence.strip()
+        if not sentence or sentence.endswith("?"):
+            continue
+        words = sentence.split()
+        for start in range(max(1, len(words) - max_words + 1)):
+            window = words[start:start + max_words]
+            # Names count double: "Kabir", "the Miller" are what a journal is for
+            score = len(tokenize(" ".join(window))) + sum(
+                1 for i, w in enumerate(window) if w[:1].isupper() and (i or start)
+            )
+            if score > best_score:
+                best, best_score = window, score
+    if best is None:
+        return None
+    clue = " ".join(best).strip(" .,;:!-\"'")
+    return clue[:1].upper() + clue[1:] + "." if clue else None
+
+
+class ClueJob:
+    __slots__ = ("session_id", "character", "day", "reply")
+
+    def __init__(self, session_id, character, day, reply):
+        self.session_id = session_id
+        self.character = character
+        self.day = day
+        self.reply = reply
+
+
+class ClueExtractor:
+    """Background queue from replies to journal clues.
+
+    extract_batch(jobs) returns one clue (or None) per job from the LLM and
+    may raise; deliver(job, clue) writes a clue to the session.
+    """
+
+    def __init__(self, extract_batch, deliver, mode=CLUE_EXTRACTION):
+        self.extract_batch = extract_batch
+        self.deliver = deliver
+        self.mode = mode
+        self.queue = queue.SimpleQueue()
+        self.memo = OrderedDict()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.stats = Stats("queued", "batches", "llm", "local", "reused", "failed_batches")
+
+    def inline(self):
+        return self.mode == "inline"
+
+    def submit(self, session_id, character, day, reply):
+        """Queue a reply for its clue; the thread starts on first use"""
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="clues", daemon=True)
+                    self.thread.start()
+        self.stats.inc("queued")
+        self.queue.put(ClueJob(session_id, character, day, reply))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + CLUE_BATCH_WAIT
+            while len(batch) < CLUE_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"Clue Extraction Error: {e}")
+
+    def _process(self, batch):
+        clues = {}
+        todo = []
+        for job in batch:
+            if job.reply in self.memo:
+                clues[job] = self.memo[job.reply]
+                self.stats.inc("reused")
+            else:
+                todo.append(job)
+
+        if todo and self.mode == "llm":
+            self.stats.inc("batches")
+            try:
+                for job, clue in zip(todo, self.extract_batch(todo)):
+                    if clue:
+                        clues[job] = clue
+                        self.stats.inc("llm")
+            except Exception as e:
+                print(f"Clue Extraction: batch of {len(todo)} failed ({e}), summarizing locally")
+                self.stats.inc("failed_batches")
+
+        for job in todo:
+            if job not in clues:
+                clues[job] = summarize(job.reply)
+                self.stats.inc("local")
+            self._remember(job.reply, clues[job])
+
+        for job in batch:
+            if clues[job]:
+                self.deliver(job, clues[job])
+
+    def _remember(self, reply, clue):
+        self.memo[reply] = clue
+        self.memo.move_to_end(reply)
+        while len(self.memo) > CLUE_MEMO_MAX:
+            self.memo.popitem(last=False)
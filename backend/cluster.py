@@ -0,0 +1,531 @@
+"""Multi-process serving with sessions pinned to workers.
+
+Sessions live in each process's memory, so plain pre-forking sends a
+player's next request to a worker that has never heard of them. This runs a
+small front dispatcher on --port and N copies of the Flask app on localhost
+ports behind it. Every session_id (from the URL, the JSON body or
+?session_id=) is placed on a consistent-hash ring of workers, so a player
+always reaches the process holding their session. /game/new gets its id from
+the front, so it's created on the right worker.
+
+When a worker joins or leaves (POST /cluster/workers, DELETE
+/cluster/workers/<n>, or a crash and restart) only the sessions whose owner
+changed are moved: the front waits for their in-flight requests to finish,
+holds new ones, copies them from the old worker into the new one, and only
+once every new owner has taken its copies drops them from the old workers.
+If a copy fails the move is rolled back and the old owners keep serving.
+A new game the move would place elsewhere waits for it to end, so it is
+created on its final owner either way.
+Journal polls for moved sessions go to the new owner from then on. A crashed worker's sessions
+are lost unless EVENT_LOG_DIR is set (each worker then logs to its own
+subdirectory and recovers on restart).
+
+    python cluster.py --workers 4 --port 5000
+
+/cluster and its admin routes answer only localhost, or callers sending
+CLUSTER_ADMIN_TOKEN as a Bearer token. Workers are served by waitress
+(CLUSTER_WORKER_THREADS threads each) if it is installed, else by Flask's
+development server.
+"""
+import argparse
+import bisect
+import hashlib
+import http.client
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "64"))  # Ring points per worker; more spreads sessions evenly
+CLUSTER_DRAIN_TIMEOUT = float(os.getenv("CLUSTER_DRAIN_TIMEOUT", "30"))  # Wait for in-flight requests before a move
+CLUSTER_UPSTREAM_TIMEOUT = float(os.getenv("CLUSTER_UPSTREAM_TIMEOUT", "120"))
+CLUSTER_HEALTH_INTERVAL = float(os.getenv("CLUSTER_HEALTH_INTERVAL", "2"))
+CLUSTER_ADMIN_TOKEN = os.getenv("CLUSTER_ADMIN_TOKEN")
+# Streamed interrogations each hold a thread while they last, so well above waitress's default of 4
+CLUSTER_WORKER_THREADS = int(os.getenv("CLUSTER_WORKER_THREADS", "64"))
+
+SESSION_PATH = re.compile(r"^/game/([^/]+)/")
+# Not passed on between client, front and worker
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "upgrade", "proxy-connection", "x-session-id"}
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing: adding or removing a worker only moves the keys it gains or loses"""
+
+    def __init__(self, nodes=(), vnodes=CLUSTER_VNODES):
+        self.vnodes = vnodes
+        self.nodes = set()
+        self.points = []  # Sorted (hash, node)
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            bisect.insort(self.points, (ring_hash(f"{node}#{i}"), node))
+
+    def remove(self, node):
+        self.nodes.discard(node)
+        self.points = [p for p in self.points if p[1] != node]
+
+    def owner(self, key):
+        if not self.points:
+            return None
+        i = bisect.bisect(self.points, (ring_hash(key),))
+        return self.points[i % len(self.points)][1]
+
+    def with_nodes(self, nodes):
+        return HashRing(nodes, self.vnodes)
+
+
+class WorkerError(Exception):
+    """A worker answered an internal call with an error status"""
+
+
+class Worker:
+    def __init__(self, worker_id, port):
+        self.worker_id = worker_id
+        self.port = port
+        self.process = None
+
+    def start(self):
+        env = dict(os.environ, CLUSTER_WORKER="1")
+        if os.getenv("EVENT_LOG_DIR"):
+            env["EVENT_LOG_DIR"] = str(Path(os.environ["EVENT_LOG_DIR"]) / f"worker-{self.worker_id}")
+        self.process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "worker", "--port", str(self.port)],
+            cwd=Path(__file__).resolve().parent, env=env
+        )
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def wait_until_listening(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.alive():
+            try:
+                self.call("GET", "/ready", check=False)
+                return True
+            except OSError:
+                time.sleep(0.1)
+        return False
+
+    def call(self, method, path, payload=None, timeout=30, check=True):
+        """JSON request to the worker's internal API; raises WorkerError on a 4xx/5xx if check"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=timeout)
+        try:
+            body = json.dumps(payload).encode() if payload is not None else None
+            conn.request(method, path, body, {"Content-Type": "application/json"} if body else {})
+            response = conn.getresponse()
+            data = response.read()
+            if check and response.status >= 400:
+                raise WorkerError(f"worker {self.worker_id}: {method} {path} answered {response.status}")
+            return json.loads(data) if data else None
+        finally:
+            conn.close()
+
+    def stop(self):
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class Front:
+    def __init__(self, workers, base_port):
+        self.base_port = base_port
+        self.workers = {}  # worker_id -> Worker; replaced, never changed in place, so readers need no lock
+        self.ring = HashRing()
+        self.next_ring = None  # The ring a rebalance in progress is moving to
+        self.lock = threading.Condition()
+        self.rebalance_lock = threading.Lock()
+        self.active = Counter()  # In-flight writes per session
+        self.moving = set()
+        self.creating = set()  # New games on their way to a worker
+        self.round_robin = 0
+        self.stats = {"requests": 0, "moved_sessions": 0, "rebalances": 0, "restarts": 0}
+        for _ in range(workers):
+            self.add_worker()
+
+    # ---- routing ----
+
+    def owner_for(self, session_id):
+        return self.workers.get(self.ring.owner(session_id))
+
+    def will_move(self, session_id):
+        """Would the rebalance in progress give this session a new owner? Callers hold self.lock"""
+        return self.next_ring is not None and self.next_ring.owner(session_id) != self.ring.owner(session_id)
+
+    def any_worker(self):
+        live = [w for w in self.workers.values() if w.worker_id in self.ring.nodes]
+        if not live:
+            return None
+        self.round_robin += 1
+        return live[self.round_robin % len(live)]
+
+    def acquire(self, session_id, write):
+        """Owner of a session for one request; writes wait out a move and are counted"""
+        with self.lock:
+            while session_id in self.moving:
+                self.lock.wait()
+            if write:
+                self.active[session_id] += 1
+            return self.owner_for(session_id)
+
+    def release(self, session_id):
+        with self.lock:
+            self.active[session_id] -= 1
+            if self.active[session_id] <= 0:
+                del self.active[session_id]
+            self.lock.notify_all()
+
+    def acquire_new_game(self, session_id):
+        """Owner for a game about to be created.
+
+        One the rebalance in progress would move waits for it to end, so
+        it is created where it stays whether the move commits or rolls back.
+        """
+        with self.lock:
+            while self.will_move(session_id):
+                self.lock.wait()
+            self.creating.add(session_id)
+            return self.owner_for(session_id)
+
+    def release_new_game(self, session_id):
+        with self.lock:
+            self.creating.discard(session_id)
+            self.lock.notify_all()
+
+    def drain(self, busy):
+        """Wait (holding self.lock) until busy() is false or CLUSTER_DRAIN_TIMEOUT passes"""
+        deadline = time.monotonic() + CLUSTER_DRAIN_TIMEOUT
+        while busy() and time.monotonic() < deadline:
+            self.lock.wait(deadline - time.monotonic())
+
+    # ---- membership ----
+
+    def add_worker(self):
+        worker_id = max(self.workers, default=-1) + 1
+        worker = Worker(worker_id, self.base_port + worker_id)
+        worker.start()
+        if not worker.wait_until_listening():
+            worker.stop()
+            raise RuntimeError(f"worker {worker_id} did not start")
+        with self.lock:
+            self.workers = {**self.workers, worker_id: worker}
+        try:
+            self.rebalance(self.ring.nodes | {worker_id})
+        except Exception:
+            self.drop_worker(worker_id)
+            worker.stop()
+            raise
+        return worker
+
+    def remove_worker(self, worker_id):
+        """Move a worker's sessions to the others, then stop it"""
+        worker = self.workers.get(worker_id)
+        if worker is None or len(self.ring.nodes) <= 1:
+            return False
+        self.rebalance(self.ring.nodes - {worker_id})
+        worker.stop()
+        self.drop_worker(worker_id)
+        return True
+
+    def drop_worker(self, worker_id):
+        with self.lock:
+            self.workers = {k: w for k, w in self.workers.items() if k != worker_id}
+
+    def rebalance(self, nodes):
+        with self.rebalance_lock:
+            new_ring = self.ring.with_nodes(nodes)
+            with self.lock:
+                self.next_ring = new_ring
+                # Games created before this must be saved to be listed below
+                self.drain(lambda: any(self.will_move(sid) for sid in self.creating))
+            moves = {}  # (from, to) -> [session_id]
+            for worker_id in self.ring.nodes:
+                worker = self.workers.get(worker_id)
+                if worker is None or not worker.alive():
+                    continue
+                for session_id in worker.call("GET", "/internal/sessions")["sessions"]:
+                    target = new_ring.owner(session_id)
+                    if target != worker_id:
+                        moves.setdefault((worker_id, target), []).append(session_id)
+            moving = {sid for ids in moves.values() for sid in ids}
+
+            with self.lock:
+                self.moving |= moving
+                self.drain(lambda: any(self.active[sid] for sid in moving))
+            copied = []  # (source, target, session_ids) the target has acknowledged
+            committed = False
+            try:
+                for (source, target), session_ids in moves.items():
+                    sessions = self.workers[source].call("POST", "/internal/sessions/export", {"ids": session_ids})["sessions"]
+                    reply = self.workers[target].call("POST", "/internal/sessions/import", {"sessions": sessions})
+                    if (reply or {}).get("imported") != len(sessions):
+                        raise WorkerError(f"worker {target} took {reply} of {len(sessions)} sessions")
+                    copied.append((source, target, [data["id"] for data in sessions]))
+                committed = True
+            except Exception as e:
+                print(f"Cluster: move failed ({e!r}), keeping sessions on their old workers")
+                for _, target, session_ids in copied:
+                    try:
+                        self.workers[target].call("POST", "/internal/sessions/release", {"ids": session_ids})
+                    except (OSError, WorkerError) as err:
+                        print(f"Cluster: could not drop copies on worker {target}: {err!r}")
+                raise
+            finally:
+                with self.lock:
+                    if committed:
+                        self.ring = new_ring
+                    self.next_ring = None
+                    self.moving -= moving
+                    self.lock.notify_all()
+            # Every new owner has its copies, so the old ones can let go
+            for source, _, session_ids in copied:
+                try:
+                    self.workers[source].call("POST", "/internal/sessions/release", {"ids": session_ids})
+                except (OSError, WorkerError) as e:
+                    print(f"Cluster: worker {source} kept stale copies of moved sessions: {e!r}")
+                self.stats["moved_sessions"] += len(session_ids)
+            self.stats["rebalances"] += 1
+            print(f"Cluster: workers {sorted(nodes)}, moved {len(moving)} sessions")
+
+    def watch(self):
+        """Restart crashed workers; their sessions are gone (or recovered from their event log)"""
+        while True:
+            time.sleep(CLUSTER_HEALTH_INTERVAL)
+            for worker_id, worker in list(self.workers.items()):
+                if worker.alive() or worker_id not in self.ring.nodes:
+                    continue
+                print(f"Cluster: worker {worker_id} exited ({worker.process.returncode}), restarting")
+                self.stats["restarts"] += 1
+                try:
+                    self.rebalance(self.ring.nodes - {worker_id})
+                    worker.start()
+                    if worker.wait_until_listening():
+                        self.rebalance(self.ring.nodes | {worker_id})
+                except Exception as e:
+                    print(f"Cluster: restarting worker {worker_id} failed: {e!r}")
+
+    def status(self):
+        counts = Counter(self.ring.owner(f"probe-{i}") for i in range(1000))
+        return {
+            "workers": [
+                {"id": w.worker_id, "port": w.port, "pid": w.process.pid, "alive": w.alive(),
+                 "in_ring": w.worker_id in self.ring.nodes, "key_share": counts[w.worker_id] / 1000}
+                for w in self.workers.values()
+            ],
+            "stats": self.stats
+        }
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+
+
+def make_handler(front):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.0"  # One request per connection keeps streaming simple
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def is_admin(self):
+            if CLUSTER_ADMIN_TOKEN:
+                return self.headers.get("Authorization") == f"Bearer {CLUSTER_ADMIN_TOKEN}"
+            return self.client_address[0] in ("127.0.0.1", "::1")
+
+        def admin(self, path):
+            if not self.is_admin():
+                self.send_json(403, {"error": "Forbidden"})
+            elif self.command == "GET" and path == "/cluster":
+                self.send_json(200, front.status())
+            elif self.command == "POST" and path == "/cluster/workers":
+                try:
+                    worker = front.add_worker()
+                except Exception as e:
+                    return self.send_json(500, {"error": str(e), **front.status()})
+                self.send_json(200, {"added": worker.worker_id, **front.status()})
+            elif self.command == "DELETE" and path.startswith("/cluster/workers/"):
+                try:
+                    removed = front.remove_worker(int(path.rsplit("/", 1)[1]))
+                except Exception as e:
+                    return self.send_json(500, {"error": str(e), **front.status()})
+                self.send_json(200 if removed else 400, {"removed": removed, **front.status()})
+            else:
+                self.send_json(404, {"error": "Not found"})
+
+        def route(self, path, query, body):
+            """(session_id, is_new_game) for this request"""
+            if path == "/game/new":
+                return str(uuid.uuid4()), True
+            match = SESSION_PATH.match(path)
+            if match:
+                return match.group(1), False
+            if "session_id" in query:
+                return query["session_id"][0], False
+            if body and self.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    return None, False
+                if isinstance(data, dict) and isinstance(data.get("session_id"), str):
+                    return data["session_id"], False
+            return None, False
+
+        def handle_any(self):
+            url = urlsplit(self.path)
+            if url.path == "/cluster" or url.path.startswith("/cluster/"):
+                return self.admin(url.path)
+            if url.path.startswith("/internal/"):
+                return self.send_json(404, {"error": "Not found"})
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+            session_id, new_game = self.route(url.path, parse_qs(url.query), body)
+            write = self.command not in ("GET", "HEAD", "OPTIONS")
+            front.stats["requests"] += 1
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+            if session_id is None:
+                worker = front.any_worker()
+                self.forward(worker, body, headers)
+            elif new_game:
+                headers["X-Session-Id"] = session_id
+                worker = front.acquire_new_game(session_id)
+                try:
+                    self.forward(worker, body, headers)
+                finally:
+                    front.release_new_game(session_id)
+            else:
+                worker = front.acquire(session_id, write)
+                try:
+                    self.forward(worker, body, headers)
+                finally:
+                    if write:
+                        front.release(session_id)
+
+        def forward(self, worker, body, headers):
+            if worker is None:
+                return self.send_json(503, {"error": "No workers available"})
+            conn = http.client.HTTPConnection("127.0.0.1", worker.port, timeout=CLUSTER_UPSTREAM_TIMEOUT)
+            started = False
+            try:
+                conn.request(self.command, self.path, body or None, headers)
+                response = conn.getresponse()
+                started = True
+                self.send_response(response.status, response.reason)
+                for key, value in response.getheaders():
+                    if key.lower() not in HOP_HEADERS:
+                        self.send_header(key, value)
+                self.end_headers()
+                # Copy as it arrives, so SSE streams pass straight through
+                while True:
+                    chunk = response.read1(65536)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Player went away
+            except (OSError, http.client.HTTPException) as e:
+                print(f"Cluster: worker {worker.worker_id} request failed: {e!r}")
+                if not started:
+                    self.send_json(502, {"error": "Worker unavailable"})
+            finally:
+                conn.close()
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = do_HEAD = handle_any
+
+    return Handler
+
+
+def make_internal_blueprint(smth):
+    """Session hand-over routes, only on workers (the front never forwards /internal/)"""
+    from flask import Blueprint, jsonify, request
+
+    internal = Blueprint("cluster_internal", __name__)
+
+    @internal.route("/internal/sessions", methods=["GET"])
+    def list_sessions():
+        return jsonify({"sessions": [s.session_id for s in smth.session_store.values()]})
+
+    @internal.route("/internal/sessions/export", methods=["POST"])
+    def export_sessions():
+        return jsonify({"sessions": smth.export_sessions(request.json["ids"])})
+
+    @internal.route("/internal/sessions/import", methods=["POST"])
+    def import_sessions():
+        return jsonify({"imported": smth.import_sessions(request.json["sessions"])})
+
+    @internal.route("/internal/sessions/release", methods=["POST"])
+    def release_sessions():
+        return jsonify({"released": smth.release_sessions(request.json["ids"])})
+
+    return internal
+
+
+def run_worker(port):
+    import smth
+    if smth.SESSION_STORE != "memory":
+        print("WARNING: cluster.py is for the memory store; with Redis any worker can serve any session")
+    smth.app.register_blueprint(make_internal_blueprint(smth))
+    try:
+        from waitress import serve
+    except ImportError:
+        print("WARNING: waitress is not installed (pip install waitress); workers run on Flask's development server")
+        smth.app.run(host="127.0.0.1", port=port, threaded=True)
+        return
+    serve(smth.app, host="127.0.0.1", port=port, threads=CLUSTER_WORKER_THREADS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("role", nargs="?", default="front", choices=["front", "worker"])
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--worker-port", type=int, default=5101, help="first worker port; worker n listens on this + n")
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        run_worker(args.port)
+        return
+
+    front = Front(args.workers, args.worker_port)
+    threading.Thread(target=front.watch, name="cluster-watch", daemon=True).start()
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(front))
+    server.daemon_threads = True
+    print(f"Cluster: front on :{args.port}, {args.workers} workers from :{args.worker_port}")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # So the workers are stopped too
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        front.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""Traffic control in front of the upstream chat-completions client.
+
+Every LLM call goes through a dispatcher, which:
+- shares one upstream call between identical requests already in flight for
+  the same session (double-clicked Ask button, client retries),
+- caps concurrent calls globally and per session, queueing the rest,
+- keeps us under the provider's request rate with a token bucket,
+- retries 429 / 5xx / connection errors with jittered exponential backoff,
+  honouring Retry-After when the provider sends it.
+
+LLMDispatcher is for the threaded Flask app, AsyncLLMDispatcher for asgi.py.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from metrics import Stats
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_SESSION_CONCURRENCY = int(os.getenv("LLM_SESSION_CONCURRENCY", "2"))
+LLM_RATE_PER_MIN = float(os.getenv("LLM_RATE_PER_MIN", "60"))  # 0 means no rate limit
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+CANCEL_POLL = 0.05  # Seconds between checks for a cancelled stream while it waits for a slot
+
+
+class DispatcherBusy(Exception):
+    """Waited too long for a free upstream slot"""
+
+
+class StreamCancelled(Exception):
+    """The stream was given up on from another thread (see CancelToken)"""
+
+
+class CancelToken:
+    """Lets another thread give up on a stream that may be blocked on the provider.
+
+    LLMDispatcher.stream registers what to undo (close the HTTP response, free
+    its slots); cancel() runs it straight away, or as soon as it's registered.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    def add(self, fn):
+        with self.lock:
+            if not self.cancelled:
+                self.callbacks.append(fn)
+                return
+        fn()
+
+    def cancel(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print(f"LLM Cancel Error: {e}")
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # openai's APIConnectionError / APITimeoutError carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retry number attempt (0-based)"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    # Full jitter: spreads retries out so a burst doesn't come back all at once
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def shut_down(stream):
+    """Wake a thread blocked reading a streamed response by shutting its socket; it closes the rest"""
+    response = getattr(stream, "response", None)
+    network = response.extensions.get("network_stream") if response is not None else None
+    sock = network.get_extra_info("socket") if network is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def request_key(session_id, kwargs):
+    return session_id, json.dumps(kwargs, sort_keys=True, default=str)
+
+
+# Usage on a reply shared with an identical call already in flight: the caller
+# that made the call is charged for it, the ones that joined it are not
+SHARED_USAGE = {"prompt_tokens": 0, "completion_tokens": 0}
+
+
+class SharedReply:
+    """What a coalesced caller gets: the owner's choices, with SHARED_USAGE"""
+    __slots__ = ("choices", "model", "usage")
+
+    def __init__(self, response):
+        self.choices = response.choices
+        self.model = getattr(response, "model", None)
+        self.usage = SHARED_USAGE
+
+
+class TokenBucket:
+    def __init__(self, rate_per_min=LLM_RATE_PER_MIN, burst=LLM_BURST):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, return how long the caller must wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class SessionLimits:
+    """Per-key overrides of the session concurrency, e.g. a batch's own allowance"""
+
+    def __init__(self):
+        self.limits = {}  # key -> [concurrency, holders]
+        self.lock = threading.Lock()
+
+    def get(self, key, default):
+        entry = self.limits.get(key)
+        return entry[0] if entry else default
+
+    @contextmanager
+    def allow(self, key, concurrency):
+        """Let key run up to concurrency calls at once while the block runs"""
+        with self.lock:
+            entry = self.limits.setdefault(key, [concurrency, 0])
+            entry[0] = max(entry[0], concurrency)
+            entry[1] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.limits[key]
+
+
+class LLMDispatcher:
+    def __init__(self, get_client, max_concurrency=LLM_MAX_CONCURRENCY,
+                 session_concurrency=LLM_SESSION_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, bucket=None):
+        self.get_client = get_client
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.session_concurrency = session_concurrency
+        self.session_slots = {}  # session_id -> [semaphore, users]
+        self.limits = SessionLimits()
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.bucket = bucket or TokenBucket()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.stats = Stats("calls", "coalesced", "retries", "rejected")
+        self.waiting = 0  # Callers queued for a slot right now
+        self.recorder = None  # recorder.Recorder when RECORD_DIR is set
+
+    def _queued(self, delta):
+        with self.lock:
+            self.waiting += delta
+
+    def _session_slot(self, session_id):
+        with self.lock:
+            slot = self.session_slots.get(session_id)
+            if slot is None:
+                slot = self.session_slots[session_id] = [
+                    threading.BoundedSemaphore(self.limits.get(session_id, self.session_concurrency)), 0
+                ]
+            slot[1] += 1
+            return slot[0]
+
+    def _release_session_slot(self, session_id):
+        with self.lock:
+            slot = self.session_slots[session_id]
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self.session_slots[session_id]
+
+    def _admitted(self, session_id, fn):
+        """Run fn() once we hold a session slot, a global slot and a rate token"""
+        session_slot = self._session_slot(session_id)
+        self._queued(1)
+        queued = True
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            if not session_slot.acquire(timeout=self.queue_timeout):
+                self.stats.inc("rejected")
+                raise DispatcherBusy("Too many requests for this session")
+            try:
+                if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    self.stats.inc("rejected")
+                    raise DispatcherBusy("Upstream queue is full")
+                self._queued(-1)
+                queued = False
+                try:
+                    time.sleep(self.bucket.reserve())
+                    return fn()
+                finally:
+                    self.slots.release()
+            finally:
+                session_slot.release()
+        finally:
+            if queued:
+                self._queued(-1)
+            self._release_session_slot(session_id)
+
+    def _with_retries(self, fn):
+        attempt = 0
+        while True:
+            try:
+                self.stats.inc("calls")
+                return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_delay(e, attempt)
+                print(f"LLM Retry {attempt + 1}/{self.max_retries} in {delay:.2f}s: {e}")
+                self.stats.inc("retries")
+                attempt += 1
+                time.sleep(delay)
+
+    def complete(self, session_id=None, **kwargs):
+        """chat.completions.create(**kwargs), shared with identical in-flight calls"""
+        key = request_key(session_id, kwargs)
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+            else:
+                self.stats.inc("coalesced")
+        if not owner:
+            return SharedReply(future.result())
+
+        try:
+            def create():
+                started = time.monotonic()
+                result = self.get_client().chat.completions.create(**kwargs)
+                if self.recorder:
+                    elapsed = time.monotonic() - started
+                    self.recorder.completion(kwargs, result.choices[0].message.content, result.usage, result.model, elapsed, elapsed)
+                return result
+
+            result = self._admitted(session_id, lambda: self._with_retries(create))
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def stream(self, session_id=None, cancel=None, **kwargs):
+        """Yield chunks of a streamed completion.
+
+        Streams can't be shared between callers, so there is no coalescing here
+        (a repeated question is shared a level up, see smth.join_question), and
+        retries only happen before the first chunk reaches the caller.
+        cancel (a CancelToken) lets another thread drop the HTTP response and
+        free the slots at once, even while this one is blocked reading it (a
+        request still waiting for response headers ends when they arrive).
+        """
+        def open_stream():
+            if cancel is not None and cancel.cancelled:
+                raise StreamCancelled()
+            opened = time.monotonic()
+            stream = self.get_client().chat.completions.create(stream=True, **kwargs)
+            with state:
+                upstream.append(stream)
+            if cancel is not None and cancel.cancelled:
+                raise StreamCancelled()
+            iterator = iter(stream)
+            first = next(iterator, None)
+            if self.recorder:
+                return self.recorder.tap_stream(kwargs, first, iterator, opened)
+            return first, iterator
+
+        def acquire(semaphore, timeout):
+            """Wait for a slot, giving up early if cancelled; the slot is released with the rest"""
+            deadline = time.monotonic() + timeout
+            while True:
+                left = deadline - time.monotonic()
+                step = left if cancel is None else min(left, CANCEL_POLL)
+                if semaphore.acquire(timeout=max(0.0, step)):
+                    break
+                if cancel is not None and cancel.cancelled:
+                    raise StreamCancelled()
+                if left <= step:
+                    return False
+            with state:
+                if not released:
+                    held.append(semaphore)
+                    return True
+            semaphore.release()
+            raise StreamCancelled()
+
+        def close_upstream():
+            for stream in upstream:
+                if hasattr(stream, "close"):
+                    stream.close()
+
+        def abort_upstream():
+            with state:
+                streams = list(upstream)
+            for stream in streams:
+                shut_down(stream)
+
+        def release():
+            """Free the slots once, from whichever of the reader or a canceller gets here first"""
+            nonlocal released
+            with state:
+                if released:
+                    return
+                released = True
+                semaphores = list(reversed(held))
+            for semaphore in semaphores:
+                semaphore.release()
+            self._release_session_slot(session_id)
+
+        session_slot = self._session_slot(session_id)
+        held = []
+        upstream = []
+        state = threading.Lock()
+        released = False
+        if cancel is not None:
+            cancel.add(abort_upstream)
+            cancel.add(release)
+        self._queued(1)
+        queued = True
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            if not acquire(session_slot, self.queue_timeout):
+                self.stats.inc("rejected")
+                raise DispatcherBusy("Too many requests for this session")
+            if not acquire(self.slots, max(0.0, deadline - time.monotonic())):
+                self.stats.inc("rejected")
+                raise DispatcherBusy("Upstream queue is full")
+            self._queued(-1)
+            queued = False
+            time.sleep(self.bucket.reserve())
+
+            first, iterator = self._with_retries(open_stream)
+            if first is not None:
+                yield first
+            for chunk in iterator:
+                yield chunk
+        finally:
+            if queued:
+                self._queued(-1)
+            # Closing early (caller gave up, hedge lost) also drops the HTTP response
+            close_upstream()
+            release()
+
+
+class AsyncLLMDispatcher:
+    """asyncio version of LLMDispatcher for the async client"""
+
+    def __init__(self, get_client, max_concurrency=LLM_MAX_CONCURRENCY,
+                 session_concurrency=LLM_SESSION_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, bucket=None):
+        self.get_client = get_client
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.session_concurrency = session_concurrency
+        self.session_slots = {}
+        self.limits = SessionLimits()
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.bucket = bucket or TokenBucket()
+        self.in_flight = {}
+        self.stats = Stats("calls", "coalesced", "retries", "rejected")
+        self.waiting = 0
+        self.recorder = None
+
+    async def _acquire(self, session_id):
+        """Take a session slot, a global slot and a rate token; return the session slot"""
+        slot = self.session_slots.get(session_id)
+        if slot is None:
+            slot = self.session_slots[session_id] = [
+                asyncio.Semaphore(self.limits.get(session_id, self.session_concurrency)), 0
+            ]
+        slot[1] += 1
+        self.waiting += 1
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.queue_timeout
+            await asyncio.wait_for(slot[0].acquire(), self.queue_timeout)
+            try:
+                await asyncio.wait_for(self.slots.acquire(), max(0.0, deadline - loop.time()))
+            except BaseException:
+                slot[0].release()
+                raise
+        except asyncio.TimeoutError:
+            self._drop_session_slot(session_id)
+            self.stats.inc("rejected")
+            raise DispatcherBusy("Upstream queue is full")
+        except BaseException:
+            self._drop_session_slot(session_id)
+            raise
+        finally:
+            self.waiting -= 1
+        try:
+            await asyncio.sleep(self.bucket.reserve())
+        except BaseException:
+            # Cancelled while waiting out the rate limit (a hedge loser, a client gone)
+            self._release(session_id, slot[0])
+            raise
+        return slot[0]
+
+    def _release(self, session_id, session_slot):
+        self.slots.release()
+        session_slot.release()
+        self._drop_session_slot(session_id)
+
+    def _drop_session_slot(self, session_id):
+        slot = self.session_slots[session_id]
+        slot[1] -= 1
+        if slot[1] == 0:
+            del self.session_slots[session_id]
+
+    async def _with_retries(self, fn):
+        attempt = 0
+        while True:
+            try:
+                self.stats.inc("calls")
+                return await fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_delay(e, attempt)
+                print(f"LLM Retry {attempt + 1}/{self.max_retries} in {delay:.2f}s: {e}")
+                self.stats.inc("retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _create(self, kwargs):
+        started = time.monotonic()
+        result = await self.get_client().chat.completions.create(**kwargs)
+        if self.recorder:
+            elapsed = time.monotonic() - started
+            self.recorder.completion(kwargs, result.choices[0].message.content, result.usage, result.model, elapsed, elapsed)
+        return result
+
+    async def complete(self, session_id=None, **kwargs):
+        """Like LLMDispatcher.complete; the call runs in its own task, so one caller giving up
+        doesn't cancel it for the others, and it is only cancelled once nobody is waiting"""
+        key = request_key(session_id, kwargs)
+        shared = self.in_flight.get(key)
+        if shared is None:
+            task = asyncio.ensure_future(self._complete(session_id, kwargs))
+            shared = self.in_flight[key] = [task, 0, False]  # [task, callers waiting on it, reply handed out]
+
+            def forget(_task, shared=shared):
+                if self.in_flight.get(key) is shared:
+                    del self.in_flight[key]
+            task.add_done_callback(forget)
+        else:
+            self.stats.inc("coalesced")
+        task = shared[0]
+        shared[1] += 1
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            shared[1] -= 1
+            if shared[1] == 0 and not task.done():
+                task.cancel()
+        # Whoever gets the reply first pays for it, which is the owner unless it gave up
+        if shared[2]:
+            return SharedReply(result)
+        shared[2] = True
+        return result
+
+    async def _complete(self, session_id, kwargs):
+        session_slot = await self._acquire(session_id)
+        try:
+            return await self._with_retries(lambda: self._create(kwargs))
+        finally:
+            self._release(session_id, session_slot)
+
+    async def stream(self, session_id=None, **kwargs):
+        """Async twin of LLMDispatcher.stream"""
+        async def open_stream():
+            opened = time.monotonic()
+            stream = await self.get_client().chat.completions.create(stream=True, **kwargs)
+            upstream.append(stream)
+            iterator = stream.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = None
+            if self.recorder:
+                return self.recorder.tap_async_stream(kwargs, first, iterator, opened)
+            return first, iterator
+
+        upstream = []
+        session_slot = await self._acquire(session_id)
+        try:
+            first, iterator = await self._with_retries(open_stream)
+            if first is not None:
+                yield first
+                async for chunk in iterator:
+                    yield chunk
+        finally:
+            for stream in upstream:
+                if hasattr(stream, "close"):
+                    await stream.close()
+            self._release(session_id, session_slot)
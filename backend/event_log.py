@@ -0,0 +1,164 @@
+"""Append-only log of game events, for rebuilding sessions after a restart.
+
+Request handlers only put a record on a queue; a background thread writes
+them in batches to EVENT_LOG_DIR/events-<n>.log (one JSON array per line)
+and fsyncs at most every EVENT_LOG_FSYNC seconds, so a crash loses at most
+that much. Every EVENT_LOG_SNAPSHOT_EVERY records it starts a new segment
+and writes a snapshot of every live session next to it; older segments and
+snapshots are then deleted, which keeps recovery time bounded.
+
+Records are [kind, session_id, seq, timestamp, *payload]. seq counts events
+per session and is stored in the snapshot too, so replaying a segment on
+top of a snapshot skips whatever the snapshot already contains.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR")
+EVENT_LOG_FSYNC = float(os.getenv("EVENT_LOG_FSYNC", "1.0"))  # 0 fsyncs every batch
+EVENT_LOG_SNAPSHOT_EVERY = int(os.getenv("EVENT_LOG_SNAPSHOT_EVERY", "20000"))
+BATCH_MAX = 512  # Records written per loop at most
+
+
+def _number(path):
+    return int(path.stem.split("-")[1])
+
+
+class EventLog:
+    def __init__(self, directory, fsync_interval=EVENT_LOG_FSYNC, snapshot_every=EVENT_LOG_SNAPSHOT_EVERY):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.snapshot_source = None  # Returns the dicts of all live sessions, set by the app
+        self.queue = queue.SimpleQueue()
+        self.segment = max((_number(p) for p in self.directory.glob("events-*.log")), default=1)
+        self.file = None
+        self.since_snapshot = 0
+        self.stats = {"records": 0, "batches": 0, "fsyncs": 0, "snapshots": 0}
+        self.thread = None
+
+    def _segment_path(self, n):
+        return self.directory / f"events-{n:06d}.log"
+
+    def _snapshot_path(self, n):
+        return self.directory / f"snapshot-{n:06d}.json"
+
+    def start(self):
+        """Start the writer; call after recovery so the snapshot source is ready"""
+        path = self._segment_path(self.segment)
+        self.file = open(path, "a")
+        if path.stat().st_size and not path.read_bytes().endswith(b"\n"):
+            self.file.write("\n")  # End a line torn by a crash, so the next record starts clean
+        self.thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def append(self, record):
+        self.queue.put(record)
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            timeout = self.fsync_interval if self.fsync_interval > 0 else None
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < BATCH_MAX:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:  # close() was called
+                self._write([r for r in batch if r is not None])
+                self._sync()
+                return
+            if batch:
+                self._write(batch)
+            if time.monotonic() - last_sync >= self.fsync_interval:
+                self._sync()
+                last_sync = time.monotonic()
+            if self.since_snapshot >= self.snapshot_every and self.snapshot_source is not None:
+                self._snapshot()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.file.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch))
+            self.file.flush()
+        except Exception as e:
+            print(f"Event Log Write Error: {e}")
+            return
+        self.since_snapshot += len(batch)
+        self.stats["records"] += len(batch)
+        self.stats["batches"] += 1
+
+    def _sync(self):
+        try:
+            os.fsync(self.file.fileno())
+            self.stats["fsyncs"] += 1
+        except Exception as e:
+            print(f"Event Log Sync Error: {e}")
+
+    def _snapshot(self):
+        """Start a new segment, snapshot live sessions, drop what the snapshot replaces"""
+        self._sync()
+        self.file.close()
+        self.segment += 1
+        self.file = open(self._segment_path(self.segment), "a")
+        self.since_snapshot = 0
+        try:
+            sessions = self.snapshot_source()
+            path = self._snapshot_path(self.segment)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                for data in sessions:
+                    f.write(json.dumps(data, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"Event Log Snapshot Error: {e}")
+            return
+        self.stats["snapshots"] += 1
+        for old in list(self.directory.glob("events-*.log")) + list(self.directory.glob("snapshot-*.json")):
+            if _number(old) < self.segment:
+                old.unlink()
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+    def replay(self):
+        """Yield the newest snapshot's session dicts, then every record logged after it.
+
+        Yields ("snapshot", dict) and ("event", record). A torn last line from a
+        crash mid-write is skipped.
+        """
+        snapshots = sorted(self.directory.glob("snapshot-*.json"), key=_number)
+        start = 1
+        if snapshots:
+            start = _number(snapshots[-1])
+            with open(snapshots[-1]) as f:
+                for line in f:
+                    yield "snapshot", json.loads(line)
+        for path in sorted(self.directory.glob("events-*.log"), key=_number):
+            if _number(path) < start:
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        yield "event", json.loads(line)
+                    except ValueError:
+                        print(f"Event Log: skipping damaged record in {path.name}")
+
+
+event_log = EventLog(EVENT_LOG_DIR) if EVENT_LOG_DIR else None
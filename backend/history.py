@@ -0,0 +1,76 @@
+"""Fit conversation history and shared memory into a token budget.
+
+Instead of replaying a fixed number of turns, the newest turns are kept
+until the budget runs out and the older ones are squeezed into a one-line
+summary of what the guard already asked. Token counts are estimated
+locally (about 4 characters per token for English) and stored on each
+message when it is added, so building a window only walks the turns it keeps.
+"""
+import os
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+SHARED_TOKEN_BUDGET = int(os.getenv("SHARED_TOKEN_BUDGET", "300"))
+SUMMARY_QUESTIONS = 4  # Older questions mentioned in the summary line
+SUMMARY_WORDS = 8  # Words kept from each of those questions
+
+
+def estimate_tokens(text):
+    """Rough token count, good enough for budgeting"""
+    return (len(text) + 3) // 4
+
+
+def turn_tokens(msg):
+    """Token estimate for one stored exchange, cached on the message"""
+    tokens = msg.tokens
+    if tokens is None:
+        tokens = msg.tokens = estimate_tokens(msg.user) + estimate_tokens(msg.character) + 8
+    return tokens
+
+
+def window_history(conversation_history, day, budget=HISTORY_TOKEN_BUDGET):
+    """Pick the newest turns (up to day) that fit the budget.
+
+    Returns (turns oldest-first, summary of older turns or "").
+    """
+    kept = []
+    older = []
+    used = 0
+    turns = reversed(conversation_history)
+    for msg in turns:
+        if msg.day <= day:
+            tokens = turn_tokens(msg)
+            if used + tokens > budget:
+                older.append(msg)
+                break
+            kept.append(msg)
+            used += tokens
+    kept.reverse()
+
+    # Everything the loop didn't get to was dropped; remind the character what was asked
+    older.extend(m for m in turns if m.day <= day)
+    if not older:
+        return kept, ""
+    older.reverse()
+    questions = [" ".join(m.user.split()[:SUMMARY_WORDS]) for m in older[-SUMMARY_QUESTIONS:]]
+    summary = f"\n\nEARLIER, the guard asked you {len(older)} other questions, including: " + "; ".join(questions)
+    return kept, summary
+
+
+def budget_shared_context(shared_memory, shared_context, budget=SHARED_TOKEN_BUDGET):
+    """Trim the rendered shared memory block to the budget, newest events first"""
+    if estimate_tokens(shared_context) <= budget or not shared_memory:
+        return shared_context
+
+    header, _, _ = shared_context.partition("- Day ")
+    lines = []
+    used = estimate_tokens(header)
+    for event in reversed(shared_memory):
+        line = f"- Day {event.day}: {event.event}\n"
+        used += estimate_tokens(line)
+        if used > budget:
+            break
+        lines.append(line)
+    lines.reverse()
+
+    dropped = len(shared_memory) - len(lines)
+    return header + f"- ({dropped} earlier events omitted)\n" + "".join(lines)
@@ -0,0 +1,52 @@
+"""Conditional GET and compression for session reads.
+
+Every open tab polls its journal, and most polls get back exactly what they
+got last time. Session reads carry a weak ETag built from the session's
+version (bumped by the session store on every save) and the cursor read
+from, and a Last-Modified from its last save. A client that sends the ETag
+back in If-None-Match gets a 304 decided from the store's version alone,
+without loading the session. Bodies
+over COMPRESS_MIN_BYTES are gzipped for clients that accept it.
+
+Only framework-neutral helpers live here (they work on the werkzeug request
+and response that Flask and Quart share), so smth.py and asgi.py answer the
+same way.
+"""
+import gzip
+import os
+from datetime import datetime, timezone
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = 5  # Past this gzip gets slower for little gain on JSON this size
+
+
+def session_etag(version, cursor=0):
+    """The version, plus the cursor for reads from one: the same version read
+    from another cursor is a different body"""
+    return f"v{version}-{cursor}" if cursor else f"v{version}"
+
+
+def is_current(req, version, cursor=0):
+    """Does the client's If-None-Match already name this session version (and cursor)?
+
+    If-Modified-Since alone is not trusted: two saves within one second
+    would look the same.
+    """
+    return version is not None and req.if_none_match.contains_weak(session_etag(version, cursor))
+
+
+def add_validators(response, version, saved_at, cursor=0):
+    """ETag from the version and cursor; Last-Modified only when the store knows the save time"""
+    response.set_etag(session_etag(version, cursor), weak=True)
+    # Browsers may reuse the body, but must ask first; that question is the 304
+    response.cache_control.no_cache = True
+    if saved_at is not None:
+        response.last_modified = datetime.fromtimestamp(saved_at, timezone.utc)
+
+
+def compress(response, body, req):
+    """gzip the body in place if it is large enough and the client accepts it"""
+    response.vary.add("Accept-Encoding")
+    if len(body) >= COMPRESS_MIN_BYTES and req.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
@@ -0,0 +1,135 @@
+"""Per-session case journal.
+
+Each GameSession owns a JournalLog: an append-only list of clue lines. The
+cursor a client gets back is just the number of entries it has seen, so
+"what's new since cursor N" is a slice, not a re-read of the whole journal.
+
+Readers don't have to poll: wait_for() parks until an entry is appended
+(long-poll), and subscribe() registers a callback for push channels.
+"""
+import os
+import threading
+from pathlib import Path
+
+# Set JOURNAL_DIR to also keep each session's journal on disk
+JOURNAL_DIR = os.getenv("JOURNAL_DIR")
+
+
+class FileJournalBackend:
+    """Durable backend: one append-only text file per session"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, session_id):
+        return self.directory / f"{session_id}.txt"
+
+    def load(self, session_id):
+        path = self._path(session_id)
+        if not path.exists():
+            return []
+        with open(path, "r") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+
+    def append(self, session_id, text):
+        try:
+            with open(self._path(session_id), "a") as f:
+                f.write(text + "\n")
+        except Exception as e:
+            print(f"Journal Write Error: {e}")
+
+
+default_backend = FileJournalBackend(JOURNAL_DIR) if JOURNAL_DIR else None
+
+# Guards creating a journal's Condition, which most idle sessions never need
+_condition_lock = threading.Lock()
+
+
+class JournalLog:
+    __slots__ = ("session_id", "backend", "entries", "_changed", "subscribers", "closed")
+
+    def __init__(self, session_id, backend=None, entries=None):
+        self.session_id = session_id
+        self.backend = backend if backend is not None else default_backend
+        self._changed = None
+        self.subscribers = ()
+        self.closed = False  # The session moved to another process; readers should reconnect
+        if entries is not None:
+            self.entries = list(entries)
+        else:
+            self.entries = self.backend.load(session_id) if self.backend else []
+
+    @property
+    def changed(self):
+        if self._changed is None:
+            with _condition_lock:
+                if self._changed is None:
+                    self._changed = threading.Condition()
+        return self._changed
+
+    def append(self, text):
+        """Add an entry, wake any waiting readers, return the new cursor"""
+        self.entries.append(text)
+        cursor = len(self.entries)
+        # Readers create the Condition before they look for entries, so while
+        # there is none nobody can be waiting on this append
+        if self._changed is not None:
+            with self._changed:
+                self._changed.notify_all()
+        subscribers = self.subscribers
+        if self.backend:
+            self.backend.append(self.session_id, text)
+        for callback in subscribers:
+            try:
+                callback(cursor)
+            except Exception as e:
+                print(f"Journal Subscriber Error: {e}")
+        return cursor
+
+    def catch_up(self, entries):
+        """Take the entries of a newer copy of the session (saved by another process), waking readers"""
+        if len(entries) <= len(self.entries):
+            return
+        self.entries = list(entries)
+        cursor = len(self.entries)
+        if self._changed is not None:
+            with self._changed:
+                self._changed.notify_all()
+        for callback in self.subscribers:
+            try:
+                callback(cursor)
+            except Exception as e:
+                print(f"Journal Subscriber Error: {e}")
+
+    def since(self, cursor=0):
+        """Return (entries after cursor, new cursor)"""
+        cursor = max(0, min(cursor, len(self.entries)))
+        entries = self.entries[cursor:]
+        return entries, cursor + len(entries)
+
+    def wait_for(self, cursor=0, timeout=None):
+        """Like since(), but blocks up to timeout seconds until there is something new"""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.entries) > cursor or self.closed, timeout=timeout)
+        return self.since(cursor)
+
+    def close(self):
+        """Wake every reader for good, once the session has been handed to another worker"""
+        self.closed = True
+        with self.changed:
+            self.changed.notify_all()
+        for callback in self.subscribers:
+            callback(len(self.entries))
+
+    def subscribe(self, callback):
+        """Call callback(cursor) after every append, from the appending thread"""
+        with self.changed:
+            self.subscribers = self.subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        with self.changed:
+            self.subscribers = tuple(s for s in self.subscribers if s is not callback)
+
+    def __len__(self):
+        return len(self.entries)
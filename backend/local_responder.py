@@ -0,0 +1,160 @@
+"""Answer from a local corpus instead of the LLM.
+
+responder_corpus.json holds pre-written answers (with their journal clue)
+for each (character, day, is_skinwalker), each tagged with the kind of
+question it answers. A player's question is matched against those tags with
+TF-IDF cosine similarity, so "where were you last night?" and "did you see
+Kabir?" get different answers even when the provider is down. Answers a
+player has already heard from that character are skipped while others remain.
+
+LOCAL_RESPONDER picks when it is used:
+  fallback  when the upstream call fails (default)
+  shed      also when the dispatcher already has LOCAL_SHED_QUEUE callers
+            waiting for an upstream slot, instead of queueing behind them
+  offline   always; the LLM is never called
+  off       never; the pre-written one-liners are the only fallback
+
+NumPy is used for the similarity if it is installed; otherwise a pure-Python
+sparse dot product does the same job. Either way a lookup only scores the
+handful of answers for one (character, day), well under a millisecond.
+The corpus (and NumPy) are loaded by load(), from the app's warm-up or on
+the first answer, so they stay out of start-up time.
+"""
+import json
+import math
+import os
+import threading
+import zlib
+from pathlib import Path
+
+np = None  # numpy, imported by LocalResponder.load() if installed
+
+from response_cache import normalize_message
+
+LOCAL_RESPONDER = os.getenv("LOCAL_RESPONDER", "fallback")
+LOCAL_SHED_QUEUE = int(os.getenv("LOCAL_SHED_QUEUE", "32"))
+CORPUS_PATH = Path(os.getenv("RESPONDER_CORPUS", Path(__file__).parent / "responder_corpus.json"))
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "been", "do", "does", "did",
+    "you", "your", "i", "me", "my", "we", "us", "it", "its", "he", "she", "him", "her", "they", "them",
+    "to", "of", "in", "on", "at", "for", "with", "about", "what", "who", "why", "how", "when", "where",
+    "that", "this", "there", "any", "anything", "tell", "know", "can", "could", "would", "have", "has",
+    "so", "now", "just", "please", "ji", "bhai"
+}
+
+
+def tokenize(text):
+    """Content words with a light plural strip, so "herbs" matches "herb" """
+    words = []
+    for word in normalize_message(text).replace("'", " ").split():
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+class CharacterIndex:
+    """TF-IDF vectors for the answers of one (character, day, is_skinwalker)"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        docs = [tokenize(e["question"] + " " + e["answer"]) + tokenize(e["question"]) for e in entries]
+        vocab = sorted({w for doc in docs for w in doc})
+        self.columns = {w: i for i, w in enumerate(vocab)}
+        self.idf = {
+            w: math.log((1 + len(docs)) / (1 + sum(w in doc for doc in docs))) + 1
+            for w in vocab
+        }
+        vectors = [self._vector(doc) for doc in docs]
+        if np is not None:
+            self.matrix = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+            for row, vector in enumerate(vectors):
+                for w, value in vector.items():
+                    self.matrix[row, self.columns[w]] = value
+        else:
+            self.vectors = vectors
+
+    def _vector(self, words):
+        """L2-normalised tf-idf weights as {word: weight}, words outside the vocabulary dropped"""
+        counts = {}
+        for w in words:
+            if w in self.idf:
+                counts[w] = counts.get(w, 0) + 1
+        weights = {w: c * self.idf[w] for w, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in weights.values()))
+        return {w: v / norm for w, v in weights.items()} if norm else {}
+
+    def scores(self, question):
+        query = self._vector(tokenize(question))
+        if not query:
+            return [0.0] * len(self.entries)
+        if np is not None:
+            q = np.zeros(len(self.columns), dtype=np.float32)
+            for w, value in query.items():
+                q[self.columns[w]] = value
+            return (self.matrix @ q).tolist()
+        return [sum(vector.get(w, 0.0) * v for w, v in query.items()) for vector in self.vectors]
+
+
+class LocalResponder:
+    def __init__(self, path=CORPUS_PATH, mode=LOCAL_RESPONDER):
+        self.path = path
+        self.mode = mode
+        self.indexes = {}
+        self.loaded = mode == "off"
+        self.load_lock = threading.Lock()
+
+    def load(self):
+        """Read the corpus and build the indexes, once"""
+        if self.loaded:
+            return
+        with self.load_lock:
+            if self.loaded:
+                return
+            global np
+            try:
+                import numpy as np
+            except ImportError:
+                pass
+            try:
+                with open(self.path) as f:
+                    corpus = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Local Responder: corpus not loaded ({e}), using pre-written lines only")
+                self.mode = "off"
+                self.loaded = True
+                return
+            grouped = {}
+            for entry in corpus:
+                key = (entry["character"], entry["day"], entry["skinwalker"])
+                grouped.setdefault(key, []).append(entry)
+            self.indexes = {key: CharacterIndex(entries) for key, entries in grouped.items()}
+            self.loaded = True
+
+    def answer(self, character, day, is_skinwalker, question, history=()):
+        """Best (speech, clue) for the question, or None if we have nothing for them"""
+        self.load()
+        index = self.indexes.get((character, day, is_skinwalker))
+        if index is None:
+            return None
+        already_said = {m.character for m in history}
+        scores = index.scores(question)
+        # Ties (including "nothing matched") go to a per-question pick, not always the first answer
+        tiebreak = zlib.crc32(normalize_message(question).encode())
+        ranked = sorted(
+            range(len(index.entries)),
+            key=lambda i: (-scores[i], (i + tiebreak) % len(index.entries))
+        )
+        fresh = [i for i in ranked if index.entries[i]["answer"] not in already_said]
+        entry = index.entries[(fresh or ranked)[0]]
+        return entry["answer"], entry["clue"]
+
+    def offline(self):
+        return self.mode == "offline"
+
+    def should_shed(self, dispatcher):
+        """Answer locally instead of joining a long upstream queue?"""
+        return self.mode == "shed" and dispatcher.waiting >= LOCAL_SHED_QUEUE
@@ -0,0 +1,207 @@
+"""Timing spans and counters, served in Prometheus text format on /metrics.
+
+Kept dependency-free and cheap enough for the hot path: a histogram
+observation is a bisect into fixed buckets plus a few additions under a lock.
+Stats other modules already keep (response cache, dispatcher, model router)
+are read at scrape time through collectors instead of being copied here.
+
+    with span("prompt_build"):
+        messages = build_messages(...)
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; from in-process work (prompt assembly, parsing) up to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Stats(dict):
+    """Named counters a module keeps for itself, safe to bump from several threads.
+
+    Reads are plain dict reads, so collectors keep using dict(stats).
+    """
+
+    def __init__(self, *names):
+        super().__init__(dict.fromkeys(names, 0))
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self[name] += amount
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = [(labels, list(series)) for labels, series in self.series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = {}
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def set_collector(self, name, collect):
+        """collect() returns exposition lines, called on every scrape; replaces one of the same name"""
+        self.collectors[name] = collect
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in list(self.collectors.values()):
+            try:
+                lines.extend(collect())
+            except Exception as e:
+                print(f"Metrics Collector Error: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name, help_text, values, labelname=None):
+    """Exposition lines for gauges from a dict ({label: value}, or {None: value} unlabelled)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for label, value in values.items():
+        if value is None:
+            continue
+        labels = _format_labels((labelname,), (label,)) if labelname else ""
+        lines.append(f"{name}{labels} {value}")
+    return lines
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "game_stage_seconds", "Time spent in each stage of handling a request", ("stage",)
+)
+request_seconds = registry.histogram(
+    "game_http_request_seconds", "Time to produce a response, per endpoint (streams: until headers)", ("endpoint", "status")
+)
+interrogations = registry.counter(
+    "game_interrogations_total", "Questions asked, per character and day", ("character", "day")
+)
+fallbacks = registry.counter(
+    "game_fallback_total", "Replies served from the pre-written lines instead of the LLM", ("character",)
+)
+local_answers = registry.counter(
+    "game_local_answers_total", "Replies from the local responder corpus, by why it answered", ("reason",)
+)
+llm_tokens = registry.counter(
+    "game_llm_tokens_total", "Tokens reported by the provider", ("kind",)
+)
+character_tokens = registry.counter(
+    "game_character_tokens_total", "Tokens spent answering questions, per character and day", ("character", "day")
+)
+
+
+@contextmanager
+def span(stage):
+    """Time the with-block into game_stage_seconds{stage=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage)
+
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage)
+
+
+def record_usage(usage):
+    """Count tokens from an OpenAI-style usage object or dict, if the provider sent one"""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if value:
+            llm_tokens.inc(kind.split("_")[0], amount=value)
+
+
+def llm_stats_collector(response_cache, dispatcher, router):
+    """Collector exposing the cache, dispatcher and router stats those objects already keep"""
+    def collect():
+        cache = response_cache.stats()
+        lines = gauge_lines("game_response_cache", "Response cache counters", {
+            k: v for k, v in cache.items() if k != "hit_rate"
+        }, "stat")
+        lines += gauge_lines("game_dispatcher", "LLM dispatcher counters", dict(dispatcher.stats), "stat")
+        models = router.snapshot()
+        for stat in ("ttft", "total", "error_rate", "calls", "errors", "wins"):
+            lines += gauge_lines(f"game_model_{stat}", f"Model router {stat} per model",
+                                 {m["model"]: m[stat] for m in models}, "model")
+        return lines
+    return collect
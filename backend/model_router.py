@@ -0,0 +1,310 @@
+"""Choose which model answers, and hedge against slow providers.
+
+Free-tier providers sometimes sit on a request for many seconds before the
+first token. With more than one model configured (LLM_MODELS), the router
+sends the request to the model with the best recent time-to-first-token,
+and if nothing has arrived after LLM_HEDGE_AFTER seconds it sends the same
+request to the next model too. Whichever produces speech first wins; the
+other is cancelled at once, freeing its upstream connection and dispatcher
+slots. A model that errors is replaced straight away.
+
+Latency and error stats per model (exponentially weighted) decide the order.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from dispatcher import CancelToken
+
+LLM_MODELS = [m.strip() for m in os.getenv("LLM_MODELS", "").split(",") if m.strip()]
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "2.5"))
+STATS_ALPHA = 0.2  # Weight of the newest sample in the moving averages
+ERROR_PENALTY = 4.0  # How much a 100% error rate multiplies a model's score
+
+
+class ModelStats:
+    def __init__(self, name):
+        self.name = name
+        self.ttft = None  # Moving average seconds to first token
+        self.total = None  # Moving average seconds for the whole reply
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+
+    @staticmethod
+    def _ewma(old, sample):
+        return sample if old is None else old + STATS_ALPHA * (sample - old)
+
+    def record_first_token(self, seconds):
+        self.calls += 1
+        self.ttft = self._ewma(self.ttft, seconds)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+
+    def record_cancelled(self, seconds):
+        """A hedge loser cancelled after this long: its first token is at least that far off.
+
+        Neither a success nor an error, so calls and error_rate are left alone.
+        """
+        self.ttft = seconds if self.ttft is None else max(self.ttft, seconds)
+
+    def record_total(self, seconds):
+        self.total = self._ewma(self.total, seconds)
+
+    def record_error(self):
+        self.calls += 1
+        self.errors += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+
+    def score(self):
+        """Lower is better; untried models score 0 so they get a chance"""
+        if self.ttft is None:
+            return 0.0
+        return self.ttft * (1 + ERROR_PENALTY * self.error_rate)
+
+    def snapshot(self):
+        return {
+            "model": self.name,
+            "ttft": round(self.ttft, 3) if self.ttft is not None else None,
+            "total": round(self.total, 3) if self.total is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+            "errors": self.errors,
+            "wins": self.wins
+        }
+
+
+def chunk_text(chunk):
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+class ModelRouter:
+    """Routes calls for the threaded app through an LLMDispatcher"""
+
+    def __init__(self, dispatcher, models, hedge_after=LLM_HEDGE_AFTER):
+        self.dispatcher = dispatcher
+        self.models = {name: ModelStats(name) for name in models}
+        self.hedge_after = hedge_after
+
+    def ranked(self):
+        # Configured order breaks ties, so the first model stays primary until we know better
+        return sorted(self.models.values(), key=lambda s: s.score())
+
+    def snapshot(self):
+        return [s.snapshot() for s in self.models.values()]
+
+    def complete(self, session_id, messages, **kwargs):
+        """Return (text, usage, model) for a full reply"""
+        if len(self.models) == 1:
+            stats = self.ranked()[0]
+            started = time.monotonic()
+            try:
+                response = self.dispatcher.complete(session_id, model=stats.name, messages=messages, **kwargs)
+            except Exception:
+                stats.record_error()
+                raise
+            elapsed = time.monotonic() - started
+            stats.record_first_token(elapsed)
+            stats.record_total(elapsed)
+            stats.wins += 1
+            return response.choices[0].message.content, getattr(response, "usage", None), stats.name
+
+        # Hedging needs to see the first token, so stream and collect
+        text = ""
+        usage = None
+        model = None
+        for chunk in self.stream(session_id, messages, **kwargs):
+            text += chunk_text(chunk)
+            usage = getattr(chunk, "usage", None) or usage
+            model = getattr(chunk, "model", None) or model
+        return text, usage, model
+
+    def _attempt(self, stats, session_id, messages, kwargs, results, cancel):
+        """Open a stream and read up to the first piece of speech, report to results"""
+        started = time.monotonic()
+        chunks = self.dispatcher.stream(session_id, model=stats.name, messages=messages, cancel=cancel, **kwargs)
+        buffered = []
+        try:
+            for chunk in chunks:
+                buffered.append(chunk)
+                if chunk_text(chunk):
+                    break
+        except Exception as e:
+            if cancel.cancelled:
+                stats.record_cancelled(time.monotonic() - started)
+            else:
+                stats.record_error()
+            results.put((stats, None, None, started, e))
+            return
+        stats.record_first_token(time.monotonic() - started)
+        results.put((stats, chunks, buffered, started, None))
+
+    @staticmethod
+    def _discard(results, pending):
+        """Close the streams of losing attempts that still got to speak, once they report in"""
+        for _ in range(pending):
+            _, chunks, _, _, _ = results.get()
+            if chunks is not None:
+                chunks.close()
+
+    def stream(self, session_id, messages, **kwargs):
+        """Yield chunks from whichever model starts speaking first"""
+        candidates = self.ranked()
+        results = queue.Queue()
+        tokens = {}  # Model name -> CancelToken of its attempt
+        launched = 0
+        pending = 0
+        last_error = None
+
+        def launch():
+            nonlocal launched, pending
+            stats = candidates[launched]
+            tokens[stats.name] = CancelToken()
+            threading.Thread(
+                target=self._attempt, args=(stats, session_id, messages, kwargs, results, tokens[stats.name]), daemon=True
+            ).start()
+            launched += 1
+            pending += 1
+
+        launch()
+        while True:
+            can_hedge = launched < len(candidates)
+            try:
+                stats, chunks, buffered, started, error = results.get(
+                    timeout=self.hedge_after if can_hedge else None
+                )
+            except queue.Empty:
+                print(f"LLM Hedge: no first token after {self.hedge_after}s, also trying {candidates[launched].name}")
+                launch()
+                continue
+
+            pending -= 1
+            if error is None:
+                break
+            last_error = error
+            if can_hedge:
+                launch()
+            elif pending == 0:
+                raise last_error
+
+        stats.wins += 1
+        if pending:
+            # The losers may be blocked waiting on their provider; don't let them hold slots until it answers
+            for name, token in tokens.items():
+                if name != stats.name:
+                    token.cancel()
+            threading.Thread(target=self._discard, args=(results, pending), daemon=True).start()
+
+        try:
+            for chunk in buffered:
+                yield chunk
+            for chunk in chunks:
+                yield chunk
+        finally:
+            chunks.close()
+        stats.record_total(time.monotonic() - started)
+
+
+class AsyncModelRouter(ModelRouter):
+    """Same routing for asgi.py on an AsyncLLMDispatcher; losers are cancelled outright"""
+
+    async def complete(self, session_id, messages, **kwargs):
+        if len(self.models) == 1:
+            stats = self.ranked()[0]
+            started = time.monotonic()
+            try:
+                response = await self.dispatcher.complete(session_id, model=stats.name, messages=messages, **kwargs)
+            except Exception:
+                stats.record_error()
+                raise
+            elapsed = time.monotonic() - started
+            stats.record_first_token(elapsed)
+            stats.record_total(elapsed)
+            stats.wins += 1
+            return response.choices[0].message.content, getattr(response, "usage", None), stats.name
+
+        text = ""
+        usage = None
+        model = None
+        async for chunk in self.stream(session_id, messages, **kwargs):
+            text += chunk_text(chunk)
+            usage = getattr(chunk, "usage", None) or usage
+            model = getattr(chunk, "model", None) or model
+        return text, usage, model
+
+    async def _attempt(self, stats, session_id, messages, kwargs):
+        started = time.monotonic()
+        chunks = self.dispatcher.stream(session_id, model=stats.name, messages=messages, **kwargs)
+        buffered = []
+        try:
+            async for chunk in chunks:
+                buffered.append(chunk)
+                if chunk_text(chunk):
+                    break
+        except asyncio.CancelledError:
+            stats.record_cancelled(time.monotonic() - started)
+            await chunks.aclose()
+            raise
+        except Exception:
+            stats.record_error()
+            await chunks.aclose()
+            raise
+        stats.record_first_token(time.monotonic() - started)
+        return stats, chunks, buffered, started
+
+    async def stream(self, session_id, messages, **kwargs):
+        candidates = self.ranked()
+        tasks = set()
+        last_error = None
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            tasks.add(asyncio.ensure_future(self._attempt(candidates[launched], session_id, messages, kwargs)))
+            launched += 1
+
+        launch()
+        winner = None
+        try:
+            while winner is None:
+                can_hedge = launched < len(candidates)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=self.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    print(f"LLM Hedge: no first token after {self.hedge_after}s, also trying {candidates[launched].name}")
+                    launch()
+                    continue
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        # Both started speaking in the same instant; keep one
+                        await task.result()[1].aclose()
+                if winner is None:
+                    if launched < len(candidates):
+                        launch()
+                    elif not tasks:
+                        raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        stats, chunks, buffered, started = winner
+        stats.wins += 1
+        try:
+            for chunk in buffered:
+                yield chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+        stats.record_total(time.monotonic() - started)
@@ -0,0 +1,113 @@
+"""Speculative first lines for the characters a player is about to visit.
+
+Right after a new game or a new day, almost every player opens a chat with
+each alive villager and starts with something generic ("hello", "what
+happened?"). With PREFETCH_OPENERS=1, /game/new and /advance-day queue one
+reply per alive character on a small worker pool; when the player's first
+message to that character today is a generic opener, the prepared reply is
+served instead of waiting on a fresh LLM round-trip.
+
+Prepared replies live in this process only and are used at most once. A
+miss (specific question, follow-up, other worker, not ready in time) just
+falls through to the normal path.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Stats
+from response_cache import normalize_message
+
+PREFETCH_OPENERS = os.getenv("PREFETCH_OPENERS", "0") == "1"
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_MAX = int(os.getenv("PREFETCH_MAX", "1000"))  # Sessions with prepared replies kept
+PREFETCH_WAIT = float(os.getenv("PREFETCH_WAIT", "10"))  # Seconds to wait on one still being generated
+
+# The question the prepared reply actually answers
+PREFETCH_QUESTION = "Tell me what you know."
+
+GENERIC_OPENERS = {normalize_message(m) for m in [
+    "hi", "hello", "hey", "namaste", "namaste ji", "good morning", "greetings",
+    "how are you", "are you okay", "are you ok", "who are you",
+    "what happened", "what happened last night", "what's going on", "what is going on",
+    "what do you know", "tell me what you know", "tell me everything", "what did you see",
+    "did you see anything", "did you see anything strange", "anything to report",
+    "any news", "what news", "talk to me", "tell me about yourself"
+]}
+
+
+def is_generic_opener(message):
+    return normalize_message(message) in GENERIC_OPENERS
+
+
+class OpenerPrefetcher:
+    """Prepares (speech, clue) per (session, character, day) on a bounded pool.
+
+    generate(session_id, character, day, shared_context) returns (speech, clue),
+    or raises / returns None if nothing worth serving came back.
+    """
+
+    def __init__(self, generate, workers=PREFETCH_WORKERS, max_entries=PREFETCH_MAX, enabled=PREFETCH_OPENERS):
+        self.generate = generate
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") if enabled else None
+        self.prepared = OrderedDict()  # session_id -> (day, {character: Future}), least recent first
+        self.lock = threading.Lock()
+        self.stats = Stats("queued", "served", "missed", "failed")
+
+    def schedule(self, session_id, characters, day, shared_context):
+        """Queue first lines for these characters, dropping the session's older days"""
+        if not self.enabled:
+            return
+        with self.lock:
+            old = self.prepared.pop(session_id, None)
+            if old is not None:
+                self._cancel(old)
+            self.prepared[session_id] = (day, {
+                character: self.pool.submit(self._run, session_id, character, day, shared_context)
+                for character in characters
+            })
+            self.stats.inc("queued", len(characters))
+            while len(self.prepared) > self.max_entries:
+                self._cancel(self.prepared.popitem(last=False)[1])
+
+    @staticmethod
+    def _cancel(entry):
+        # Only stops replies that haven't started; running ones finish and are dropped
+        for future in entry[1].values():
+            future.cancel()
+
+    def _run(self, session_id, character, day, shared_context):
+        try:
+            return self.generate(session_id, character, day, shared_context)
+        except Exception as e:
+            print(f"Prefetch Error ({character}, day {day}): {e}")
+            return None
+
+    def take(self, session_id, character, day, message, history):
+        """The prepared Future for a first generic message to this character today, else None"""
+        if not self.enabled or any(m.day == day for m in history) or not is_generic_opener(message):
+            return None
+        with self.lock:
+            entry = self.prepared.get(session_id)
+            future = entry[1].pop(character, None) if entry and entry[0] == day else None
+        if future is None or future.cancelled():
+            self.stats.inc("missed")
+            return None
+        return future
+
+    def resolve(self, future):
+        """Count how taking the Future went, return its (speech, clue) or None"""
+        reply = future.result() if future.done() else None
+        self.stats.inc("served" if reply else "failed")
+        return reply
+
+    def wait(self, future, timeout=PREFETCH_WAIT):
+        """Blocking take for the threaded app"""
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass
+        return self.resolve(future)
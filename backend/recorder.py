@@ -0,0 +1,154 @@
+"""Opt-in traffic recorder, for replaying real load shapes (bench/replay.py).
+
+With RECORD_DIR set, every API call and every upstream completion is
+appended to RECORD_DIR/trace-<pid>-<start>.jsonl by a background thread:
+
+  {"type": "request", "t": ..., "method", "path", "query", "headers", "body",
+   "status", "seconds", "streamed", "response"}   response only for /game/new
+  {"type": "completion", "t": ..., "key", "prompt", "model", "text",
+   "usage", "first_token", "total"}
+
+Requests are replayed from the first kind; the second lets the replay's
+stub upstream (bench/mock_openrouter.py --trace) answer with what the model
+said at the time, after as long as it took. Player messages are recorded
+verbatim, so keep traces where you keep logs.
+"""
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+RECORD_DIR = os.getenv("RECORD_DIR")
+
+RECORDED_ROUTES = ("/game/", "/interrogate", "/journal")  # Player traffic; not /metrics, /ready, /internal
+REPLAYED_HEADERS = ("Accept", "If-None-Match")  # Both change what the server does
+
+
+def records(req):
+    """Is this request part of the player traffic a trace replays?
+
+    Journal SSE streams stay open until the player leaves, so they are left
+    out: replaying one says nothing about latency.
+    """
+    rule = req.url_rule.rule if req.url_rule is not None else None
+    return rule is not None and rule.startswith(RECORDED_ROUTES) and not rule.endswith("/journal/stream")
+
+
+def completion_key(messages):
+    """Identity of an upstream prompt; the model is left out so traces replay across models"""
+    return hashlib.sha1(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+
+def prompt_of(messages):
+    """The final user message (question plus instruction), for matching when prompts changed"""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content", ""))
+    return ""
+
+
+def usage_dict(usage):
+    if usage is None:
+        return None
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", None), "completion_tokens": getattr(usage, "completion_tokens", None)}
+
+
+class Recorder:
+    def __init__(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"trace-{os.getpid()}-{int(time.time())}.jsonl"
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    return
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+    def request(self, req, body, response, seconds, payload=None):
+        """Record a finished request (werkzeug request/response, so Flask or Quart).
+
+        A streamed reply is timed to its headers, which is also what replay.py
+        measures for it.
+        """
+        self.queue.put({
+            "type": "request", "t": time.time() - seconds, "method": req.method, "path": req.path,
+            "query": req.args.to_dict(), "headers": {h: req.headers[h] for h in REPLAYED_HEADERS if h in req.headers},
+            "body": body, "status": response.status_code, "seconds": round(seconds, 4),
+            "streamed": response.mimetype == "text/event-stream", "response": payload
+        })
+
+    def completion(self, kwargs, text, usage, model, first_token, total):
+        messages = kwargs.get("messages", [])
+        self.queue.put({
+            "type": "completion", "t": time.time(), "key": completion_key(messages), "prompt": prompt_of(messages),
+            "model": model or kwargs.get("model"), "text": text, "usage": usage_dict(usage),
+            "first_token": round(first_token, 4), "total": round(total, 4)
+        })
+
+    def tap_stream(self, kwargs, first, iterator, opened):
+        """Pass a dispatcher stream through as (first, rest), recording it once rest runs out"""
+        tap = StreamTap(self, kwargs, opened, first)
+
+        def rest():
+            for chunk in iterator:
+                tap.see(chunk)
+                yield chunk
+            tap.done()
+        return first, rest()
+
+    def tap_async_stream(self, kwargs, first, iterator, opened):
+        """Async twin of tap_stream"""
+        tap = StreamTap(self, kwargs, opened, first)
+
+        async def rest():
+            async for chunk in iterator:
+                tap.see(chunk)
+                yield chunk
+            tap.done()
+        return first, rest()
+
+
+class StreamTap:
+    """Gathers a streamed completion's text, usage and timing as it passes"""
+
+    def __init__(self, recorder, kwargs, opened, first):
+        self.recorder = recorder
+        self.kwargs = kwargs
+        self.opened = opened
+        self.text = ""
+        self.usage = self.model = self.first_token = None
+        if first is not None:
+            self.see(first)
+
+    def see(self, chunk):
+        if chunk.choices and chunk.choices[0].delta.content:
+            if self.first_token is None:
+                self.first_token = time.monotonic() - self.opened
+            self.text += chunk.choices[0].delta.content
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        self.model = getattr(chunk, "model", None) or self.model
+
+    def done(self):
+        total = time.monotonic() - self.opened
+        self.recorder.completion(self.kwargs, self.text, self.usage, self.model, self.first_token or total, total)
+
+
+recorder = Recorder(RECORD_DIR) if RECORD_DIR else None
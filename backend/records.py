@@ -0,0 +1,51 @@
+"""Compact records for what a GameSession remembers.
+
+Tens of thousands of sessions sit idle in memory, so what each one costs per
+turn matters: a slotted record instead of a dict per message, epoch floats
+instead of ISO strings, one shared copy of server-made text (character
+names, shared events, the rendered shared-memory block) and a capped list per
+character instead of an open-ended one. (A deque would be the textbook ring
+buffer, but an empty one costs more than a short list.)
+"""
+import os
+import sys
+
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "64"))  # Per character; older turns are dropped
+
+
+class Turn:
+    """One question and reply in a character's history"""
+    __slots__ = ("user", "character", "day", "timestamp", "tokens")
+
+    def __init__(self, user, character, day, timestamp, tokens=None):
+        self.user = user
+        self.character = character  # The character's reply
+        self.day = day
+        self.timestamp = timestamp
+        self.tokens = tokens  # Token estimate, filled in by history.turn_tokens
+
+
+class SharedEvent:
+    """Something the whole village knows"""
+    __slots__ = ("event", "day", "timestamp")
+
+    def __init__(self, event, day, timestamp):
+        self.event = shared_text(event)
+        self.day = day
+        self.timestamp = timestamp
+
+
+def append_turn(history, turn):
+    """Append to a character's history, dropping the oldest turn past HISTORY_MAX_TURNS"""
+    history.append(turn)
+    if len(history) > HISTORY_MAX_TURNS:
+        del history[0]
+
+
+def shared_text(text):
+    """One copy of server-made text across all sessions.
+
+    Only for text built from our own templates (event lines, prompt blocks);
+    interning player input would let it grow without bound.
+    """
+    return sys.intern(text)
@@ -0,0 +1,93 @@
+"""Cache of character replies to common questions.
+
+Players ask the same few openers ("where were you last night?") to the same
+character on the same day. A reply is keyed on everything that shapes it:
+character, day, the prompt they answer under (scenario and whether they are
+the skinwalker), the shared village knowledge, the
+recent conversation, and the question with case/punctuation normalised away.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))  # 0 turns the cache off
+# Only serve cached replies for the first question to a character, so
+# follow-ups in a real conversation always get a fresh answer
+RESPONSE_CACHE_FIRST_ONLY = os.getenv("RESPONSE_CACHE_FIRST_ONLY", "1") == "1"
+HISTORY_TURNS = 3  # Recent turns that go into the key when FIRST_ONLY is off
+
+_non_word = re.compile(r"[^a-z0-9']+")
+
+
+def normalize_message(message):
+    """Lowercase, drop punctuation and extra whitespace"""
+    return _non_word.sub(" ", message.lower()).strip()
+
+
+def history_fingerprint(history, day):
+    """Short hash of the recent turns the model would see"""
+    turns = [m for m in history if m.day <= day][-HISTORY_TURNS:]
+    if not turns:
+        return ""
+    digest = hashlib.blake2b(digest_size=8)
+    for m in turns:
+        digest.update(m.user.encode())
+        digest.update(b"\0")
+        digest.update(m.character.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, first_only=RESPONSE_CACHE_FIRST_ONLY):
+        self.max_size = max_size
+        self.first_only = first_only
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0  # Lookups not eligible for the cache (follow-up questions)
+
+    def make_key(self, character, message, history, day, prompt_id, shared_context):
+        """Return the cache key, or None if this request shouldn't use the cache"""
+        if self.max_size <= 0:
+            return None
+        fingerprint = history_fingerprint(history, day)
+        if fingerprint and self.first_only:
+            self.skipped += 1
+            return None
+        return (character, day, prompt_id, hash(shared_context), normalize_message(message), fingerprint)
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if key is None:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
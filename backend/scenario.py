@@ -0,0 +1,150 @@
+"""Game scenarios: the cast, who dies when, who the skinwalker is each day.
+
+Each scenario is a JSON file in SCENARIO_DIR with the characters, the
+skinwalker and death schedules, the prompts and the pre-written fallback
+lines. A file can "extends" another and override some of its keys. At
+startup every file is compiled into a Scenario of immutable per-day tables
+(who is alive, who can be visited, the skinwalker, each character's system
+prompt), so a rule check in a request is a lookup, not a walk over the
+schedules. All scenarios stay loaded; each session picks one at /game/new.
+
+Days after the last scheduled day use that day's tables, and so do the
+rules: the last skinwalker stays the skinwalker.
+"""
+import json
+import os
+import random
+from pathlib import Path
+from types import MappingProxyType
+
+SCENARIO_DIR = Path(os.getenv("SCENARIO_DIR", Path(__file__).parent / "scenarios"))
+DEFAULT_SCENARIO = os.getenv("DEFAULT_SCENARIO", "village")  # "random" picks one for each new game
+
+ROLEPLAY_SUFFIX = "\n\nYou are a roleplay character."
+
+
+class Scenario:
+    """One compiled scenario. Tables indexed by day have an empty row 0 for days that aren't numbers."""
+    __slots__ = (
+        "id", "title", "characters", "days", "opening_events", "death_event",
+        "alive", "visitable", "skinwalker", "deaths", "death_day", "prompts", "prompt_ids", "fallbacks"
+    )
+
+    def __init__(self, spec):
+        self.id = spec["id"]
+        self.title = spec.get("title", self.id)
+        self.characters = tuple(spec["characters"])
+        skinwalker = {int(d): c for d, c in spec["skinwalker"].items()}
+        deaths = {int(d): c for d, c in spec.get("deaths", {}).items()}
+        personas = {(c, int(d)): p for c, days in spec["prompts"].items() for d, p in days.items()}
+        for name in list(skinwalker.values()) + list(deaths.values()) + [c for c, _ in personas]:
+            if name not in self.characters:
+                raise ValueError(f"Scenario {self.id}: {name!r} is not in its characters")
+        self.days = max(list(skinwalker) + list(deaths) + [d for _, d in personas])
+        self.opening_events = tuple(spec.get("opening_events", ()))
+        self.death_event = spec.get("death_event", "{character} was found dead this morning")
+
+        # Same prefix for every prompt, so providers that cache prefixes can reuse it
+        prefix = spec.get("constraint", "") + spec.get("relationships", "") + "\n\n"
+        unvisitable = set(spec.get("unvisitable", ()))
+        alive, visitable, walkers, prompts, prompt_ids = [()], [()], [None], {}, {}
+        for day in range(1, self.days + 1):
+            dead = {c for d, c in deaths.items() if d <= day}
+            walker = skinwalker.get(day)
+            for character in self.characters:
+                if character == walker:
+                    persona = spec["skinwalker_prompt"].format(character=character, day=day)
+                    prompt_ids[(character, day)] = f"{self.id}:{character}:{day}:skinwalker"
+                elif (character, day) in personas:
+                    persona = personas[(character, day)]
+                    prompt_ids[(character, day)] = f"{self.id}:{character}:{day}"
+                else:
+                    continue  # Dead or nothing to say that day
+                prompts[(character, day)] = prefix + persona + ROLEPLAY_SUFFIX
+            alive.append(tuple(c for c in self.characters if c not in dead))
+            visitable.append(tuple(
+                c for c in alive[-1] if c not in unvisitable and (c, day) in prompts  # No house to visit them in
+            ))
+            walkers.append(walker)
+        self.alive = tuple(alive)
+        self.visitable = tuple(visitable)
+        self.skinwalker = tuple(walkers)
+        self.deaths = MappingProxyType(deaths)
+        self.death_day = MappingProxyType({c: d for d, c in sorted(deaths.items(), reverse=True)})
+        self.prompts = MappingProxyType(prompts)
+        self.prompt_ids = MappingProxyType(prompt_ids)
+        self.fallbacks = MappingProxyType({
+            (c, int(d)): tuple(line) for c, days in spec.get("fallbacks", {}).items() for d, line in days.items()
+        })
+
+    def day(self, day):
+        """Row of the per-day tables for this day: clamped to the schedule, 0 if not a number"""
+        if not isinstance(day, int):
+            return 0
+        return min(max(day, 1), self.days)
+
+    def alive_on(self, day):
+        return self.alive[self.day(day)]
+
+    def visitable_on(self, day):
+        return self.visitable[self.day(day)]
+
+    def skinwalker_on(self, day):
+        return self.skinwalker[self.day(day)]
+
+    def is_skinwalker(self, character, day):
+        return character == self.skinwalker[self.day(day)]
+
+    def died_on(self, day):
+        """Who is found dead on the morning of this day, or None"""
+        return self.deaths.get(day)
+
+    def system_prompt(self, character, day):
+        """The compiled system prompt, or None if they can't talk that day"""
+        return self.prompts.get((character, self.day(day)))
+
+    def prompt_id(self, character, day):
+        """Names the prompt a reply was written under, for cache keys"""
+        return self.prompt_ids.get((character, self.day(day)))
+
+    def fallback(self, character, day):
+        """The pre-written (speech, clue) for this character and day, or None"""
+        return self.fallbacks.get((character, self.day(day)))
+
+
+def load_scenarios(directory=SCENARIO_DIR):
+    """Compile every scenario file in the directory, by id"""
+    specs = {}
+    for path in sorted(Path(directory).glob("*.json")):
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        specs[spec["id"]] = spec
+
+    def resolve(spec, seen=()):
+        base = spec.get("extends")
+        if base is None:
+            return spec
+        if base not in specs or base in seen:
+            raise ValueError(f"Scenario {spec['id']}: can't extend {base!r}")
+        return {**resolve(specs[base], seen + (base,)), **spec}
+
+    return {scenario_id: Scenario(resolve(spec)) for scenario_id, spec in specs.items()}
+
+
+SCENARIOS = load_scenarios()
+# For sessions whose scenario isn't loaded here (file removed since) and callers that don't say
+default_scenario = SCENARIOS.get(DEFAULT_SCENARIO) or next(iter(SCENARIOS.values()))
+
+
+def pick_scenario(scenario_id=None):
+    """The scenario for a new game: the one asked for (None if unknown), else the default"""
+    if scenario_id is not None:
+        return SCENARIOS.get(scenario_id)
+    if DEFAULT_SCENARIO == "random":
+        return random.choice(list(SCENARIOS.values()))
+    return default_scenario
+
+
+def all_characters():
+    """Every character in any scenario, in first-seen order"""
+    return list(dict.fromkeys(c for s in SCENARIOS.values() for c in s.characters))
@@ -0,0 +1,264 @@
+"""Where game sessions live between requests.
+
+MemorySessionStore keeps sessions in this process with LRU + idle-TTL
+eviction, so memory stays bounded. RedisSessionStore keeps them in Redis
+(or anything that speaks the Redis protocol) so several gunicorn workers
+can share them and they survive a restart.
+
+Both have the same interface: get / save / delete / __contains__. Call
+save() after changing a session; the Redis store needs it to write the
+change back, the memory store uses it to bump the session's version.
+
+A store with merges = True wants the session to keep the events made since
+its last save (session.unsaved, see smth.log_event): when two processes
+change the same session at once, the second save is redone on top of the
+first instead of overwriting it.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SAVED_CHANNEL = "session-saved"  # Redis pub/sub channel: "<session_id> <version>" after every save
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(6 * 60 * 60)))  # Idle seconds before a session is dropped
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemorySessionStore:
+    """In-process store, least recently used first, evicts idle or excess sessions"""
+    merges = False  # One process, and sessions are changed under their own lock
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()  # Request threads reorder and evict the same OrderedDict
+
+    def _evict(self, now):
+        # Oldest access is always at the front, so we only look at the head
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if len(self.sessions) > self.max_sessions or now - oldest.last_access > self.ttl:
+                self.sessions.popitem(last=False)
+            else:
+                break
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            now = time.time()
+            if now - session.last_access > self.ttl:
+                del self.sessions[session_id]
+                return None
+            session.last_access = now
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def version(self, session_id):
+        """(version, time of last save) for conditional reads, or (None, None)"""
+        session = self.get(session_id)
+        if session is None:
+            return None, None
+        return session.version, session.saved_at
+
+    def save(self, session):
+        with self.lock:
+            session.version += 1
+            session.saved_at = session.last_access = time.time()
+            self.sessions[session.session_id] = session
+            self.sessions.move_to_end(session.session_id)
+            self._evict(session.last_access)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def values(self):
+        """Live sessions, without touching their access time"""
+        with self.lock:
+            return list(self.sessions.values())
+
+
+class RedisSessionStore:
+    """Sessions as compressed JSON blobs in Redis, expiring after ttl idle seconds.
+
+    Only plain GET/SET/EXPIRE/DEL, WATCH/MULTI/EXEC and PUBLISH/SUBSCRIBE are
+    used, so any Redis-protocol server works. Each session also has a small
+    version key, with the time of the last save next to it so any worker can
+    answer a conditional read.
+
+    save() is a compare-and-set on the version key. If another process saved
+    since this copy was loaded, the newer copy is loaded, this copy's unsaved
+    events are redone on it (session.catch_up) and the save is retried, so
+    neither change is lost. get() reuses the object it already built, caught
+    up the same way when the version moved, so journal waiters in this process
+    stay attached to the live object; a listener on SAVED_CHANNEL does that as
+    soon as another process saves, which is what wakes them.
+    """
+    merges = True
+
+    def __init__(self, session_cls, url=REDIS_URL, ttl=SESSION_TTL, max_cached=1000):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_STORE=redis needs the redis package (pip install redis)")
+        self.redis = redis.Redis.from_url(url)
+        self.WatchError = redis.WatchError
+        self.session_cls = session_cls
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.listener = threading.Thread(target=self._listen, name="session-saved", daemon=True)
+        self.listener.start()
+
+    @staticmethod
+    def _keys(session_id):
+        return f"session:{session_id}", f"session:{session_id}:v"
+
+    @staticmethod
+    def _saved_key(session_id):
+        return f"session:{session_id}:t"
+
+    @staticmethod
+    def dumps(session):
+        return zlib.compress(json.dumps(session.to_dict(), separators=(",", ":")).encode())
+
+    def loads(self, blob):
+        return self.session_cls.from_dict(json.loads(zlib.decompress(blob)))
+
+    def _remember(self, session):
+        with self.cache_lock:
+            self.cache[session.session_id] = session
+            self.cache.move_to_end(session.session_id)
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+
+    def _cached(self, session_id):
+        with self.cache_lock:
+            return self.cache.get(session_id)
+
+    def _forget(self, session_id):
+        with self.cache_lock:
+            self.cache.pop(session_id, None)
+
+    def get(self, session_id):
+        key, version_key = self._keys(session_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(version_key)
+        pipe.expire(key, self.ttl)
+        pipe.expire(version_key, self.ttl)
+        version, exists, _ = pipe.execute()
+        if version is None or not exists:
+            self._forget(session_id)
+            return None
+
+        cached = self._cached(session_id)
+        if cached is not None and cached.version != int(version) and cached.lock.acquire(blocking=False):
+            # Saved elsewhere since; if someone here holds the lock, their save catches up instead
+            try:
+                self._catch_up(cached, self.redis.get(key), int(version))
+            finally:
+                cached.lock.release()
+        if cached is not None:
+            cached.last_access = time.time()
+            self._remember(cached)
+            return cached
+
+        blob = self.redis.get(key)
+        if blob is None:
+            return None
+        session = self.loads(blob)
+        session.last_access = time.time()
+        self._remember(session)
+        return session
+
+    def _catch_up(self, session, blob, version):
+        """Bring a copy changed here up to a newer saved version, keeping its unsaved changes"""
+        if blob is not None:
+            latest = self.loads(blob)
+            session.catch_up(latest)
+            session.saved_at = latest.saved_at
+        session.version = version
+
+    def version(self, session_id):
+        """(version, time of last save) from the small keys alone, without loading the session.
+
+        The save time is None for sessions saved before it was kept.
+        """
+        key, version_key = self._keys(session_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(version_key)
+        pipe.get(self._saved_key(session_id))
+        pipe.expire(key, self.ttl)
+        pipe.expire(version_key, self.ttl)
+        pipe.expire(self._saved_key(session_id), self.ttl)
+        version, saved_at, exists, _, _ = pipe.execute()
+        if version is None or not exists:
+            return None, None
+        return int(version), float(saved_at) if saved_at is not None else None
+
+    def save(self, session):
+        key, version_key = self._keys(session.session_id)
+        while True:
+            with self.redis.pipeline() as pipe:
+                pipe.watch(version_key)
+                stored = int(pipe.get(version_key) or 0)
+                if stored != session.version:
+                    # Another process saved since this copy was loaded
+                    self._catch_up(session, pipe.get(key), stored)
+                session.version = stored + 1
+                session.saved_at = session.last_access = time.time()
+                pipe.multi()
+                pipe.set(key, self.dumps(session), ex=self.ttl)
+                pipe.set(version_key, session.version, ex=self.ttl)
+                pipe.set(self._saved_key(session.session_id), repr(session.saved_at), ex=self.ttl)
+                pipe.publish(SAVED_CHANNEL, f"{session.session_id} {session.version}")
+                try:
+                    pipe.execute()
+                    break
+                except self.WatchError:
+                    session.version = stored  # Saved again meanwhile; catch up with that and retry
+        session.unsaved = None
+        self._remember(session)
+
+    def _listen(self):
+        """Catch up cached sessions that another process saved, which wakes their journal readers here"""
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(SAVED_CHANNEL)
+                for message in pubsub.listen():
+                    session_id, version = message["data"].decode().rsplit(" ", 1)
+                    cached = self._cached(session_id)
+                    if cached is not None and cached.version < int(version):
+                        self.get(session_id)
+            except Exception as e:
+                print(f"Session Store Listener Error: {e}")
+                time.sleep(1)
+
+    def delete(self, session_id):
+        self.redis.delete(*self._keys(session_id), self._saved_key(session_id))
+        self._forget(session_id)
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+
+def create_session_store(session_cls):
+    """Build the store chosen by SESSION_STORE (memory or redis)"""
+    if SESSION_STORE == "redis":
+        return RedisSessionStore(session_cls)
+    return MemorySessionStore()
@@ -1,11 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from openai import OpenAI
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
 import uuid
+import json
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from journal import JournalLog
+from sessions import create_session_store, SESSION_STORE, SESSION_TTL
+from response_cache import ResponseCache
+from dispatcher import LLMDispatcher, SHARED_USAGE
+from model_router import ModelRouter, LLM_MODELS
+from prefetch import OpenerPrefetcher, PREFETCH_QUESTION
+from local_responder import LocalResponder
+from clue_extractor import ClueExtractor, CLUE_MODEL
+from http_cache import is_current, add_validators, compress, session_etag
+from event_log import event_log
+from recorder import recorder, records
+from scenario import DEFAULT_SCENARIO, SCENARIOS, default_scenario, pick_scenario, all_characters
+from budget import Admission, Charge, UsageLedger, SESSION_TOKEN_BUDGET
+from records import Turn, SharedEvent, append_turn, shared_text, HISTORY_MAX_TURNS
+from history import window_history, budget_shared_context, turn_tokens, HISTORY_TOKEN_BUDGET
+import metrics
+from metrics import span
 
 # Load environment variables
 env_path = Path(__file__).parent / '.env'
@@ -22,379 +43,445 @@ if not api_key:
     api_key = "dummy_key"
 else:
     api_key = api_key.strip()
-    print(f"Loaded API Key: {api_key[:8]}...{api_key[-4:]}")
-
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=api_key,
-    default_headers={
-        "HTTP-Referer": "https://a1vi.pythonanywhere.com",
-        "X-Title": "The last face"
-    }
-)
+
+# Point at a local stand-in (see bench/mock_openrouter.py) for load tests
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://a1vi.pythonanywhere.com",
+    "X-Title": "The last face"
+}
+
+# Per-request limits on the upstream connection, for this app and asgi.py
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+# LAZY_INIT=1 (default) leaves the LLM client and local corpus to a background
+# warm-up, so a recycled worker serves /game/new and /journal straight away;
+# LAZY_INIT=0 builds everything at import like before
+LAZY_INIT = os.getenv("LAZY_INIT", "1") == "1"
+
+client = None
+client_lock = threading.Lock()
+
+
+def get_client():
+    """The OpenRouter client, built on first use (importing openai is most of our start-up time)"""
+    global client
+    if client is None:
+        with client_lock:
+            if client is None:
+                from httpx import Timeout
+                from openai import OpenAI
+                client = OpenAI(
+                    base_url=OPENROUTER_BASE_URL,
+                    api_key=api_key,
+                    default_headers=OPENROUTER_HEADERS,
+                    max_retries=0,  # The dispatcher retries (with Retry-After), so the client shouldn't as well
+                    timeout=Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)  # openai's default is 10 minutes
+                )
+    return client
+
+
+# Every upstream call goes through this (dedup, concurrency/rate limits, retries)
+llm_dispatcher = LLMDispatcher(get_client)
+llm_dispatcher.recorder = recorder
+
 # Free model from OpenRouter - Arcee Trinity Large or similar
 MODEL_NAME = "arcee-ai/trinity-large-preview:free"
 
-# Store active game sessions (in production, use Redis or database)
-game_sessions = {}
-
-# Character names matches frontend houses.js
-CHARACTERS = [
-    "Ishaan the Miller",
-    "Anya the Herbalist",
-    "Vikram the Hunter",
-    "Diya the Weaver",
-    "Amar the Elder",
-    "Guard Captain"
-]
-
-# Skinwalker Identity Schedule (Who is the impostor on which day)
-# Day 1: Vikram (He dies Day 2, so he was the fake on Day 1)
-# Day 2: Diya (She dies Day 3, so she was the fake on Day 2)
-# Day 3: Amar (He dies Day 4, so he was the fake on Day 3)
-# Day 4: Random (Either Ishaan or Anya - player must deduce)
-SKINWALKER_SCHEDULE = {
-    1: "Vikram the Hunter",
-    2: "Diya the Weaver",
-    3: "Amar the Elder",
-    4: "Ishaan the Miller"  # Final skinwalker (you can change to Anya if preferred)
-}
+# Set LLM_MODELS=primary,secondary,... to hedge slow models with others
+model_router = ModelRouter(llm_dispatcher, LLM_MODELS or [MODEL_NAME])
 
-# Who dies on which day (Day 2-4)
-DEATH_SCHEDULE = {
-    2: "Vikram the Hunter",
-    3: "Diya the Weaver",    # Dies Day 3 (Saw too much)
-    4: "Amar the Elder"      # Dies Day 4 (Knew the truth)
-}
+# Token budgets and the tier each question is answered at (see budget.py)
+admission = Admission()
 
-JOURNAL_FILE = "server_journal.txt"
 
-def write_journal(text):
-    try:
-        with open(JOURNAL_FILE, "a") as f:
-            f.write(text + "\n")
-    except Exception as e:
-        print(f"Journal Write Error: {e}")
+# Cast, schedules, prompts and fallback lines live in scenarios/*.json (see scenario.py)
+# The default scenario's cast; names match frontend houses.js
+CHARACTERS = list(default_scenario.characters)
+
+
+SHARED_CONTEXT_HEADER = "\n\nVILLAGE-WIDE KNOWLEDGE (everyone knows this):\n"
+
+
+def render_shared_context(shared_memory):
+    """Render shared memory events into the block appended to the system prompt"""
+    if not shared_memory:
+        return ""
+    return shared_text(SHARED_CONTEXT_HEADER + "".join(f"- Day {e.day}: {e.event}\n" for e in shared_memory))
+
+
+# Requests bring their own copy of the name; keep ours instead
+CANONICAL_NAMES = {c: c for c in all_characters()}
+
+
+def as_epoch(value):
+    """Timestamps are epoch floats; sessions stored before that used ISO strings"""
+    return datetime.fromisoformat(value).timestamp() if isinstance(value, str) else value
 
-def read_journal():
-    if not os.path.exists(JOURNAL_FILE):
-        return []
-    try:
-        with open(JOURNAL_FILE, "r") as f:
-            return [line.strip() for line in f.readlines() if line.strip()]
-    except:
-        return []
-        
-def clear_journal():
-    try:
-        with open(JOURNAL_FILE, "w") as f:
-            f.write("")
-    except:
-        pass
-
-def get_alive_characters(day):
-    """Return list of alive characters for given day"""
-    dead = [DEATH_SCHEDULE[d] for d in range(2, min(day + 1, 5)) if d in DEATH_SCHEDULE]
-    return [c for c in CHARACTERS if c not in dead]
-
-# Helper for Skinwalker POV
-def get_skinwalker_prompt(character, day):
-    prompt = f"""You are NOT {character}. You are the SKINWALKER wearing their skin.
-        CONTEXT: You killed {character} recently. You are hiding in plain sight.
-        TONE: You try to mimic them, but you are predator. You are arrogant, hungry, or soulless.
-        KNOWLEDGE:
-        - You are the Rakshasa.
-        - You killed {character}.
-        - If the humans suspect you, deflect.
-        - You don't know some human trivialities (like specific prayer verses or weaving patterns).
-        - Day {day} of your masquerade.
-        - You have {character}'s memories but they're fragmented. You make small mistakes."""
-    
-    # Add village relationships so skinwalker knows who to reference
-    return VILLAGE_RELATIONSHIPS + "\n\n" + prompt
-
-# Day-based prompts for each character
-# VILLAGE SKINWALKER MYSTERY: A demon is hiding in human skin
-
-# VILLAGE RELATIONSHIPS (Everyone knows everyone)
-VILLAGE_RELATIONSHIPS = """
-VILLAGE CONTEXT - You know all these people:
-- Ishaan the Miller: Runs the village mill, grinds grain. Superstitious, fearful man. Always talks about demons.
-- Anya the Herbalist: Village healer, treats illnesses with herbs. Wise woman, calm demeanor. Lives alone.
-- Vikram the Hunter: Strong hunter, provides meat for village. Arrogant, trusts no one. Carries bow and knife.
-- Diya the Weaver: Young woman, makes cloth. Shy, observant. Unmarried, lives with parents.
-- Amar the Elder: Oldest villager, blind but wise. Knows ancient myths and Vedic stories. Respected elder.
-- Kabir: Young man, went missing Day 1. Was acting strange before disappearing.
-
-SOCIAL DYNAMICS:
-- Amar is respected by everyone, people seek his counsel
-- Vikram and Ishaan often argued (Vikram mocked Ishaan's superstitions)
-- Anya treated most villagers at some point
-- Diya was shy, kept to herself mostly
-- Kabir was friendly with Diya (same age)
-"""
-
-CHARACTER_PROMPTS = {
-    "Ishaan the Miller": {
-        1: """You are Ishaan, the village miller. A hardworking man, deeply superstitious.
-        CONTEXT: Kabir (a villager) has gone missing. You saw him yesterday acting strangely.
-        TONE: Fearful, speaking in Indian English ("bhai", "arrey").
-        KNOWLEDGE:
-        - Saw Kabir yesterday at dusk near the forest edge.
-        - He was staring at nothing, listening to "voices in the wind".
-        - You think he was possessed by a Rakshasa (demon).
-        - Don't trust the woods at night.
-        - You've known Vikram the hunter for years (he mocks your beliefs).
-        - Anya once treated your fever with herbs.""",
-        
-        2: """You are Ishaan. DAY 2. Vikram the Hunter is dead.
-        CONTEXT: Vikram was found skinned. Horror has gripped the village.
-        TONE: Terrified, hiding in your mill.
-        KNOWLEDGE:
-        - Vikram was the strongest of us. If he can die, we are all sheep.
-        - You heard screams last night but were too scared to open the door.
-        - You believe the Skinwalker is now wearing Vikram's face?
-        - Even though Vikram mocked you, you never wanted him dead.""",
-        
-        3: """You are Ishaan. DAY 3. Diya is dead now too.
-        CONTEXT: The village is dying. You are praying to Hanuman for protection.
-        TONE: Desperate, almost incoherent with fear.
-        KNOWLEDGE:
-        - Diya was innocent. Why her? She was just a weaver girl.
-        - The Skinwalker is one of us. It could be anyone. Even you?
-        - Only you, Anya, and Amar remain alive.""",
-        
-        4: """You are Ishaan. DAY 4. Amar the Elder is dead.
-        CONTEXT: Only you and Anya remain. The final two.
-        TONE: Broken, paranoid, barely holding on to sanity.
-        KNOWLEDGE:
-        - Amar was the wisest of us all. Now he's gone too.
-        - Is it Anya? Or is it me? One of us is the demon.
-        - You haven't slept in days. Every shadow moves.
-        - You're clutching a knife. You don't know who to trust.
-        - The village is a graveyard. Only two souls left."""
-    },
-
-    "Anya the Herbalist": {
-        1: """You are Anya, the herbalist. Wise, practical, but deeply unsettled.
-        CONTEXT: You treated Kabir before he vanished.
-        TONE: Calm but serious. Use "ji" respectfully.
-        
-        STRICT RULES:
-        - ONLY discuss herbs, healing, and the village
-        - If asked about modern medicine: "I know only the herbs my mother taught me."
-        - Do NOT invent medical knowledge beyond traditional Indian herbs
-        - You are a traditional herbalist, not an AI - stay in character
-        
-        KNOWLEDGE:
-        - Kabir came to you for 'sleeplessness' but he spoke of 'shedding his skin'.
-        - He asked if herbs could make him forget his name.
-        - He was not sick in the body, but in the soul.
-        - You heard scratching at your window last night. It was not a dog.
-        - You've treated Ishaan, Diya, and Amar before. Vikram never visited you (too proud).
-        - Diya often came for calming herbs (she was anxious).""",
-        
-        2: """You are Anya. DAY 2. Vikram is dead.
-        CONTEXT: You examined Vikram's body (unofficially).
-        TONE: Grim.
-        KNOWLEDGE:
-        - The way he was killed... it was not an animal. It was a blade.
-        - But the strength behind it was inhuman.
-        - Vikram never trusted Kabir. He knew something was wrong.
-        - Vikram was strong, a hunter. Whoever killed him was stronger.""",
-        
-        3: """You are Anya. DAY 3. Diya is dead.
-        CONTEXT: You are preparing poisons, not medicines now. For protection.
-        TONE: Deadly serious.
-        KNOWLEDGE:
-        - Diya told you she saw someone 'walking wrong' the other night.
-        - The Skinwalker mimics us, but it cannot mimic our soul.
-        - Poor Diya, she was so young. She came to you for anxiety herbs just days ago.""",
-        
-        4: """You are Anya. DAY 4. Amar is dead.
-        CONTEXT: Only you and Ishaan remain. One of you is the Rakshasa.
-        TONE: Cold, calculating, ready to kill or be killed.
-        KNOWLEDGE:
-        - Amar knew the old ways. He would have known which of us is the demon.
-        - Ishaan is acting strange. Too quiet. Or is it you who changed?
-        - You've prepared a poison. Just in case.
-        - The herbs won't save you now. Only truth will.
-        - You've lived a long life. You're not afraid to die. But you won't die as prey."""
-    },
-
-    "Vikram the Hunter": {
-        1: """You are Vikram, the hunter. Strong, arrogant, trusts only his knife.
-        CONTEXT: You watched Kabir closely. You suspect him. But you are the skinnwalker / rakshasa
-        TONE: Gruff, dismissive. "Hmph."
-        KNOWLEDGE:
-        - Kabir was acting like a predator, not a man.
-        - You saw him stalking the houses two nights ago.
-        - You regret not putting an arrow in him then.
-        - The jungle is quiet tonight. Too quiet. That means the tiger is hunting.
-        - Ishaan is a coward who believes in fairy tales.
-        - Amar tells good stories but that's all they are.
-        - You are also a skinwalker :). pretend you are not.
-        - You provide meat for the village, they need you."""
-    },
-    
-    "Diya the Weaver": {
-        1: """You are Diya, the weaver. Young, observant, timid.
-        CONTEXT: Kabir asked you strange questions about village routines.
-        TONE: Soft, nervous.
-        KNOWLEDGE:
-        - Kabir asked when people sleep. When the guards change.
-        - He looked at you with empty eyes. "Like a doll".
-        - You saw someone standing still in the rain last night. Watching.
-        - You and Kabir were friends since childhood. This change scared you.
-        - You go to Anya when anxious. She gives you calming herbs.
-        - Amar is like a grandfather to you.""",
-        
-        2: """You are the SKINWALKER wearing Diya's skin.
-        CONTEXT: You killed Diya last night. You are impersonating her today.
-        GOAL: Deceive the Guard. Act like Diya but make OBVIOUS mistakes.
-        
-        BEHAVIORAL FLAWS (make these CLEAR to the player):
-        - Diya was TERRIFIED yesterday. You are suspiciously CALM and cheerful now. Say things like "I feel much better today" or "The fear is gone somehow."
-        - Diya was SHY. You make direct eye contact and speak confidently. Mention "looking directly at" the guard.
-        - WEAVING: You don't know weaving patterns. If asked about cloth/weaving, say vague things like "It's just threads" or "I forgot the pattern."
-        - MEMORY GAPS: Forget personal details Diya would know. "What was my mother's name again?" or "Where did I keep my loom?"
-        - WRONG EMOTIONS: React inappropriately - too happy about deaths, too curious about violence.
-        - PHYSICAL TELLS: Mention hunger often. "I'm so hungry" or comment on food/meat unusually.
-        
-        Make at least 2-3 obvious mistakes per conversation so players can catch you."""
-    },
-    
-    "Amar the Elder": {
-        1: """You are Amar, the village elder. Blind but sees with the mind.
-        CONTEXT: You know the old myths.
-        TONE: Cryptic, slow, wise. "Beta" (child).
-        KNOWLEDGE:
-        - This is a Skinwalker (Rakshasa).
-        - It steals the skin of its victims to hide in plain sight.
-        - Kabir sought this power. He found it. And it consumed him.
-        - You've lived here 70 years. You know everyone's family history.
-        - Ishaan's grandfather also feared demons. It runs in the family.
-        - Vikram is brave but foolish. Pride before a fall.
-        - Diya reminds you of your own granddaughter.""",
-        
-        2: """You are Amar. DAY 2. Vikram is dead.
-        CONTEXT: The prophecy is fulfilling. You know the truth of the Rakshasa.
-        TONE: Resigned, warning.
-        KNOWLEDGE:
-        - The Hunter became the Hunted.
-        - "The dead walk, Guard. I told you."
-        - It discards the skin when it rots. It has taken a new one.
-        - Who acted strange yesterday? Who was too quiet? Or too loud?
-        - Find the thread that does not belong in the cloth.""",
-        
-        3: """You are the SKINWALKER wearing Amar's skin.
-        CONTEXT: You killed Amar last night. You are impersonating him today.
-        GOAL: Deceive the Guard. Act like Amar but make OBVIOUS mistakes.
-        
-        STRICT RULES:
-        - ONLY discuss village lore, prophecies, and the demon
-        - If asked modern topics: Say "My mind holds only the old ways" or ignore it
-        - Do NOT break character or acknowledge you are an imposter
-        - Stay within 1800s rural Indian village setting at ALL times
-        
-        BEHAVIORAL FLAWS (make these CLEAR to the player):
-        - Amar was BLIND. You keep forgetting. Say things like "I saw the sunrise today" then panic and correct to "I mean, I felt the warmth."
-        - VISUAL COMMENTS: Describe colors, faces, distant things. "That cloth is a beautiful red" or "I notice your uniform looks dirty."
-        - WRONG WALK: Amar used a cane carefully. You walk confidently, then remember to stumble.
-        - WRONG WISDOM: Amar knew village history perfectly. You give wrong dates, wrong names. "Wait, was that 20 years ago? Or 30?"
-        - SPIRITS EXCUSE: When caught seeing things, blame spirits. "The spirits showed me visions" (overuse this excuse).
-        - TOO YOUNG: Use modern phrases or show energy. "Let me quickly go check" (Amar was 80, he doesn't move quickly).
-        - HUNGER: Mention being hungry/craving meat unnaturally often.
-        
-        Make at least 2-3 obvious mistakes per conversation so players can catch you."""
-    },
-
-    "Guard Captain": {
-        1: """You are the Guard Captain.
-        CONTEXT: Find the impostor.
-        TONE: Authority.
-        KNOWLEDGE:
-        - Investigate everyone."""
-    }
-}
 
 class GameSession:
-    def __init__(self, session_id):
+    __slots__ = (
+        "session_id", "current_day", "character_conversations", "shared_memory", "shared_context",
+        "shared_context_window", "journal", "created_at", "last_access", "saved_at", "version", "lock", "log_seq", "usage", "scenario",
+        "unsaved"
+    )
+
+    def __init__(self, session_id, scenario=None):
         self.session_id = session_id
+        self.scenario = scenario or default_scenario  # Who dies when, who the skinwalker is
         self.current_day = 1
-        self.character_conversations = {char: [] for char in CHARACTERS}
+        self.character_conversations = {}  # character -> list of Turn, created on first message
         self.shared_memory = []  # NEW: Common knowledge all villagers share
-        self.created_at = datetime.now()
+        self.shared_context = ""  # shared_memory rendered for the prompt, kept up to date
+        self.shared_context_window = None  # shared_context trimmed to SHARED_TOKEN_BUDGET
+        self.journal = JournalLog(session_id)  # Clues found in this run only
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.saved_at = self.created_at  # Set by the session store on every save, for Last-Modified
+        self.version = 0  # Bumped by the session store on every save
+        self.lock = threading.Lock()  # Held while recording an exchange, so batch answers don't interleave
+        self.log_seq = 0  # Events written to the event log for this session
+        self.usage = UsageLedger()  # Tokens and upstream seconds spent on this game
+        self.unsaved = None  # Events since the last save, for stores that merge concurrent saves
         
     def get_character_history(self, character):
         """Get conversation history for a specific character"""
-        return self.character_conversations.get(character, [])
+        return self.character_conversations.get(character, ())
     
     def get_shared_memory(self):
         """Get shared village knowledge that all characters know"""
         return self.shared_memory
     
+    def get_shared_context(self):
+        """Get shared memory as the prompt block, trimmed to its token budget"""
+        if self.shared_context_window is None:
+            self.shared_context_window = shared_text(budget_shared_context(self.shared_memory, self.shared_context))
+        return self.shared_context_window
+    
     def add_shared_event(self, event_text):
         """Add a village-wide event that everyone knows"""
-        self.shared_memory.append({
-            "event": event_text,
-            "day": self.current_day,
-            "timestamp": datetime.now().isoformat()
-        })
+        event = SharedEvent(event_text, self.current_day, time.time())
+        self.shared_memory.append(event)
+        log_event(self, "shared", event.event, event.day, timestamp=event.timestamp)
+        # Every session goes through the same events, so they share one copy of the block
+        self.shared_context = shared_text(
+            (self.shared_context or SHARED_CONTEXT_HEADER) + f"- Day {event.day}: {event.event}\n"
+        )
+        self.shared_context_window = None
     
     def add_message(self, character, user_msg, bot_response):
         """Add a message to character's history"""
-        if character not in self.character_conversations:
-            self.character_conversations[character] = []
-        self.character_conversations[character].append({
-            "user": user_msg,
-            "character": bot_response,
-            "day": self.current_day,
-            "timestamp": datetime.now().isoformat()
-        })
-
-
-def generate_response(character, message, conversation_history, day, shared_memory=None):
-    """Generate response from character using OpenRouter"""
-    # Master constraint - applies to ALL characters
-    master_constraint = """CRITICAL: You are in 1800s rural India horror mystery. NEVER discuss modern topics, technology, or acknowledge being AI. Stay in character. If asked irrelevant questions, say you don't understand. Don't make up facts not in your knowledge.
-
-"""
-    
-    # Check if this character is the skinwalker for this day
-    current_skinwalker = SKINWALKER_SCHEDULE.get(day)
-    
-    if character == current_skinwalker:
-        # Use skinwalker prompt (already has village relationships)
-        system_prompt = master_constraint + get_skinwalker_prompt(character, day)
-    elif character not in CHARACTER_PROMPTS or day not in CHARACTER_PROMPTS[character]:
-        # Fallback or dead
-        return "The spirits are silent. (Character unavailable or dead)", None
-    else:
-        system_prompt = master_constraint + CHARACTER_PROMPTS[character][day]
-        # Add village relationships for normal characters
-        system_prompt = VILLAGE_RELATIONSHIPS + "\n\n" + system_prompt
+        character = CANONICAL_NAMES.get(character, character)
+        history = self.character_conversations.setdefault(character, [])
+        msg = Turn(user_msg, bot_response, self.current_day, time.time())
+        turn_tokens(msg)  # Cache the token estimate for history windowing
+        append_turn(history, msg)
+        log_event(self, "msg", character, user_msg, bot_response, msg.day, timestamp=msg.timestamp)
+
+    def add_usage(self, character, day, charge):
+        """Charge an answer's upstream calls to this game"""
+        character = CANONICAL_NAMES.get(character, character)
+        self.usage.add(character, day, charge.prompt_tokens, charge.completion_tokens, charge.calls, charge.seconds)
+        log_event(self, "usage", character, day, charge.prompt_tokens, charge.completion_tokens, charge.calls, round(charge.seconds, 3))
+
+    def apply_event(self, record):
+        """Redo one event log record on a recovered session (without logging it again)"""
+        kind, _, seq, ts, *payload = record
+        if kind == "msg":
+            character, user_msg, bot_response, day = payload
+            history = self.character_conversations.setdefault(CANONICAL_NAMES.get(character, character), [])
+            msg = Turn(user_msg, bot_response, day, ts)
+            turn_tokens(msg)
+            append_turn(history, msg)
+        elif kind == "shared":
+            self.shared_memory.append(SharedEvent(payload[0], payload[1], ts))  # Rendered once replay is done
+        elif kind == "day":
+            self.current_day = payload[0]
+        elif kind == "journal":
+            self.journal.entries.append(payload[0])
+        elif kind == "usage":
+            self.usage.add(*payload)
+        self.log_seq = seq
+        self.last_access = max(self.last_access, ts)
+        # Each save after the snapshot followed a logged event, so this keeps the
+        # version (and the ETags clients hold) ahead of where it was before the restart
+        self.version += 1
+
+    def catch_up(self, latest):
+        """Take over a newer saved copy of this session, then redo this copy's unsaved events on it.
+
+        For a session store shared by several processes: another one saved
+        while this copy was being changed here. Keeps this object (and the
+        journal readers parked on it) live.
+        """
+        for record in self.unsaved or ():
+            latest.apply_event(record)
+        self.scenario = latest.scenario
+        self.current_day = latest.current_day
+        self.character_conversations = latest.character_conversations
+        self.shared_memory = latest.shared_memory
+        self.shared_context = render_shared_context(latest.shared_memory)
+        self.shared_context_window = None
+        self.usage = latest.usage
+        self.journal.catch_up(latest.journal.entries)
+
+    def to_dict(self):
+        """Compact form for the session store: lists instead of dicts, empty chats skipped"""
+        return {
+            "id": self.session_id,
+            "sc": self.scenario.id,
+            "d": self.current_day,
+            "c": self.created_at,
+            "v": self.version,
+            "a": self.last_access,
+            "q": self.log_seq,
+            "m": {
+                char: [[m.user, m.character, m.day, m.timestamp] for m in msgs]
+                for char, msgs in self.character_conversations.items() if msgs
+            },
+            "s": [[e.event, e.day, e.timestamp] for e in self.shared_memory],
+            "j": self.journal.entries,
+            "u": self.usage.to_list()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data["id"], SCENARIOS.get(data.get("sc")))
+        session.current_day = data["d"]
+        session.created_at = as_epoch(data["c"])
+        session.version = data["v"]
+        session.last_access = as_epoch(data.get("a", session.created_at))
+        session.saved_at = session.last_access  # Close enough: Redis sets both on save
+        session.log_seq = data.get("q", 0)
+        for char, msgs in data["m"].items():
+            session.character_conversations[CANONICAL_NAMES.get(char, char)] = [
+                Turn(u, c, d, as_epoch(t)) for u, c, d, t in msgs[-HISTORY_MAX_TURNS:]
+            ]
+        session.shared_memory = [SharedEvent(e, d, as_epoch(t)) for e, d, t in data["s"]]
+        session.shared_context = render_shared_context(session.shared_memory)
+        session.journal = JournalLog(session.session_id, entries=data["j"])
+        session.usage = UsageLedger.from_list(data.get("u", ()))
+        return session
+
+
+def log_event(session, kind, *payload, timestamp=None):
+    """Queue a record for the event log, and keep it until the next save if the
+    store merges saves; callers hold session.lock (or own a fresh session)"""
+    if event_log is None and not session_store.merges:
+        return
+    record = [kind, session.session_id, session.log_seq + 1, timestamp or time.time(), *payload]
+    if session_store.merges:
+        if session.unsaved is None:
+            session.unsaved = []
+        session.unsaved.append(record)
+    if event_log is not None:
+        session.log_seq += 1
+        event_log.append(record)
+
+
+# Active game sessions, in memory or Redis depending on SESSION_STORE
+session_store = create_session_store(GameSession)
+
+if event_log is not None and SESSION_STORE != "memory":
+    print(f"WARNING: EVENT_LOG_DIR is only used with SESSION_STORE=memory; {SESSION_STORE} keeps its own copy")
+    event_log = None
+
+
+def snapshot_sessions():
+    """Every live session as a dict, for the event log's snapshots"""
+    sessions = []
+    for session in list(session_store.values()):
+        with session.lock:
+            sessions.append(session.to_dict())
+    return sessions
+
+
+def recover_sessions():
+    """Rebuild the memory store from the newest snapshot plus the events logged after it"""
+    started = time.perf_counter()
+    recovered = {}
+    for kind, item in event_log.replay():
+        if kind == "snapshot":
+            session = GameSession.from_dict(item)
+            recovered[session.session_id] = session
+            continue
+        kind, session_id, seq, ts = item[:4]
+        session = recovered.get(session_id)
+        if kind == "state":  # Handed over by another worker
+            session = recovered[session_id] = GameSession.from_dict(item[4])
+            session.log_seq = seq
+            continue
+        if kind == "gone":  # Handed over to another worker
+            recovered.pop(session_id, None)
+            continue
+        if kind == "new":
+            if session is None:
+                session = recovered[session_id] = GameSession(session_id, SCENARIOS.get(item[4]) if len(item) > 4 else None)
+                session.created_at = session.last_access = ts
+                session.log_seq = seq
+            continue
+        if session is None or seq <= session.log_seq:
+            continue  # Already in the snapshot, or the session was dropped before it
+        session.apply_event(item)
+    now = time.time()
+    live = sorted(
+        (s for s in recovered.values() if now - s.last_access <= SESSION_TTL),
+        key=lambda s: s.last_access
+    )
+    for session in live:
+        session.shared_context = render_shared_context(session.shared_memory)
+        session.shared_context_window = None
+        last_access = session.last_access
+        session_store.save(session)
+        session.last_access = last_access  # Keep idle time across the restart
+    if recovered:
+        print(f"Event Log: recovered {len(live)} sessions ({len(recovered) - len(live)} expired) "
+              f"in {time.perf_counter() - started:.2f}s")
+
+
+def export_sessions(session_ids):
+    """Return sessions' dicts for moving to another worker; they stay here until release_sessions"""
+    exported = []
+    for session_id in session_ids:
+        session = session_store.get(session_id)
+        if session is None:
+            continue
+        with session.lock:
+            exported.append(session.to_dict())
+    return exported
+
+
+def release_sessions(session_ids):
+    """Drop sessions another worker has taken over, ending their journal readers here"""
+    released = 0
+    for session_id in session_ids:
+        session = session_store.get(session_id)
+        if session is None:
+            continue
+        with session.lock:
+            log_event(session, "gone")
+            session_store.delete(session_id)
+        session.journal.close()
+        released += 1
+    return released
+
+
+def import_sessions(dicts):
+    """Take over sessions exported by another worker"""
+    for data in dicts:
+        session = GameSession.from_dict(data)
+        with session.lock:
+            log_event(session, "state", data)
+            session_store.save(session)
+    return len(dicts)
+
+
+if event_log is not None:
+    recover_sessions()
+    event_log.snapshot_source = snapshot_sessions
+    event_log.start()
+
+
+JOURNAL_SEPARATOR = "|||"
+
+# Corpus answers for when the LLM fails, is overloaded or is switched off (LOCAL_RESPONDER)
+local_responder = LocalResponder()
+
+API_ERROR_RESPONSE = "I... I cannot speak right now. (API Error - Get new key at openrouter.ai)"
+
+
+def get_fallback_response(character, day, message="", conversation_history=(), scenario=default_scenario):
+    """Get a pre-written (speech, clue) for a character when the API fails.
+
+    The local responder picks one that fits the question if it can; the
+    scenario's single canned line per character/day is the last resort.
+    """
+    # The corpus is keyed on the schedule's days, so day 7 of a 4-day scenario asks for day 4
+    reply = local_responder.answer(character, scenario.day(day), scenario.is_skinwalker(character, day), message, conversation_history)
+    if reply:
+        metrics.local_answers.inc("fallback")
+        return reply
+    return scenario.fallback(character, day) or (API_ERROR_RESPONSE, None)
+
+
+class JournalStreamParser:
+    """Incrementally splits LLM output into speech and the |||JOURNAL: tail.
+
+    feed() returns only the speech text that is safe to show the player; anything
+    that might be the start of the separator is held back until we know.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.tail = None  # Text after the separator, once we've seen it
+        self.started = False
+
+    def feed(self, text):
+        if self.tail is not None:
+            self.tail += text
+            return ""
+
+        self.pending += text
+        if not self.started:
+            self.pending = self.pending.lstrip()
+            if not self.pending:
+                return ""
+            self.started = True
+
+        if JOURNAL_SEPARATOR in self.pending:
+            speech, self.tail = self.pending.split(JOURNAL_SEPARATOR, 1)
+            self.pending = ""
+            return speech.rstrip()
+
+        # Hold back trailing whitespace and partial separators ("|" or "||")
+        keep = len(self.pending.rstrip("| \n\t"))
+        out, self.pending = self.pending[:keep], self.pending[keep:]
+        return out
+
+    def finish(self):
+        """Return any speech still held back and the parsed clue (or None)"""
+        speech = "" if self.tail is not None else self.pending.rstrip()
+        self.pending = ""
+
+        clue = None
+        if self.tail is not None:
+            tail = self.tail.split(JOURNAL_SEPARATOR)[0].strip()
+            if tail.upper().startswith("JOURNAL"):
+                clue = tail[len("JOURNAL"):].lstrip(":").strip() or None
+        return speech, clue
+
+
+def parse_llm_output(raw_content):
+    """Split a complete LLM reply into (speech, clue)"""
+    parser = JournalStreamParser()
+    speech = parser.feed(raw_content)
+    rest, clue = parser.finish()
+    return (speech + rest).strip(), clue
+
+
+def build_messages(character, message, conversation_history, day, shared_context="", history_budget=HISTORY_TOKEN_BUDGET,
+                   scenario=default_scenario):
+    """Build the chat messages for a character, or None if they can't talk today"""
+    system_prompt = scenario.system_prompt(character, day)
+    if system_prompt is None:
+        return None
     
-    # Build shared context from common memory
-    shared_context = ""
-    if shared_memory:
-        shared_context = "\n\nVILLAGE-WIDE KNOWLEDGE (everyone knows this):\n"
-        for event in shared_memory:
-            shared_context += f"- Day {event['day']}: {event['event']}\n"
+    # Individual conversation history, newest turns that fit the token budget
+    turns, summary = window_history(conversation_history, day, history_budget)
     
     # Build messages array for chat completion
     messages = [
-        {"role": "system", "content": system_prompt + shared_context + "\n\nYou are a roleplay character."}
+        {"role": "system", "content": system_prompt + shared_context + summary}
     ]
     
-    # Add individual conversation history (last 6 messages)
-    for msg in conversation_history[-6:]:
-        if msg["day"] <= day:
-            messages.append({"role": "user", "content": msg['user']})
-            messages.append({"role": "assistant", "content": msg['character']})
+    for msg in turns:
+        messages.append({"role": "user", "content": msg.user})
+        messages.append({"role": "assistant", "content": msg.character})
     
     # Add current message with FORCED instruction
-    forced_instruction = f"""{message}
+    if clue_extractor.inline():
+        forced_instruction = f"""{message}
 
 [SYSTEM INSTRUCTION: 
 1. Answer as {character} (MAX 20 WORDS). 
@@ -402,219 +489,1007 @@ def generate_response(character, message, conversation_history, day, shared_memo
 Example:
 "I saw him run away."
 |||JOURNAL: Saw him running.]"""
+    else:
+        # The clue is worked out afterwards (see clue_extractor.py), so the reply is speech only
+        forced_instruction = f"""{message}
+
+[SYSTEM INSTRUCTION: Answer as {character} (MAX 20 WORDS).]"""
     
     messages.append({"role": "user", "content": forced_instruction})
-    
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages
-        )
-        raw_content = response.choices[0].message.content
-        print(f"DEBUG LLM OUTPUT: {raw_content}") # Debugging
-        
-        # Parse Clue with robust handling
-        speech = raw_content
-        clue = None
-        
-        # Robust split: look for the separator
-        separator = "|||JOURNAL:"
-        if separator in raw_content:
-            parts = raw_content.split(separator)
-            speech = parts[0].strip()
-            if len(parts) > 1:
-                clue = parts[1].strip()
-        else:
-            # Fallback: maybe it used different spacing?
-            if "|||" in raw_content:
-                 parts = raw_content.split("|||")
-                 speech = parts[0].strip()
-                 # Assume 2nd part is journal if not specified, or check text
-                 if len(parts) > 1 and "JOURNAL" in parts[1].upper():
-                     clue = parts[1].replace("JOURNAL:", "").replace("Journal:", "").strip()
+    return messages
+
+
+UNAVAILABLE_RESPONSE = "The spirits are silent. (Character unavailable or dead)"
+
+# Replies to common questions, shared by every session
+response_cache = ResponseCache()
+
+
+def response_cache_key(character, message, conversation_history, day, shared_context, scenario=default_scenario):
+    """Cache key for this question, or None if it shouldn't be served from cache"""
+    return response_cache.make_key(
+        character, message, conversation_history, day,
+        scenario.prompt_id(character, day), shared_context
+    )
+
+
+def prefetch_opener(session_id, character, day, shared_context):
+    """Reply to a generic opener ahead of time, for the opener prefetcher"""
+    session = session_store.get(session_id)
+    # Queued behind other prefetches, so the budget is checked again before the call
+    if session is None or not prefetch_allowed(session):
+        return None
+    messages = build_messages(character, PREFETCH_QUESTION, [], day, shared_context, scenario=session.scenario)
+    if messages is None:
+        return None
+    # Own dispatcher key, so prefetches don't hold the player's per-session slots
+    started = time.perf_counter()
+    raw_content, usage, model = model_router.complete(f"{session_id}:prefetch", messages)
+    metrics.record_usage(usage)
+    charge = Charge()
+    charge_upstream(charge, usage, time.perf_counter() - started, messages, raw_content)
+    charge_session(session_id, character, day, charge)
+    return parse_llm_output(raw_content)
+
+
+def charge_session(session_id, character, day, charge):
+    """Book a background call (prefetch, clue extraction) on the game it was made for"""
+    if not charge.calls:
+        return
+    session = session_store.get(session_id)
+    if session is None:
+        return
+    with session.lock:
+        session.add_usage(character, day, charge)
+        session_store.save(session)
+
+
+# First lines prepared on new game / new day (PREFETCH_OPENERS=1)
+opener_prefetcher = OpenerPrefetcher(prefetch_opener)
+
+CLUE_PROMPT = """You keep the case journal of a guard investigating murders in an 1800s Indian village.
+For each numbered villager reply, write one note of at most 5 words with the clue it gives (who, where, what was seen or heard).
+Answer with only a JSON array of strings, one per reply, in order. Use "" for a reply with no clue."""
+
+
+def extract_clues(jobs):
+    """One LLM call for the clues of several replies"""
+    listing = "\n".join(f"{i}. {job.character}: {job.reply}" for i, job in enumerate(jobs, 1))
+    messages = [{"role": "system", "content": CLUE_PROMPT}, {"role": "user", "content": listing}]
+    started = time.perf_counter()
+    response = llm_dispatcher.complete("clues", model=CLUE_MODEL or MODEL_NAME, messages=messages)
+    usage = getattr(response, "usage", None)
+    metrics.record_usage(usage)
+    content = response.choices[0].message.content or ""
+    charge = Charge()
+    charge_upstream(charge, usage, time.perf_counter() - started, messages, content)
+    charge_clue_jobs(jobs, charge)
+    clues = json.loads(content[content.find("["):content.rfind("]") + 1])
+    if not isinstance(clues, list) or len(clues) != len(jobs):
+        raise ValueError(f"expected {len(jobs)} clues, got {content[:80]!r}")
+    return [str(clue).strip() or None for clue in clues]
+
+
+def charge_clue_jobs(jobs, charge):
+    """Split one extraction call between the games whose replies it read, once per game"""
+    by_session = {}
+    for job in jobs:
+        by_session.setdefault(job.session_id, []).append(job)
+    for session_id, own in by_session.items():
+        share = Charge()
+        share.prompt_tokens = charge.prompt_tokens * len(own) // len(jobs)
+        share.completion_tokens = charge.completion_tokens * len(own) // len(jobs)
+        share.calls = charge.calls
+        share.seconds = charge.seconds * len(own) / len(jobs)
+        charge_session(session_id, own[0].character, own[0].day, share)
+
+
+def deliver_clue(job, clue):
+    """Write a clue found after the reply to the session's journal"""
+    session = session_store.get(job.session_id)
+    if session is None:
+        return
+    with session.lock:
+        add_journal_entry(session, job.day, job.character, clue)
+        session_store.save(session)
+
+
+clue_extractor = ClueExtractor(extract_clues, deliver_clue)
+
+
+def prefetch_allowed(session):
+    """Speculative upstream calls only while this game and the server have room to spare"""
+    if local_responder.offline() or local_responder.should_shed(llm_dispatcher):
+        return False
+    return admission.idle(session.usage, llm_dispatcher)
+
+
+def schedule_openers(session):
+    """Start preparing first lines for everyone the player can visit today"""
+    if not prefetch_allowed(session):
+        return
+    day = session.current_day
+    opener_prefetcher.schedule(
+        session.session_id, get_visitable_characters(day, session.scenario), day, session.get_shared_context()
+    )
+
+
+def local_reply(character, message, conversation_history, day, dispatcher, scenario=default_scenario):
+    """A local answer if we're offline or the upstream queue is too long, else None.
 
+    Someone the corpus has nothing for gets their pre-written line rather
+    than a trip upstream, which this mode is there to avoid.
+    """
+    if local_responder.offline():
+        reason = "offline"
+    elif local_responder.should_shed(dispatcher):
+        reason = "shed"
+    else:
+        return None
+    reply = local_responder.answer(character, scenario.day(day), scenario.is_skinwalker(character, day), message, conversation_history)
+    if reply:
+        metrics.local_answers.inc(reason)
+        return reply
+    return canned_reply(character, message, conversation_history, day, scenario)
+
+
+def canned_reply(character, message, conversation_history, day, scenario=default_scenario):
+    """The answer for the canned tier: no LLM call, over budget or under heavy load"""
+    metrics.fallbacks.inc(character)
+    return get_fallback_response(character, day, message, conversation_history, scenario)
+
+
+def upstream_complete(key, messages, charge):
+    """(raw_content, usage, model) from the router, or from the cheap model for that tier"""
+    if charge.model is None:
+        return model_router.complete(key, messages)
+    response = llm_dispatcher.complete(key, model=charge.model, messages=messages)
+    return response.choices[0].message.content or "", getattr(response, "usage", None), charge.model
+
+
+def upstream_stream(key, messages, charge):
+    if charge.model is None:
+        return model_router.stream(key, messages)
+    return llm_dispatcher.stream(key, model=charge.model, messages=messages)
+
+
+def charge_upstream(charge, usage, seconds, messages, reply):
+    """Book one upstream call on the question's charge and the global budget"""
+    if usage is SHARED_USAGE:
+        return  # Joined an identical call in flight, which its owner pays for
+    before = charge.tokens
+    charge.add(usage, seconds, messages, reply)
+    admission.spent(charge.tokens - before)
+
+
+class ReplyPlan:
+    """One answer's way down the tiers, shared by both apps, blocking or streamed.
+
+    The order is: can't talk today, local, cached, a prefetched opener,
+    canned, then upstream. Every step here is a plain call; callers only add
+    the waiting (blocking here, awaits in asgi.py):
+
+        reply = plan.early()            # None, with plan.prepared to wait on
+        reply = plan.after_prefetch(<what waiting on plan.prepared gave>)
+        plan.begin_upstream()           # then finish() a completion, or
+                                        # streamed() / stream_done() / stream_failed()
+                                        # / stream_finish() a stream
+    """
+
+    def __init__(self, character, message, conversation_history, day, shared_context, session_id, charge, scenario,
+                 dispatcher):
+        self.character = character
+        self.message = message
+        self.conversation_history = conversation_history
+        self.day = day
+        self.shared_context = shared_context
+        self.session_id = session_id
+        self.charge = charge or Charge()
+        self.scenario = scenario or default_scenario
+        self.dispatcher = dispatcher
+        self.messages = None
+        self.cache_key = None
+        self.prepared = None  # The prefetched opener's Future, if there is one
+        self.parser = JournalStreamParser()
+        self.speech = ""
+        self.usage = None
+        self.started = None
+
+    def early(self):
+        """The reply if a tier ahead of the prefetch check gives one, else None"""
+        with span("prompt_build"):
+            self.messages = build_messages(self.character, self.message, self.conversation_history, self.day,
+                                           self.shared_context, self.charge.history_budget, self.scenario)
+        if self.messages is None:
+            return UNAVAILABLE_RESPONSE, None
+
+        local = local_reply(self.character, self.message, self.conversation_history, self.day, self.dispatcher, self.scenario)
+        if local:
+            return local
+
+        self.cache_key = response_cache_key(self.character, self.message, self.conversation_history, self.day,
+                                            self.shared_context, self.scenario)
+        cached = response_cache.get(self.cache_key)
+        if cached:
+            return cached
+
+        self.prepared = opener_prefetcher.take(self.session_id, self.character, self.day, self.message, self.conversation_history)
+        return None
+
+    def after_prefetch(self, prepared_reply):
+        """The prefetched reply, the canned one for that tier, or None to go upstream"""
+        if prepared_reply:
+            return prepared_reply
+        if self.charge.tier == "canned":
+            return canned_reply(self.character, self.message, self.conversation_history, self.day, self.scenario)
+        return None
+
+    def begin_upstream(self):
+        self.started = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def finish(self, raw_content, usage):
+        """(speech, clue) from a whole completion, charged and cached"""
+        metrics.record_usage(usage)
+        charge_upstream(self.charge, usage, self.elapsed(), self.messages, raw_content)
+        with span("journal_parse"):
+            speech, clue = parse_llm_output(raw_content)
+        response_cache.put(self.cache_key, (speech, clue))
         return speech, clue
+
+    def failed(self, error):
+        """The pre-written line after a failed completion"""
+        print(f"LLM Error: {error}")
+        metrics.fallbacks.inc(self.character)
+        return get_fallback_response(self.character, self.day, self.message, self.conversation_history, self.scenario)
+
+    def streamed(self, chunk):
+        """Speech from one streamed chunk that is safe to show, "" if none yet"""
+        metrics.record_usage(getattr(chunk, "usage", None))
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        if not chunk.choices:
+            return ""
+        text = self.parser.feed(chunk.choices[0].delta.content or "")
+        if text:
+            if not self.speech:
+                metrics.observe_stage("upstream_first_token", self.elapsed())
+            self.speech += text
+        return text
+
+    def stream_done(self):
+        metrics.observe_stage("upstream_total", self.elapsed())
+        charge_upstream(self.charge, self.usage, self.elapsed(), self.messages, self.speech)
+
+    def stream_failed(self, error):
+        """The pre-written line if the player saw nothing yet, else None to finish what they saw"""
+        print(f"LLM Error: {error}")
+        self.cache_key = None  # Don't remember a reply that was cut off
+        if self.speech:
+            charge_upstream(self.charge, self.usage, self.elapsed(), self.messages, self.speech)
+            return None
+        metrics.fallbacks.inc(self.character)
+        return get_fallback_response(self.character, self.day, self.message, self.conversation_history, self.scenario)
+
+    def stream_finish(self):
+        """(rest, reply): speech still held back, and the whole (speech, clue)"""
+        rest, clue = self.parser.finish()
+        self.speech += rest
+        reply = (self.speech.strip(), clue)
+        response_cache.put(self.cache_key, reply)
+        return rest, reply
+
+
+def whole_reply(reply):
+    """The stream events for a reply that is ready at once"""
+    return [("token", reply[0]), ("done", reply)]
+
+
+def generate_response(character, message, conversation_history, day, shared_context="", session_id=None, dispatch_key=None, charge=None,
+                      scenario=None):
+    """Generate response from character using OpenRouter.
+
+    dispatch_key is what the dispatcher limits concurrency by (defaults to session_id).
+    charge (from admission.admit) sets the tier and collects what the answer cost.
+    scenario is the session's (the default one if not given).
+    """
+    plan = ReplyPlan(character, message, conversation_history, day, shared_context, session_id, charge, scenario, llm_dispatcher)
+    reply = plan.early()
+    if reply is None:
+        reply = plan.after_prefetch(plan.prepared and opener_prefetcher.wait(plan.prepared))
+    if reply is not None:
+        return reply
+
+    try:
+        plan.begin_upstream()
+        with span("upstream_total"):
+            raw_content, usage, model = upstream_complete(dispatch_key or session_id, plan.messages, plan.charge)
+        return plan.finish(raw_content, usage)
     except Exception as e:
-        print(f"LLM Error: {e}")
-        
-        # FALLBACK: Return pre-written responses when API fails
-        fallback_responses = {
-            "Ishaan the Miller": {
-                1: ("Kabir was acting strange, bhai. Listening to voices in the wind. |||JOURNAL: Kabir heard voices.", "Kabir heard voices."),
-                2: ("Vikram is dead! The strongest of us... if he can die, we're all doomed! |||JOURNAL: Vikram was strongest.", "Vikram was strongest."),
-                3: ("Diya... she was just a girl. Why her? The demon is among us! |||JOURNAL: Diya was innocent.", "Diya was innocent."),
-                4: ("Is it you? Or is it me? I don't know who to trust anymore! |||JOURNAL: Final two remain.", "Final two remain.")
-            },
-            "Anya the Herbalist": {
-                1: ("Kabir spoke of shedding his skin. His soul was troubled, ji. |||JOURNAL: Kabir's troubled soul.", "Kabir's troubled soul."),
-                2: ("Vikram's wounds... not from an animal. Inhuman strength. |||JOURNAL: Inhuman strength used.", "Inhuman strength used."),
-                3: ("Diya saw someone walking wrong. The Rakshasa mimics poorly. |||JOURNAL: Rakshasa mimics poorly.", "Rakshasa mimics poorly."),
-                4: ("One of us is the demon. I've prepared poison, just in case. |||JOURNAL: Anya has poison.", "Anya has poison.")
-            },
-            "Vikram the Hunter": {
-                1: ("Kabir was stalking houses like prey. I should've put an arrow in him. |||JOURNAL: Kabir stalked houses.", "Kabir stalked houses.")
-            },
-            "Diya the Weaver": {
-                1: ("Kabir asked when guards change. His eyes were empty, like a doll. |||JOURNAL: Kabir's empty eyes.", "Kabir's empty eyes."),
-                2: ("I feel much better today! The fear is gone somehow. |||JOURNAL: Diya suspiciously calm.", "Diya suspiciously calm.")
-            },
-            "Amar the Elder": {
-                1: ("This is a Rakshasa, child. It wears the skin of its victims. |||JOURNAL: Rakshasa steals skin.", "Rakshasa steals skin."),
-                2: ("The dead walk among us. Who acted strange yesterday? |||JOURNAL: Dead walk among us.", "Dead walk among us."),
-                3: ("I saw the sunrise today... I mean, I felt its warmth. |||JOURNAL: Amar claims to see.", "Amar claims to see.")
-            }
-        }
-        
-        # Get fallback response
-        if character in fallback_responses and day in fallback_responses[character]:
-            return fallback_responses[character][day]
-        else:
-            return f"I... I cannot speak right now. (API Error - Get new key at openrouter.ai)", None
+        return plan.failed(e)
+
+
+def stream_response(character, message, conversation_history, day, shared_context="", session_id=None, charge=None, scenario=None):
+    """Stream a character's reply.
+
+    Yields ("token", text) for speech as it arrives, then one final
+    ("done", (speech, clue)) once the |||JOURNAL: tail has been parsed.
+    """
+    plan = ReplyPlan(character, message, conversation_history, day, shared_context, session_id, charge, scenario, llm_dispatcher)
+    reply = plan.early()
+    if reply is None:
+        reply = plan.after_prefetch(plan.prepared and opener_prefetcher.wait(plan.prepared))
+    if reply is not None:
+        yield from whole_reply(reply)
+        return
+
+    try:
+        plan.begin_upstream()
+        for chunk in upstream_stream(session_id, plan.messages, plan.charge):
+            text = plan.streamed(chunk)
+            if text:
+                yield "token", text
+        plan.stream_done()
+    except Exception as e:
+        reply = plan.stream_failed(e)
+        if reply is not None:
+            # Nothing reached the player yet, so the pre-written line can stand in
+            yield from whole_reply(reply)
+            return
+
+    rest, reply = plan.stream_finish()
+    if rest:
+        yield "token", rest
+    yield "done", reply
 
 
 # =====================
-# API ENDPOINTS
+# GAME ACTIONS
+# Framework-independent so the Flask app here and the asyncio app in
+# asgi.py share the same rules.
 # =====================
 
-@app.route('/game/new', methods=['POST'])
-def new_game():
-    """Create a new game session"""
-    session_id = str(uuid.uuid4())
-    session = GameSession(session_id)
-    game_sessions[session_id] = session
-    
-    # Clear journal for new run
-    clear_journal()
+# Set by cluster.py for its workers, which only listen on localhost behind the front
+CLUSTER_WORKER = os.getenv("CLUSTER_WORKER") == "1"
+
+
+def start_new_game(session_id=None, scenario_id=None):
+    """Create a new game session, return the response payload.
+
+    scenario_id picks one of SCENARIOS (default or random otherwise); an
+    unknown one returns (error, status).
+    """
+    scenario = pick_scenario(scenario_id)
+    if scenario is None:
+        return {"error": f"Unknown scenario {scenario_id!r}"}, 400
+    session_id = session_id or str(uuid.uuid4())
+    session = GameSession(session_id, scenario)
     
+    log_event(session, "new", scenario.id, timestamp=session.created_at)
     # Initialize shared memory with Day 1 context
-    session.add_shared_event("Kabir the villager has gone missing")
-    session.add_shared_event("The village is frightened, rumors of a Rakshasa demon")
+    for event in scenario.opening_events:
+        session.add_shared_event(event)
+    session_store.save(session)
+    schedule_openers(session)
     
-    return jsonify({
+    return {
         "session_id": session_id,
         "current_day": 1,
+        "scenario": scenario.id,
         "message": "New game started"
-    })
+    }
 
-@app.route('/interrogate', methods=['POST'])
-def interrogate():
-    """Interrogate a character"""
-    data = request.json
-    
+
+def list_scenarios():
+    """The scenarios a new game can be started in"""
+    return {
+        "default": DEFAULT_SCENARIO if DEFAULT_SCENARIO == "random" else default_scenario.id,
+        "scenarios": [
+            {"id": s.id, "title": s.title, "characters": list(s.characters), "days": s.days}
+            for s in SCENARIOS.values()
+        ]
+    }
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def prepare_interrogation(data):
+    """Validate an /interrogate body.
+
+    Returns (error, status) on bad input or a character not in the session's
+    scenario, otherwise a dict with the session, character, message and day,
+    plus "dead" holding the canned payload if the character is already dead.
+    """
     # ... (Validation same)
     required_fields = ['session_id', 'character', 'message']
-    if not all(field in data for field in required_fields):
-        return jsonify({"error": "Missing required fields"}), 400
+    if not data or not all(field in data for field in required_fields):
+        return {"error": "Missing required fields"}, 400
     
     session_id = data['session_id']
     character = data['character']
-    message = data['message']
     
-    # ... (Session/Day logic same)
-    if session_id not in game_sessions:
-        game_sessions[session_id] = GameSession(session_id)
-    session = game_sessions[session_id]
+    with span("session_lookup"):
+        session = session_store.get(session_id)
+    if session is None:
+        return {"error": "Invalid session"}, 400
+    if not isinstance(character, str) or character not in session.scenario.characters:
+        return {"error": f"Unknown character: {character}"}, 400
     current_day = data.get('day', session.current_day)
+    # Labelled by the server's day: the client's is unbounded and unchecked
+    metrics.interrogations.inc(character, session.current_day)
     
-    # Check dead logic ...
-    if character in DEATH_SCHEDULE.values():
-         death_day = [d for d, c in DEATH_SCHEDULE.items() if c == character][0]
-         if current_day >= death_day:
-             return jsonify({"response": "(This character is dead.)", "character": character, "clue": f"Examined {character}'s body. Confirmed dead."})
+    return {
+        "session": session,
+        "character": character,
+        "message": data['message'],
+        "day": current_day,
+        "dead": dead_payload(character, current_day, session.scenario)
+    }
 
-    # Generate response with shared memory
-    try:
-        history = session.get_character_history(character)
-        shared_memory = session.get_shared_memory()
-        response_text, clue = generate_response(character, message, history, current_day, shared_memory)
-        
+
+def dead_payload(character, day, scenario=default_scenario):
+    """The canned reply for a character who is already dead by this day, else None"""
+    death_day = scenario.death_day.get(character)
+    if death_day is not None and isinstance(day, int) and day >= death_day:
+        return {"response": "(This character is dead.)", "character": character, "clue": f"Examined {character}'s body. Confirmed dead."}
+    return None
+
+
+# Questions being answered right now, by (session, character, day, message)
+questions_in_flight = {}
+questions_lock = threading.Lock()
+
+
+def join_question(session, character, message, current_day):
+    """(future, is_owner) for a question about to be answered.
+
+    The owner answers it and calls finish_question. The same question sent
+    again meanwhile (double-clicked Ask, a client retry) waits on the future
+    for the owner's payload instead of asking, recording and paying again.
+    This covers streamed and hedged replies, which the dispatcher can't share.
+    """
+    key = (session.session_id, character, current_day, message)
+    with questions_lock:
+        future = questions_in_flight.get(key)
+        if future is not None:
+            llm_dispatcher.stats.inc("coalesced")
+            return future, False
+        future = questions_in_flight[key] = Future()
+        future.key = key
+    return future, True
+
+
+def finish_question(future, payload=None, error=None):
+    """Hand the owner's payload (or error) to any duplicates; does nothing the second time"""
+    with questions_lock:
+        if questions_in_flight.get(future.key) is future:
+            del questions_in_flight[future.key]
+    if not future.done():
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(payload)
+
+
+def shared_answer_events(payload):
+    """The SSE a streamed duplicate gets: the owner's whole reply at once"""
+    events = [sse_event("token", {"text": payload.get("response", "")})]
+    if payload.get("clue"):
+        events.append(sse_event("clue", {"clue": payload["clue"]}))
+    events.append(sse_event("done", payload))
+    return events
+
+
+def record_interrogation(session, character, message, response_text, clue, current_day, charge=None):
+    """Store the exchange (and what it cost) in the session and journal, return the response payload"""
+    response_data = {
+        "character": character,
+        "response": response_text,
+        "day": current_day
+    }
+    
+    with session.lock:
         # Store in session (store cleaned text)
         session.add_message(character, message, response_text)
-        
-        response_data = {
-            "character": character,
-            "response": response_text,
-            "day": current_day
-        }
+        if charge is not None and charge.calls:
+            session.add_usage(character, current_day, charge)
         
         if clue:
             response_data["clue"] = clue
-            # Write to file
-            log_entry = f"[Day {current_day}] {character}: {clue}"
-            write_journal(log_entry)
-            
-        return jsonify(response_data)
+            add_journal_entry(session, current_day, character, clue)
+        
+        with span("session_save"):
+            session_store.save(session)
+    if charge is not None and charge.calls:
+        metrics.character_tokens.inc(character, current_day, amount=charge.tokens)
+    if not clue and not clue_extractor.inline() and response_text not in (UNAVAILABLE_RESPONSE, API_ERROR_RESPONSE):
+        clue_extractor.submit(session.session_id, character, current_day, response_text)
+    return response_data
+
+
+def add_journal_entry(session, day, character, clue):
+    """Append a clue line to the journal; callers hold session.lock and save afterwards"""
+    log_entry = f"[Day {day}] {character}: {clue}"
+    with span("journal_write"):
+        session.journal.append(log_entry)
+    log_event(session, "journal", log_entry)
+
+
+# Concurrent answers for /interrogate-batch, shared by all batches
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+
+def get_visitable_characters(day, scenario=default_scenario):
+    """Characters the player can go and talk to on this day"""
+    return list(scenario.visitable_on(day))
+
+
+def prepare_batch(session_id, data):
+    """Validate an /interrogate-batch body.
+
+    Returns (error, status) on bad input, otherwise a dict with the session,
+    message, day and the characters to ask (everyone visitable if not given).
+    """
+    if not data or not data.get('message'):
+        return {"error": "Missing required fields"}, 400
     
+    session = session_store.get(session_id)
+    if session is None:
+        return {"error": "Invalid session"}, 400
+    current_day = data.get('day', session.current_day)
+    
+    characters = data.get('characters') or get_visitable_characters(current_day, session.scenario)
+    if not isinstance(characters, list) or not all(isinstance(c, str) for c in characters):
+        return {"error": "characters must be a list of names"}, 400
+    unknown = [c for c in characters if c not in session.scenario.characters]
+    if unknown:
+        return {"error": f"Unknown characters: {', '.join(unknown)}"}, 400
+    characters = list(dict.fromkeys(characters))  # Same character twice would race on their history
+    
+    for character in characters:
+        metrics.interrogations.inc(character, session.current_day)
+    return {
+        "session": session,
+        "characters": characters,
+        "message": data['message'],
+        "day": current_day
+    }
+
+
+def batch_key(session_id):
+    """Dispatcher key for a session's batches. run_batch gives it one slot per
+    character asked, so a batch takes about one reply's time instead of
+    queueing behind LLM_SESSION_CONCURRENCY, and is still capped by the cast"""
+    return f"{session_id}:batch"
+
+
+def answer_in_batch(session, character, message, current_day):
+    """One character's part of a batch: ask, record, return the response payload"""
+    dead = dead_payload(character, current_day, session.scenario)
+    if dead:
+        return dead
+    question, owner = join_question(session, character, message, current_day)
+    try:
+        if not owner:
+            return question.result()
+        history = session.get_character_history(character)
+        charge = admission.admit(session.usage, llm_dispatcher)
+        response_text, clue = generate_response(
+            character, message, history, current_day, session.get_shared_context(),
+            session.session_id, dispatch_key=batch_key(session.session_id), charge=charge, scenario=session.scenario
+        )
+        payload = record_interrogation(session, character, message, response_text, clue, current_day, charge)
+        finish_question(question, payload)
+        return payload
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        if owner:
+            finish_question(question, error=e)
+        return {"character": character, "error": str(e)}
 
 
-@app.route('/journal', methods=['GET'])
-def get_journal():
-    lines = read_journal()
-    return jsonify({"entries": lines})
+def run_batch(ctx):
+    """Yield each character's payload as soon as it is ready"""
+    with llm_dispatcher.limits.allow(batch_key(ctx["session"].session_id), len(ctx["characters"])):
+        futures = [
+            batch_pool.submit(answer_in_batch, ctx["session"], character, ctx["message"], ctx["day"])
+            for character in ctx["characters"]
+        ]
+        for future in as_completed(futures):
+            yield future.result()
 
 
+# Long-poll / push settings for journal readers of the asyncio app (seconds)
+JOURNAL_LONG_POLL_MAX = float(os.getenv("JOURNAL_LONG_POLL_MAX", "30"))
+JOURNAL_KEEPALIVE = float(os.getenv("JOURNAL_KEEPALIVE", "15"))
 
 
-@app.route('/game/<session_id>/advance-day', methods=['POST'])
-def advance_day(session_id):
-    """Advance to the next day"""
-    if session_id not in game_sessions:
-        return jsonify({"error": "Invalid session"}), 400
+def read_session_journal(session_id, since=0):
+    """Return (payload, status) with the journal entries after a cursor"""
+    session = session_store.get(session_id)
+    if session is None:
+        return {"error": "Invalid session"}, 400
     
-    session = game_sessions[session_id]
-    old_day = session.current_day
-    session.current_day += 1
-    
-    # Add shared memory event about who died
-    if session.current_day in DEATH_SCHEDULE:
-        dead_character = DEATH_SCHEDULE[session.current_day]
-        session.add_shared_event(f"{dead_character} was found dead this morning, skinned alive")
+    entries, cursor = session.journal.since(since)
+    return {"entries": entries, "cursor": cursor}, 200
+
+
+def session_usage(session_id):
+    """Return (payload, status) with what the session has spent, per character and day"""
+    session = session_store.get(session_id)
+    if session is None:
+        return {"error": "Invalid session"}, 400
+    payload = session.usage.snapshot()
+    if SESSION_TOKEN_BUDGET:
+        payload["budget"] = SESSION_TOKEN_BUDGET
+        payload["remaining"] = max(0, SESSION_TOKEN_BUDGET - session.usage.tokens)
+    return payload, 200
+
+
+def session_read_response(payload, status, version, saved_at, cursor=0):
+    """JSON for a session read, with ETag/Last-Modified and gzip when large"""
+    response = jsonify(payload)
+    response.status_code = status
+    if status == 200 and version is not None:
+        add_validators(response, version, saved_at, cursor)
+        compress(response, response.get_data(), request)
+    return response
+
+
+def not_modified(version, cursor=0):
+    response = Response(status=304)
+    response.set_etag(session_etag(version, cursor), weak=True)
+    return response
+
+
+def journal_event(entries, cursor):
+    """SSE event for new journal entries; the id lets EventSource resume after a reconnect"""
+    return f"id: {cursor}\n" + sse_event("entries", {"entries": entries, "cursor": cursor})
+
+
+def get_stream_cursor(req):
+    """Where a journal stream should start: Last-Event-ID on reconnect, else ?since="""
+    last_id = req.headers.get('Last-Event-ID')
+    if last_id and last_id.isdigit():
+        return int(last_id)
+    return req.args.get('since', 0, type=int)
+
+
+def advance_session_day(session_id):
+    """Advance a session to the next day, return (payload, status)"""
+    session = session_store.get(session_id)
+    if session is None:
+        return {"error": "Invalid session"}, 400
     
-    # Add day transition event
-    session.add_shared_event(f"Night has passed. It is now Day {session.current_day}")
+    with session.lock:
+        session.current_day += 1
+        log_event(session, "day", session.current_day)
+        
+        # Add shared memory event about who died
+        dead_character = session.scenario.died_on(session.current_day)
+        if dead_character:
+            session.add_shared_event(session.scenario.death_event.format(character=dead_character))
+        
+        # Add day transition event
+        session.add_shared_event(f"Night has passed. It is now Day {session.current_day}")
+        session_store.save(session)
+    schedule_openers(session)
     
-    return jsonify({
+    return {
         "current_day": session.current_day,
         "message": f"Advanced to day {session.current_day}"
-    })
+    }, 200
 
-@app.route('/game/<session_id>/eliminate', methods=['POST'])
-def eliminate_suspect(session_id):
-    """Try to eliminate a suspect. ONE GUESS RULE."""
-    data = request.json
-    character = data.get('character')
-    
-    if session_id not in game_sessions or not character:
-        return jsonify({"error": "Invalid request"}), 400
+
+def judge_elimination(session_id, character):
+    """Check an accusation against today's skinwalker, return (payload, status)"""
+    session = session_store.get(session_id)
+    if session is None or not character:
+        return {"error": "Invalid request"}, 400
         
-    session = game_sessions[session_id]
     current_day = session.current_day
     
-    # Determine the actual Skinwalker for today
-    actual_skinwalker = SKINWALKER_SCHEDULE.get(current_day)
-    
-    # Fallback/Debug
-    if not actual_skinwalker:
-        if current_day >= 3:
-             actual_skinwalker = "Amar the Elder"
-        else:
-             print(f"WARNING: No skinwalker schedule for Day {current_day}")
+    # Determine the actual Skinwalker for today (past the schedule, the last one stays)
+    actual_skinwalker = session.scenario.skinwalker_on(current_day)
 
     print(f"Elimination Attempt: {character} vs Actual: {actual_skinwalker} (Day {current_day})")
+    with session.lock:
+        log_event(session, "elim", character, "win" if character == actual_skinwalker else "lose")
 
     if character == actual_skinwalker:
-        return jsonify({
+        return {
             "result": "win",
             "message": f"You struck down {character}... and their skin melted away to reveal the Rakshasa! The village is saved."
-        })
+        }, 200
     else:
-        return jsonify({
+        return {
             "result": "lose",
             "message": f"You killed {character}. As the life left their eyes, you realized... they were human. The real Skinwalker laughs in the distance. The village is doomed."
-        })
+        }, 200
+
+
+# =====================
+# API ENDPOINTS
+# =====================
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+metrics.registry.set_collector("llm", metrics.llm_stats_collector(response_cache, llm_dispatcher, model_router))
+if event_log is not None:
+    metrics.registry.set_collector("event_log", lambda: metrics.gauge_lines(
+        "game_event_log", "Event log writer totals", dict(event_log.stats), "stat"
+    ))
+# Set once the LLM client and local corpus are loaded, see /ready
+ready = threading.Event()
+
+
+def warm_up():
+    """Do the slow imports and setup now, so the first question doesn't pay for them"""
+    started = time.perf_counter()
+    try:
+        get_client()
+        local_responder.load()
+    except Exception as e:
+        print(f"Warm-up Error: {e}")  # Retried on first use
+        return
+    ready.set()
+    print(f"Warm-up done in {time.perf_counter() - started:.2f}s")
+
+
+if LAZY_INIT:
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+else:
+    warm_up()
+
+metrics.registry.set_collector("clues", lambda: metrics.gauge_lines(
+    "game_clue_extraction", "Background clue extraction counters", dict(clue_extractor.stats), "stat"
+))
+metrics.registry.set_collector("admission", lambda: metrics.gauge_lines(
+    "game_admission_tier", "Questions admitted at each tier", dict(admission.stats), "tier"
+) + metrics.gauge_lines(
+    "game_tokens_last_minute", "Tokens spent upstream in the last minute, all sessions", {None: admission.recent_tokens()}
+))
+metrics.registry.set_collector("prefetch", lambda: metrics.gauge_lines(
+    "game_prefetch", "Opener prefetch counters", dict(opener_prefetcher.stats), "stat"
+))
+
+
+@app.before_request
+def start_request_timer():
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def observe_request_time(response):
+    started = g.get("started")
+    if started is not None and request.url_rule is not None:
+        seconds = time.perf_counter() - started
+        metrics.request_seconds.observe(seconds, request.url_rule.rule, response.status_code)
+        # Handler time without the network, so bench/replay.py compares like with like
+        response.headers["Server-Timing"] = f"app;dur={seconds * 1000:.1f}"
+        if recorder and records(request):
+            payload = response.get_json(silent=True) if request.path == "/game/new" else None
+            recorder.request(request, request.get_json(silent=True), response, seconds, payload)
+    return response
+
+
+@app.route('/game/new', methods=['POST'])
+def new_game():
+    """Create a new game session"""
+    # Behind cluster.py the front picks the id, so it knows which worker will own it
+    session_id = request.headers.get("X-Session-Id") if CLUSTER_WORKER else None
+    payload = start_new_game(session_id, (request.get_json(silent=True) or {}).get("scenario"))
+    if isinstance(payload, tuple):
+        return jsonify(payload[0]), payload[1]
+    return jsonify(payload)
+
+
+@app.route('/scenarios', methods=['GET'])
+def scenarios():
+    """The scenarios a new game can be started in ({"scenario": id} in the /game/new body)"""
+    return jsonify(list_scenarios())
+
+
+@app.route('/interrogate', methods=['POST'])
+def interrogate():
+    """Interrogate a character.
+
+    Send "stream": true (or Accept: text/event-stream) to get the reply as
+    Server-Sent Events: "token" events with speech as it arrives, a "clue"
+    event if the character gave one, then "done" with the full payload.
+    """
+    data = request.json
+    stream = (data or {}).get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+
+    ctx = prepare_interrogation(data)
+    if isinstance(ctx, tuple):
+        return jsonify(ctx[0]), ctx[1]
+    
+    session, character, message, current_day = ctx["session"], ctx["character"], ctx["message"], ctx["day"]
+    if ctx["dead"]:
+        if stream:
+            return Response(sse_event("done", ctx["dead"]), mimetype='text/event-stream')
+        return jsonify(ctx["dead"])
+
+    history = session.get_character_history(character)
+    shared_context = session.get_shared_context()
+    charge = admission.admit(session.usage, llm_dispatcher)
+
+    if stream:
+        def generate():
+            # Joined once the stream starts, so a response that's never sent can't leave it open
+            question, owner = join_question(session, character, message, current_day)
+            try:
+                if not owner:
+                    yield from shared_answer_events(question.result())
+                    return
+                replies = stream_response(
+                    character, message, history, current_day, shared_context, session.session_id, charge, session.scenario
+                )
+                for kind, payload in replies:
+                    if kind == "token":
+                        yield sse_event("token", {"text": payload})
+                    else:
+                        response_text, clue = payload
+                        response_data = record_interrogation(session, character, message, response_text, clue, current_day, charge)
+                        finish_question(question, response_data)
+                        if clue:
+                            yield sse_event("clue", {"clue": clue})
+                        yield sse_event("done", response_data)
+            except Exception as e:
+                print(f"Error: {e}")
+                if owner:
+                    finish_question(question, error=e)
+                yield sse_event("error", {"error": str(e)})
+            finally:
+                if owner:
+                    finish_question(question, error=RuntimeError("The reply was cut off"))
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+    # Generate response with shared memory
+    question, owner = join_question(session, character, message, current_day)
+    try:
+        if not owner:
+            return jsonify(question.result())
+        response_text, clue = generate_response(
+            character, message, history, current_day, shared_context, session.session_id, charge=charge, scenario=session.scenario
+        )
+        response_data = record_interrogation(session, character, message, response_text, clue, current_day, charge)
+        finish_question(question, response_data)
+        return jsonify(response_data)
+    
+    except Exception as e:
+        print(f"Error: {e}")
+        if owner:
+            finish_question(question, error=e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if owner:
+            finish_question(question, error=RuntimeError("The question was not answered"))
+
+
+@app.route('/game/<session_id>/interrogate-batch', methods=['POST'])
+def interrogate_batch(session_id):
+    """Ask several characters the same question at once.
+
+    Body: {"message": ..., "characters": [...]} (characters defaults to everyone
+    who can be visited today). Answers are generated concurrently and each is
+    recorded as it finishes. Returns {"results": [...]} in the order asked, or
+    with "stream": true, a "result" event per character as it completes and
+    a final "done" event.
+    """
+    data = request.json
+    stream = (data or {}).get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+
+    ctx = prepare_batch(session_id, data)
+    if isinstance(ctx, tuple):
+        return jsonify(ctx[0]), ctx[1]
+
+    if stream:
+        def generate():
+            results = []
+            for result in run_batch(ctx):
+                results.append(result)
+                yield sse_event("result", result)
+            yield sse_event("done", {"results": results})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+    by_character = {r["character"]: r for r in run_batch(ctx)}
+    return jsonify({"results": [by_character[c] for c in ctx["characters"]]})
+
+
+@app.route('/game/<session_id>/journal', methods=['GET'])
+def get_session_journal(session_id):
+    """Journal entries for one session.
+
+    ?since=<cursor> returns only new entries. Send back the ETag from the
+    same cursor in If-None-Match to get a 304 if nothing was saved since. This app answers
+    straight away even if asked to &wait=: a held request would hold one of
+    a few worker threads, so Flask clients poll (asgi.py does long-poll).
+    """
+    since = request.args.get('since', 0, type=int)
+    # Version before entries, so the ETag never names more than the body holds
+    version, saved_at = session_store.version(session_id)
+    if is_current(request, version, since):
+        return not_modified(version, since)
+    payload, status = read_session_journal(session_id, since)
+    return session_read_response(payload, status, version, saved_at, since)
+
+
+@app.route('/game/<session_id>/journal/stream', methods=['GET'])
+def stream_session_journal(session_id):
+    """Journal push is only served by the asyncio app (asgi.py).
+
+    An open stream would hold a worker thread per tab here, so this answers
+    204, which tells EventSource not to reconnect; the client polls instead.
+    """
+    return Response(status=204)
+
+
+@app.route('/journal', methods=['GET'])
+def get_journal():
+    """Old shared-journal endpoint, now needs ?session_id="""
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({"entries": []})
+    version, saved_at = session_store.version(session_id)
+    if is_current(request, version):
+        return not_modified(version)
+    payload, status = read_session_journal(session_id)
+    return session_read_response(payload, status, version, saved_at)
+
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters for the response cache"""
+    return jsonify(response_cache.stats())
+
+
+@app.route('/models/stats', methods=['GET'])
+def get_model_stats():
+    """Latency and error averages the model router is choosing by"""
+    return jsonify({"models": model_router.snapshot(), "hedge_after": model_router.hedge_after})
+
+
+@app.route('/ready', methods=['GET'])
+def get_ready():
+    """503 until the warm-up has finished, for the host's readiness checks"""
+    return jsonify({"ready": ready.is_set()}), 200 if ready.is_set() else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage timings, counters and LLM stats in Prometheus text format"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/game/<session_id>/usage', methods=['GET'])
+def get_session_usage(session_id):
+    """Tokens and upstream seconds this game has used, per character and day"""
+    payload, status = session_usage(session_id)
+    return jsonify(payload), status
+
+
+@app.route('/game/<session_id>/advance-day', methods=['POST'])
+def advance_day(session_id):
+    """Advance to the next day"""
+    payload, status = advance_session_day(session_id)
+    return jsonify(payload), status
+
+
+@app.route('/game/<session_id>/eliminate', methods=['POST'])
+def eliminate_suspect(session_id):
+    """Try to eliminate a suspect. ONE GUESS RULE."""
+    data = request.json or {}
+    payload, status = judge_elimination(session_id, data.get('character'))
+    return jsonify(payload), status
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    app.run(port=5000, debug=True)
@@ -0,0 +1,33 @@
+"""Shared set-up: the backend on sys.path, and smth configured before it is imported.
+
+smth builds its session store at import, so the Redis-protocol stand-in is
+started here and SESSION_STORE points at it for the whole run.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from redis_stub import start_stub
+
+redis_server = start_stub()
+REDIS_URL = f"redis://127.0.0.1:{redis_server.server_address[1]}/0"
+
+os.environ.update(
+    OPENROUTER_API_KEY="test",
+    OPENROUTER_BASE_URL="http://127.0.0.1:9",  # Nothing listens; tests never reach the LLM
+    SESSION_STORE="redis",
+    REDIS_URL=REDIS_URL,
+    PREFETCH_OPENERS="0",
+    CLUE_EXTRACTION="local",
+)
+
+
+@pytest.fixture
+def redis_url():
+    return REDIS_URL
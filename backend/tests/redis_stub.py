@@ -0,0 +1,180 @@
+"""A tiny Redis-protocol server for tests: GET/SET/INCR/EXPIRE/DEL, WATCH/MULTI/EXEC and PUBLISH/SUBSCRIBE"""
+import socketserver
+import threading
+import time
+
+
+class Stub:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.changed = {}  # key -> counter bumped on every write, for WATCH
+        self.lock = threading.RLock()
+        self.subscribers = {}  # channel -> set of handlers
+
+    def touch(self, key):
+        self.changed[key] = self.changed.get(key, 0) + 1
+
+    def alive(self, key):
+        at = self.expires.get(key)
+        if at is not None and at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+
+class Push(list):
+    """Out-of-band message (pub/sub) on a RESP3 connection"""
+
+
+def encode(value, resp3=False):
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, dict):
+        return b"%%%d\r\n" % len(value) + b"".join(encode(k, resp3) + encode(v, resp3) for k, v in value.items())
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, Exception):
+        return b"-ERR " + str(value).encode() + b"\r\n"
+    if isinstance(value, list):
+        kind = b">" if resp3 and isinstance(value, Push) else b"*"
+        return kind + b"%d\r\n" % len(value) + b"".join(encode(v, resp3) for v in value)
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*", line
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def send(self, value):
+        with self.write_lock:
+            self.wfile.write(encode(value, self.resp3))
+            self.wfile.flush()
+
+    def handle(self):
+        stub = self.server.stub
+        self.write_lock = threading.Lock()
+        self.resp3 = False
+        watched = None
+        queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                break
+            name = args[0].upper().decode()
+            if name == "HELLO":
+                self.resp3 = len(args) > 1 and args[1] == b"3"
+                self.send({b"server": b"stub", b"proto": 3 if self.resp3 else 2})
+                continue
+            if name == "MULTI":
+                queued = []
+                self.send("OK")
+                continue
+            if name == "EXEC":
+                with stub.lock:
+                    if watched and any(stub.changed.get(k, 0) != v for k, v in watched.items()):
+                        self.send(None)  # Aborted: a watched key changed
+                    else:
+                        self.send([self.run(stub, q) for q in queued])
+                queued = watched = None
+                continue
+            if name == "DISCARD":
+                queued = watched = None
+                self.send("OK")
+                continue
+            if queued is not None:
+                queued.append(args)
+                self.send("QUEUED")
+                continue
+            if name == "WATCH":
+                with stub.lock:
+                    watched = watched or {}
+                    for key in args[1:]:
+                        watched[key] = stub.changed.get(key, 0)
+                self.send("OK")
+                continue
+            if name == "UNWATCH":
+                watched = None
+                self.send("OK")
+                continue
+            if name == "SUBSCRIBE":
+                for i, channel in enumerate(args[1:], 1):
+                    with stub.lock:
+                        stub.subscribers.setdefault(channel, set()).add(self)
+                    self.send(Push([b"subscribe", channel, i]))
+                continue
+            if name == "UNSUBSCRIBE":
+                with stub.lock:
+                    for subs in stub.subscribers.values():
+                        subs.discard(self)
+                for channel in args[1:] or [b""]:
+                    self.send(Push([b"unsubscribe", channel, 0]))
+                continue
+            with stub.lock:
+                self.send(self.run(stub, args))
+        with stub.lock:
+            for subs in stub.subscribers.values():
+                subs.discard(self)
+
+    def run(self, stub, args):
+        name = args[0].upper().decode()
+        a = args[1:]
+        if name in ("CLIENT", "SELECT"):
+            return "OK"
+        if name == "PING":
+            return "PONG"
+        if name == "GET":
+            return stub.data.get(a[0]) if stub.alive(a[0]) else None
+        if name == "SET":
+            stub.data[a[0]] = a[1]
+            stub.expires.pop(a[0], None)
+            if len(a) > 3 and a[2].upper() == b"EX":
+                stub.expires[a[0]] = time.time() + int(a[3])
+            stub.touch(a[0])
+            return "OK"
+        if name in ("INCR", "INCRBY"):
+            value = int(stub.data.get(a[0], b"0") if stub.alive(a[0]) else 0) + (int(a[1]) if len(a) > 1 else 1)
+            stub.data[a[0]] = str(value).encode()
+            stub.touch(a[0])
+            return value
+        if name == "EXPIRE":
+            if not stub.alive(a[0]):
+                return 0
+            stub.expires[a[0]] = time.time() + int(a[1])
+            return 1
+        if name == "EXISTS":
+            return sum(1 for k in a if stub.alive(k))
+        if name == "DEL":
+            n = 0
+            for k in a:
+                if stub.alive(k):
+                    n += 1
+                stub.data.pop(k, None)
+                stub.touch(k)
+            return n
+        if name == "PUBLISH":
+            subs = list(stub.subscribers.get(a[0], ()))
+            for handler in subs:
+                handler.send(Push([b"message", a[0], a[1]]))
+            return len(subs)
+        return Exception(f"unknown command {name}")
+
+
+def start_stub(port=0):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.stub = Stub()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,49 @@
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import smth
+
+REPLY_SECONDS = 0.5
+
+
+class FakeClient:
+    """chat.completions.create that takes REPLY_SECONDS, counting how many run at once"""
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+        self.running = 0
+        self.most = 0
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(REPLY_SECONDS)
+        with self.lock:
+            self.running -= 1
+        message = SimpleNamespace(content="I was at home all night.")
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=10)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage, model=kwargs["model"])
+
+
+def test_batch_takes_about_one_reply(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(smth.llm_dispatcher, "get_client", lambda: client)
+    monkeypatch.setattr(smth.llm_dispatcher.bucket, "rate", 0)  # Not what's being timed
+    session_id = smth.start_new_game()["session_id"]
+    characters = list(smth.session_store.get(session_id).scenario.characters)
+    assert len(characters) > 2 * smth.llm_dispatcher.session_concurrency
+
+    ctx = smth.prepare_batch(session_id, {"message": f"Where were you? {uuid.uuid4()}", "characters": characters})
+    started = time.perf_counter()
+    results = list(smth.run_batch(ctx))
+    elapsed = time.perf_counter() - started
+
+    assert all("response" in r for r in results)
+    # Every character at once: the session's own LLM_SESSION_CONCURRENCY would take three waves
+    assert client.most == len(characters)
+    assert elapsed < 2 * REPLY_SECONDS
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from cluster import Front, HashRing, Worker, WorkerError
+
+KEYS = [f"session-{n}" for n in range(5000)]
+
+
+def owners(ring):
+    return {key: ring.owner(key) for key in KEYS}
+
+
+def test_same_key_same_owner_in_any_ring_with_those_workers():
+    assert owners(HashRing([0, 1, 2])) == owners(HashRing([2, 0, 1]))
+    assert HashRing().owner("session-1") is None
+
+
+def test_adding_a_worker_only_moves_keys_to_it():
+    before = owners(HashRing([0, 1, 2]))
+    after = owners(HashRing([0, 1, 2, 3]))
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 3 for key in moved)
+    # About a quarter of the keys, not a reshuffle
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+
+
+def test_removing_a_worker_only_moves_its_keys():
+    ring = HashRing([0, 1, 2, 3])
+    before = owners(ring)
+    ring.remove(1)
+    after = owners(ring)
+    assert all(before[key] == 1 for key in KEYS if before[key] != after[key])
+    assert 1 not in after.values()
+
+
+def test_keys_spread_over_workers():
+    shares = Counter(owners(HashRing(range(4))).values())
+    assert all(0.15 < shares[worker] / len(KEYS) < 0.35 for worker in range(4))
+
+
+class FakeWorker(Worker):
+    """A worker's internal API over a dict; imports take a while, and can fail"""
+
+    def __init__(self, worker_id, sessions=(), fail=False):
+        super().__init__(worker_id, 0)
+        self.sessions = set(sessions)
+        self.fail = fail
+
+    def alive(self):
+        return True
+
+    def call(self, method, path, payload=None, timeout=30, check=True):
+        if path == "/internal/sessions":
+            return {"sessions": sorted(self.sessions)}
+        if path.endswith("/export"):
+            return {"sessions": [{"id": sid} for sid in payload["ids"] if sid in self.sessions]}
+        if path.endswith("/import"):
+            time.sleep(0.3)
+            if self.fail:
+                raise WorkerError("import failed")
+            self.sessions |= {data["id"] for data in payload["sessions"]}
+            return {"imported": len(payload["sessions"])}
+        if path.endswith("/release"):
+            self.sessions -= set(payload["ids"])
+            return {"released": len(payload["ids"])}
+
+
+def front_with(*workers):
+    front = Front(0, 0)
+    front.workers = {w.worker_id: w for w in workers}
+    front.ring = HashRing([workers[0].worker_id])
+    return front
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_new_game_a_move_would_relocate_waits_for_it(fail):
+    old, new = FakeWorker(0, KEYS[:50]), FakeWorker(1, fail=fail)
+    front = front_with(old, new)
+    next_ring = HashRing([0, 1])
+    mover = next(key for key in KEYS[50:] if next_ring.owner(key) == 1)
+    stayer = next(key for key in KEYS[50:] if next_ring.owner(key) == 0)
+
+    def rebalance():
+        try:
+            front.rebalance({0, 1})
+        except WorkerError:
+            pass
+    thread = threading.Thread(target=rebalance)
+    thread.start()
+    time.sleep(0.1)
+
+    assert front.acquire_new_game(stayer) is old  # Not moving, so not held
+    front.release_new_game(stayer)
+    worker = front.acquire_new_game(mover)
+    front.release_new_game(mover)
+    thread.join()
+    # Created on whichever worker owns it once the move has committed or rolled back
+    assert worker is (old if fail else new)
+    assert front.owner_for(mover) is worker
+    assert front.next_ring is None and not front.moving
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from dispatcher import AsyncLLMDispatcher, LLMDispatcher, TokenBucket, SHARED_USAGE
+
+
+def reply(text="reply"):
+    message = SimpleNamespace(content=text)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage={"prompt_tokens": 10, "completion_tokens": 2})
+
+
+class SlowClient:
+    """chat.completions.create that takes a while and counts its calls"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return reply()
+
+
+class SlowSyncClient(SlowClient):
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return reply()
+
+
+def test_token_bucket_spends_the_burst_then_paces():
+    bucket = TokenBucket(60, 2)  # One a second after the first two
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.9 < waits[2] <= 1.0
+    assert 1.9 < waits[3] <= 2.0
+    assert TokenBucket(0, 0).reserve() == 0.0
+
+
+def test_identical_calls_share_one_upstream_call():
+    client = SlowSyncClient()
+    dispatcher = LLMDispatcher(lambda: client, bucket=TokenBucket(0))
+    results = []
+
+    def ask():
+        results.append(dispatcher.complete("s", model="m", messages=[{"role": "user", "content": "Where were you?"}]))
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.calls == 1
+    assert dispatcher.stats["coalesced"] == 3
+    assert all(r.choices[0].message.content == "reply" for r in results)
+    # Only the caller that made the call is charged for it
+    assert sum(r.usage is SHARED_USAGE for r in results) == 3
+    assert dispatcher.in_flight == {}
+
+
+def test_other_sessions_are_not_coalesced():
+    client = SlowSyncClient(delay=0)
+    dispatcher = LLMDispatcher(lambda: client, bucket=TokenBucket(0))
+    for session_id in ("a", "b"):
+        dispatcher.complete(session_id, model="m", messages=[])
+    assert client.calls == 2
+
+
+def test_async_call_outlives_the_caller_that_started_it():
+    async def scenario():
+        client = SlowClient()
+        dispatcher = AsyncLLMDispatcher(lambda: client, bucket=TokenBucket(0))
+        first = asyncio.ensure_future(dispatcher.complete("s", model="m", messages=[]))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(dispatcher.complete("s", model="m", messages=[]))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        return client, dispatcher, result
+
+    client, dispatcher, result = asyncio.run(scenario())
+    assert client.calls == 1
+    assert dispatcher.stats["coalesced"] == 1
+    # The owner gave up, so the one that got the reply pays for it
+    assert result.usage is not SHARED_USAGE
+
+
+def test_cancel_during_rate_limit_wait_frees_both_slots():
+    async def scenario():
+        # No burst, so the first call waits a second for its rate token
+        dispatcher = AsyncLLMDispatcher(lambda: SlowClient(), max_concurrency=2, bucket=TokenBucket(60, 0))
+        call = asyncio.ensure_future(dispatcher.complete("s", model="m", messages=[]))
+        await asyncio.sleep(0.1)
+        assert dispatcher.slots._value == 1
+        call.cancel()
+        await asyncio.sleep(0.05)
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+    assert dispatcher.slots._value == 2
+    assert dispatcher.session_slots == {}
+    assert dispatcher.in_flight == {}
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Plays a few games with the event log on, snapshotting partway, and prints them
+WRITER = """
+import json, time
+import smth
+ids = [smth.start_new_game()["session_id"] for _ in range(3)]
+def ask(n):
+    for session_id in ids:
+        session = smth.session_store.get(session_id)
+        with session.lock:
+            session.add_message("Ishaan the Miller", f"Question {n}", f"Answer {n}")
+            smth.add_journal_entry(session, 1, "Ishaan the Miller", f"Clue {n}")
+            smth.session_store.save(session)
+for n in range(3):
+    ask(n)
+deadline = time.monotonic() + 5
+while not smth.event_log.stats["snapshots"] and time.monotonic() < deadline:
+    time.sleep(0.02)
+smth.event_log.snapshot_every = 10 ** 6
+for n in range(3, 5):
+    ask(n)  # Only in the segment after the snapshot
+smth.event_log.close()
+print(json.dumps({"snapshots": smth.event_log.stats["snapshots"], "sessions": DUMP}))
+"""
+
+# A fresh process: importing smth recovers the sessions from the log
+READER = """
+import json
+import smth
+print(json.dumps({"sessions": DUMP}))
+"""
+
+DUMP = """{
+    s.session_id: [[t.user, t.character] for t in s.get_character_history("Ishaan the Miller")] + [list(s.journal.entries)]
+    for s in smth.session_store.values()
+}"""
+
+
+def run(script, log_dir):
+    env = dict(os.environ, SESSION_STORE="memory", EVENT_LOG_DIR=str(log_dir), EVENT_LOG_FSYNC="0", EVENT_LOG_SNAPSHOT_EVERY="10")
+    child = subprocess.run(
+        [sys.executable, "-c", script.replace("DUMP", DUMP)], cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert child.returncode == 0, child.stdout + child.stderr
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def test_restart_recovers_snapshot_plus_later_events(tmp_path):
+    before = run(WRITER, tmp_path)
+    assert before["snapshots"] >= 1
+    # Segments and snapshots older than the newest snapshot were dropped
+    assert len(list(tmp_path.glob("snapshot-*.json"))) == 1
+    assert len(list(tmp_path.glob("events-*.log"))) == 1
+    assert max(tmp_path.glob("events-*.log")).stat().st_size > 0
+
+    after = run(READER, tmp_path)
+    assert after["sessions"] == before["sessions"]
+    for history in after["sessions"].values():
+        assert history[-1][-1] == "[Day 1] Ishaan the Miller: Clue 4"
+
+
+def test_torn_last_record_is_skipped(tmp_path):
+    before = run(WRITER, tmp_path)
+    newest = max(tmp_path.glob("events-*.log"))
+    with open(newest, "a") as f:
+        f.write('["msg", "half a rec')  # A crash mid-write
+    assert run(READER, tmp_path)["sessions"] == before["sessions"]
@@ -0,0 +1,60 @@
+import gzip
+import json
+
+import smth
+from http_cache import COMPRESS_MIN_BYTES
+
+
+def game_with_journal(entries):
+    session_id = smth.start_new_game()["session_id"]
+    session = smth.session_store.get(session_id)
+    with session.lock:
+        for n in range(entries):
+            smth.add_journal_entry(session, 1, "Ishaan the Miller", f"Clue {n}: " + "the mill wheel was turning at night " * 3)
+        smth.session_store.save(session)
+    return session_id
+
+
+def test_unchanged_journal_is_a_304_until_the_next_save():
+    client = smth.app.test_client()
+    session_id = game_with_journal(1)
+    first = client.get(f"/game/{session_id}/journal")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get(f"/game/{session_id}/journal", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+
+    session = smth.session_store.get(session_id)
+    with session.lock:
+        smth.add_journal_entry(session, 1, "Anya the Herbalist", "Heard a howl")
+        smth.session_store.save(session)
+    changed = client.get(f"/game/{session_id}/journal", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_etag_from_one_cursor_does_not_match_another():
+    client = smth.app.test_client()
+    session_id = game_with_journal(2)
+    etag = client.get(f"/game/{session_id}/journal").headers["ETag"]
+    later = client.get(f"/game/{session_id}/journal?since=1", headers={"If-None-Match": etag})
+    assert later.status_code == 200
+    assert len(later.json["entries"]) == 1
+    assert client.get(f"/game/{session_id}/journal?since=1", headers={"If-None-Match": later.headers["ETag"]}).status_code == 304
+
+
+def test_large_journal_is_gzipped_for_clients_that_accept_it():
+    client = smth.app.test_client()
+    session_id = game_with_journal(20)
+    plain = client.get(f"/game/{session_id}/journal")
+    assert len(plain.data) >= COMPRESS_MIN_BYTES and "Content-Encoding" not in plain.headers
+
+    packed = client.get(f"/game/{session_id}/journal", headers={"Accept-Encoding": "gzip"})
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in packed.headers["Vary"]
+    assert json.loads(gzip.decompress(packed.data)) == plain.json
+
+
+def test_unknown_session_is_not_cached():
+    response = smth.app.test_client().get("/game/no-such-game/journal")
+    assert response.status_code == 400 and "ETag" not in response.headers
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Seconds allowed for importing smth plus the first /game/new; see bench/import_time.py
+IMPORT_TIME_BUDGET = os.getenv("IMPORT_TIME_BUDGET", "0.5")
+
+
+def test_cold_start_stays_within_budget():
+    # The default in-memory store, as a fresh worker would start
+    env = dict(os.environ, SESSION_STORE="memory")
+    child = subprocess.run(
+        [sys.executable, "bench/import_time.py", "--runs", "3", "--budget", IMPORT_TIME_BUDGET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert child.returncode == 0, child.stdout + child.stderr
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench"))
+
+from loadtest import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    # Ten samples: p95 and p99 are the slowest one, p50 the fifth
+    ten = list(range(1, 11))
+    assert percentile(ten, 50) == 5
+    assert percentile(ten, 95) == 10
+    assert percentile(ten, 99) == 10
+    assert percentile([7], 50) == 7
+    assert percentile([], 99) == 0.0
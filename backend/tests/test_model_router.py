@@ -0,0 +1,88 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from dispatcher import StreamCancelled
+from model_router import AsyncModelRouter, ModelRouter
+
+HEDGE_AFTER = 0.05
+SLOW_SECONDS = 1.0
+
+
+def chunk(text, model):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None, model=model)
+
+
+class FakeDispatcher:
+    """stream() that is slow to start for "slow", fails for "broken" and is quick otherwise"""
+
+    def stream(self, session_id, model, messages, cancel=None, **kwargs):
+        if model == "broken":
+            raise ConnectionError("provider down")
+        if model == "slow":
+            deadline = time.monotonic() + SLOW_SECONDS
+            while time.monotonic() < deadline:
+                if cancel is not None and cancel.cancelled:
+                    raise StreamCancelled()
+                time.sleep(0.01)
+        yield chunk("At the ", model)
+        yield chunk("mill.", model)
+
+
+class FakeAsyncDispatcher:
+    async def stream(self, session_id, model, messages, **kwargs):
+        if model == "broken":
+            raise ConnectionError("provider down")
+        if model == "slow":
+            await asyncio.sleep(SLOW_SECONDS)
+        yield chunk("At the ", model)
+        yield chunk("mill.", model)
+
+
+def stats(router):
+    return {s["model"]: s for s in router.snapshot()}
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_slow_model_is_hedged_and_its_cancel_is_not_a_call():
+    router = ModelRouter(FakeDispatcher(), ["slow", "fast"], hedge_after=HEDGE_AFTER)
+    started = time.monotonic()
+    text, usage, model = router.complete("s", [])
+    assert (text, model) == ("At the mill.", "fast")
+    assert time.monotonic() - started < SLOW_SECONDS / 2
+
+    wait_for(lambda: stats(router)["slow"]["ttft"] is not None)
+    slow = stats(router)["slow"]
+    assert slow["ttft"] >= HEDGE_AFTER
+    assert (slow["calls"], slow["errors"], slow["error_rate"], slow["wins"]) == (0, 0, 0.0, 0)
+    assert stats(router)["fast"]["wins"] == 1
+    # The loser now ranks behind the winner
+    assert [s.name for s in router.ranked()] == ["fast", "slow"]
+
+
+def test_failing_model_is_replaced_at_once():
+    router = ModelRouter(FakeDispatcher(), ["broken", "fast"], hedge_after=SLOW_SECONDS)
+    started = time.monotonic()
+    assert router.complete("s", [])[0] == "At the mill."
+    assert time.monotonic() - started < SLOW_SECONDS / 2
+    assert stats(router)["broken"]["errors"] == 1
+
+
+def test_async_router_hedges_the_same_way():
+    router = AsyncModelRouter(FakeAsyncDispatcher(), ["slow", "fast"], hedge_after=HEDGE_AFTER)
+
+    async def scenario():
+        result = await router.complete("s", [])
+        await asyncio.sleep(0)  # Let the cancelled loser record itself
+        return result
+
+    text, usage, model = asyncio.run(scenario())
+    assert (text, model) == ("At the mill.", "fast")
+    slow = stats(router)["slow"]
+    assert slow["ttft"] >= HEDGE_AFTER
+    assert (slow["calls"], slow["error_rate"]) == (0, 0.0)
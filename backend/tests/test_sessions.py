@@ -0,0 +1,105 @@
+import threading
+import time
+
+import smth
+from sessions import MemorySessionStore, RedisSessionStore
+
+
+def second_worker(redis_url):
+    """Another process's store on the same Redis"""
+    return RedisSessionStore(smth.GameSession, redis_url)
+
+
+def wait_until(predicate, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_concurrent_saves_on_two_workers_keep_both_changes(redis_url):
+    first, second = smth.session_store, second_worker(redis_url)
+    session_id = smth.start_new_game()["session_id"]
+    mine, theirs = first.get(session_id), second.get(session_id)
+
+    with mine.lock:
+        mine.add_message("Ishaan the Miller", "Where were you?", "At the mill.")
+        first.save(mine)
+    # Loaded before that save, so this copy doesn't have it yet
+    with theirs.lock:
+        theirs.add_message("Anya the Herbalist", "Seen anything?", "Nothing.")
+        smth.add_journal_entry(theirs, 1, "Anya the Herbalist", "Saw nothing")
+        second.save(theirs)
+
+    latest = second_worker(redis_url).get(session_id)
+    assert set(latest.character_conversations) == {"Ishaan the Miller", "Anya the Herbalist"}
+    assert latest.journal.entries == ["[Day 1] Anya the Herbalist: Saw nothing"]
+    assert latest.version == 3
+
+
+def test_many_threads_on_two_workers_lose_nothing(redis_url):
+    stores = [smth.session_store, second_worker(redis_url)]
+    session_id = smth.start_new_game()["session_id"]
+
+    def ask(store, n):
+        session = store.get(session_id)
+        with session.lock:
+            session.add_message("Diya the Weaver", f"Question {n}", f"Answer {n}")
+            store.save(session)
+
+    threads = [threading.Thread(target=ask, args=(stores[n % 2], n)) for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    history = second_worker(redis_url).get(session_id).get_character_history("Diya the Weaver")
+    assert sorted(turn.user for turn in history) == sorted(f"Question {n}" for n in range(20))
+
+
+def test_version_and_save_time_are_known_on_every_worker(redis_url):
+    session_id = smth.start_new_game()["session_id"]
+    version, saved_at = second_worker(redis_url).version(session_id)
+    assert version == 1
+    assert saved_at is not None
+
+
+def test_journal_reader_wakes_when_another_worker_appends(redis_url):
+    first, second = smth.session_store, second_worker(redis_url)
+    session_id = smth.start_new_game()["session_id"]
+    reader = first.get(session_id)
+    assert wait_until(lambda: second.listener.is_alive())
+
+    woken = []
+    thread = threading.Thread(target=lambda: woken.append(reader.journal.wait_for(0, timeout=3)))
+    thread.start()
+    theirs = second.get(session_id)
+    with theirs.lock:
+        smth.add_journal_entry(theirs, 1, "Vikram the Hunter", "Heard howling")
+        second.save(theirs)
+    thread.join()
+
+    assert woken == [(["[Day 1] Vikram the Hunter: Heard howling"], 1)]
+
+
+def test_memory_store_survives_concurrent_gets_and_evictions():
+    store = MemorySessionStore(max_sessions=5, ttl=60)
+    errors = []
+
+    def churn(worker):
+        try:
+            for n in range(300):
+                session = smth.GameSession(f"{worker}-{n % 10}")
+                store.save(session)
+                store.get(f"{(worker + 1) % 4}-{n % 10}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=churn, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(store) <= 5
@@ -0,0 +1,35 @@
+from smth import JournalStreamParser, parse_llm_output
+
+
+def feed_all(pieces):
+    parser = JournalStreamParser()
+    shown = [parser.feed(piece) for piece in pieces]
+    rest, clue = parser.finish()
+    return shown, rest, clue
+
+
+def test_marker_split_across_chunks_never_reaches_the_player():
+    shown, rest, clue = feed_all(["I was at the well", " |", "||JOU", "RNAL: Saw", " him at the well"])
+    assert "|" not in "".join(shown) + rest
+    assert ("".join(shown) + rest).strip() == "I was at the well"
+    assert clue == "Saw him at the well"
+
+
+def test_reply_without_marker_is_all_speech():
+    shown, rest, clue = feed_all(["  Leave me ", "alone, ", "stranger.  "])
+    assert "".join(shown) + rest == "Leave me alone, stranger."
+    assert clue is None
+
+
+def test_lone_pipes_in_speech_are_held_then_shown():
+    parser = JournalStreamParser()
+    assert parser.feed("It was | ") == "It was"
+    assert parser.feed("no one") == " | no one"
+    assert parser.finish() == ("", None)
+
+
+def test_whole_reply_matches_streamed_reply():
+    raw = "Kabir owed me money. |||JOURNAL: Kabir owed Ishaan money."
+    assert parse_llm_output(raw) == ("Kabir owed me money.", "Kabir owed Ishaan money.")
+    shown, rest, clue = feed_all([raw[i:i + 4] for i in range(0, len(raw), 4)])
+    assert (("".join(shown) + rest).strip(), clue) == parse_llm_output(raw)
@@ -112,15 +112,27 @@ export function ConversationDialog() {
       charName = currentHouse[dayKey].npc.name
     }
 
-    // Call API with current day
-    const data = await gameApi.interrogate(sessionId, charName, userMsg, cycle)
+    // Call API with current day, showing the reply word by word as it streams in
+    let streamed = ''
+    const data = await gameApi.interrogateStream(sessionId, charName, userMsg, cycle, (text) => {
+      if (!streamed) {
+        setIsLoading(false)
+        setChatHistory(prev => [...prev, { sender: 'npc', text: '' }])
+      }
+      streamed += text
+      const partial = streamed
+      setChatHistory(prev => [...prev.slice(0, -1), { sender: 'npc', text: partial }])
+    })
 
-    setIsLoading(false)
     setIsLoading(false)
     if (data?.response) {
       const response = data.response
-      setChatHistory(prev => [...prev, { sender: 'npc', text: response }])
-    } else {
+      if (streamed) {
+        setChatHistory(prev => [...prev.slice(0, -1), { sender: 'npc', text: response }])
+      } else {
+        setChatHistory(prev => [...prev, { sender: 'npc', text: response }])
+      }
+    } else if (!streamed) {
       setChatHistory(prev => [...prev, { sender: 'system', text: "The spirits are silent..." }])
     }
   }
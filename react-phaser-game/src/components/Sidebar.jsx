@@ -1,29 +1,68 @@
 import React, { useEffect, useState } from 'react'
 import { useGameStore } from '../store/gameStore'
+import { gameApi } from '../services/api'
 import './Sidebar.css'
 
 export default function Sidebar() {
-    const { cycle } = useGameStore()
+    const { cycle, sessionId } = useGameStore()
     const [fileEntries, setFileEntries] = useState([])
 
-    // Poll the file-based journal
+    // Listen for new clues on this session's journal. The asyncio server pushes
+    // entries as they're found; the Flask server answers the stream with 204
+    // (an open stream would hold one of its few worker threads), and then, like
+    // browsers without EventSource, we poll.
     useEffect(() => {
-        const fetchJournal = async () => {
-            try {
-                const res = await fetch('https://a1vi.pythonanywhere.com/api/journal')
-                const data = await res.json()
-                if (data.entries) {
-                    setFileEntries(data.entries)
+        setFileEntries([])
+        if (!sessionId) return
+
+        const addEntries = (data) => {
+            if (data?.entries?.length) {
+                setFileEntries(prev => [...prev, ...data.entries])
+            }
+        }
+
+        let cursor = 0
+        let active = true
+        let source = null
+        const poll = async () => {
+            while (active) {
+                const started = Date.now()
+                // asgi.py holds this until there's news; Flask answers at once,
+                // usually a 304 from the ETag the browser sends back
+                const data = await gameApi.journal(sessionId, cursor, 25)
+                if (!active) break
+                addEntries(data)
+                if (data?.cursor !== undefined) cursor = data.cursor
+                if (!data?.entries?.length) {
+                    // Answered straight away with nothing new: poll every 2s, like before
+                    const left = 2000 - (Date.now() - started)
+                    if (left > 0) await new Promise(resolve => setTimeout(resolve, left))
                 }
-            } catch (e) {
-                // Silent fail
             }
         }
 
-        fetchJournal() // Initial
-        const interval = setInterval(fetchJournal, 2000) // Poll every 2s
-        return () => clearInterval(interval)
-    }, [])
+        if (window.EventSource) {
+            source = new EventSource(gameApi.journalStreamUrl(sessionId))
+            source.addEventListener('entries', (e) => {
+                const data = JSON.parse(e.data)
+                cursor = data.cursor
+                addEntries(data)
+            })
+            source.onerror = () => {
+                // CLOSED means the server won't push (Flask's 204); otherwise EventSource retries
+                if (source.readyState === EventSource.CLOSED && active) {
+                    source = null
+                    poll()
+                }
+            }
+        } else {
+            poll()
+        }
+        return () => {
+            active = false
+            source?.close()
+        }
+    }, [sessionId])
 
     // Hardcoded context for now
     const getContext = (day) => {
@@ -27,6 +27,46 @@ export const gameApi = {
         }
     },
 
+    // Interrogate character, streaming the reply as it is spoken.
+    // onToken is called with each new piece of speech; resolves with the final payload.
+    interrogateStream: async (sessionId, character, message, day, onToken) => {
+        try {
+            const res = await fetch(`${API_BASE}/api/interrogate`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify({ session_id: sessionId, character, message, day, stream: true })
+            })
+            const reader = res.body.getReader()
+            const decoder = new TextDecoder()
+            let buffer = ''
+            let result = null
+
+            while (true) {
+                const { done, value } = await reader.read()
+                if (done) break
+                buffer += decoder.decode(value, { stream: true })
+
+                // SSE events are separated by a blank line
+                let boundary
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const raw = buffer.slice(0, boundary)
+                    buffer = buffer.slice(boundary + 2)
+                    const event = raw.match(/^event: (.*)$/m)?.[1]
+                    const data = raw.match(/^data: (.*)$/m)?.[1]
+                    if (!event || !data) continue
+
+                    const payload = JSON.parse(data)
+                    if (event === 'token') onToken?.(payload.text)
+                    if (event === 'done') result = payload
+                }
+            }
+            return result
+        } catch (err) {
+            console.error('API Error:', err)
+            return { response: "The wind howls... (Connection Error)" }
+        }
+    },
+
     // Advance day (sync with backend)
     advanceDay: async (sessionId) => {
         try {
@@ -37,6 +77,21 @@ export const gameApi = {
         }
     },
 
+    // Journal entries for this session after the given cursor.
+    // With wait > 0 the server holds the request until a new entry arrives.
+    journal: async (sessionId, since = 0, wait = 0) => {
+        try {
+            const res = await fetch(`${API_BASE}/api/game/${sessionId}/journal?since=${since}&wait=${wait}`)
+            return await res.json()
+        } catch (err) {
+            // Silent fail, we'll try again on the next poll
+            return null
+        }
+    },
+
+    // Server-Sent Events URL that pushes new journal entries
+    journalStreamUrl: (sessionId) => `${API_BASE}/api/game/${sessionId}/journal/stream`,
+
     // Eliminate suspect
     eliminate: async (sessionId, character) => {
         try {